@@ -1,6 +1,13 @@
+from pathlib import Path
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Individual, Employee, NSIDataImportStatus
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import Individual, Employee, NSIDataImportStatus, NSIImportLock, PerformanceMetric
+from .models import ProfilingRequest, CalculationProfile
+from .models import PipelineInstance, PipelineNodeResult
 
 
 def group(user):
@@ -26,9 +33,77 @@ class EmployeeModelAdmin(admin.ModelAdmin):
 
 
 class NSIDataImportStatusModelAdmin(admin.ModelAdmin):
-    list_display = ['created_timestamp', 'user', 'is_pending']
+    list_display = ['created_timestamp', 'user', 'is_pending', 'phase', 'records_processed', 'rate',
+                    'finished_timestamp']
+
+
+class NSIImportLockModelAdmin(admin.ModelAdmin):
+    list_display = ['owner', 'acquired_timestamp', 'expires_timestamp']
+
+
+class PerformanceMetricModelAdmin(admin.ModelAdmin):
+    list_display = ['name', 'key', 'calls_count', 'total_duration', 'max_duration', 'total_queries',
+                    'unit_duration_ewma', 'updated_timestamp']
+    list_filter = ['name']
+
+
+class ProfilingRequestModelAdmin(admin.ModelAdmin):
+    list_display = ['created_timestamp', 'math_model_id', 'user', 'profiler', 'remaining_count']
+
+
+class CalculationProfileModelAdmin(admin.ModelAdmin):
+    list_display = ['created_timestamp', 'math_model_id', 'user', 'profiler', 'duration',
+                    'pstats_file', 'collapsed_file']
+    list_filter = ['math_model_id', 'profiler']
+
+    def get_urls(self):
+        return [
+            path('<int:profile_id>/download/<str:file_kind>/',
+                 self.admin_site.admin_view(self.download_view), name='core_calculationprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, profile_id, file_kind):
+        if not self.has_view_permission(request):
+            raise Http404
+        profile = get_object_or_404(CalculationProfile, pk=profile_id)
+        file_path = {'pstats': profile.pstats_path, 'collapsed': profile.collapsed_path}.get(file_kind)
+        if not file_path or not Path(file_path).is_file():
+            raise Http404
+        return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=Path(file_path).name)
+
+    def file_link(self, profile, file_kind, file_path):
+        if not file_path:
+            return '-'
+        url = reverse('admin:core_calculationprofile_download', args=(profile.pk, file_kind))
+        return format_html('<a href="{}">{}</a>', url, Path(file_path).name)
+
+    def pstats_file(self, profile):
+        return self.file_link(profile, 'pstats', profile.pstats_path)
+
+    def collapsed_file(self, profile):
+        return self.file_link(profile, 'collapsed', profile.collapsed_path)
+
+    pstats_file.short_description = 'pstats'
+    collapsed_file.short_description = 'Collapsed stacks'
+
+
+class PipelineInstanceModelAdmin(admin.ModelAdmin):
+    list_display = ['pipeline_id', 'user', 'is_ready', 'is_processing', 'updated_timestamp']
+    list_filter = ['pipeline_id']
+
+
+class PipelineNodeResultModelAdmin(admin.ModelAdmin):
+    list_display = ['input_hash', 'math_model_id', 'hits_count', 'created_timestamp', 'used_timestamp']
+    list_filter = ['math_model_id']
+    exclude = ['output_data']
 
 
 admin.site.register(Individual, IndividualModelAdmin)
 admin.site.register(Employee, EmployeeModelAdmin)
 admin.site.register(NSIDataImportStatus, NSIDataImportStatusModelAdmin)
+admin.site.register(NSIImportLock, NSIImportLockModelAdmin)
+admin.site.register(PerformanceMetric, PerformanceMetricModelAdmin)
+admin.site.register(ProfilingRequest, ProfilingRequestModelAdmin)
+admin.site.register(CalculationProfile, CalculationProfileModelAdmin)
+admin.site.register(PipelineInstance, PipelineInstanceModelAdmin)
+admin.site.register(PipelineNodeResult, PipelineNodeResultModelAdmin)
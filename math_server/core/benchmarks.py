@@ -0,0 +1,255 @@
+# coding: utf-8
+import json
+import platform
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from .models import Notification
+from .models import WellProductionModel
+from .nsi_data_import import import_nsi_data_from_xml
+
+
+RANDOM_SEED = 20220210
+
+SCALES = {
+    'quick': {
+        'niz_table_rows': [12, 120, 1200],
+        'nsi_records': [1000],
+        'notifications': [10000],
+    },
+    'full': {
+        'niz_table_rows': [12, 120, 1200, 12000],
+        'nsi_records': [1000, 10000, 100000, 1000000],
+        'notifications': [10000, 1000000, 3000000],
+    },
+}
+
+XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+PERSON_NS = 'http://replication-message-person.org'
+EMPLOYEE_NS = 'http://replication-message-employee.org'
+
+BenchmarkResult = Tuple[str, Dict[str, float]]
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """
+    Выполняет функцию repeat раз и возвращает статистику длительности выполнения, сек
+    """
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return {
+        'min': min(durations),
+        'median': statistics.median(durations),
+        'mean': statistics.mean(durations),
+        'repeat': repeat,
+    }
+
+
+def generate_niz_table(rows_count: int, rnd: random.Random) -> List[list]:
+    """
+    Генерирует таблицу "Отбор от НИЗ / Обводненность" с помесячными датами и монотонными значениями
+    """
+    table = []
+    current_date = date(2000, 1, 1)
+    niz_share = 0.0
+    water_cut = 0.0
+    for _ in range(rows_count):
+        niz_share = min(niz_share + rnd.uniform(0, 2.0 / rows_count), 1.0)
+        water_cut = min(water_cut + rnd.uniform(0, 1.5 / rows_count), 0.99)
+        table.append([datetime(current_date.year, current_date.month, 1).isoformat(),
+                      f'{niz_share:.6f}', f'{water_cut:.6f}'])
+        current_date = (current_date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return table
+
+
+def generate_well_production_input(rows_count: int, rnd: random.Random) -> dict:
+    return {
+        'niz_table': generate_niz_table(rows_count, rnd),
+        'kin': '0.35',
+        'debit': '120.5',
+        'total': '2500000',
+        'referent_models': [],
+    }
+
+
+def generate_nsi_xml(file_path: Path, records_count: int, rnd: random.Random) -> None:
+    """
+    Генерирует xml-выгрузку НСИ: половина записей - физические лица, половина - сотрудники,
+    ссылающиеся на физических лиц. Файл записывается потоково
+    """
+    individuals_count = max(records_count // 2, 1)
+    with file_path.open('w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write(f'<ПереченьЗаписей xmlns:xsi="{XSI_NS}" xmlns="http://replication-messages.org">\n')
+        for i in range(individuals_count):
+            birth_date = date(1960, 1, 1) + timedelta(days=rnd.randrange(15000))
+            f.write(
+                f'<Запись xmlns:d2p1="{PERSON_NS}" xsi:type="d2p1:ФизическоеЛицо">'
+                f'<d2p1:ИдентификаторВБазе>individual-{i}</d2p1:ИдентификаторВБазе>'
+                f'<d2p1:ПометкаУдаления>false</d2p1:ПометкаУдаления>'
+                f'<d2p1:Имя>Имя{i}</d2p1:Имя>'
+                f'<d2p1:Фамилия>Фамилия{i}</d2p1:Фамилия>'
+                f'<d2p1:Отчество>Отчество{i}</d2p1:Отчество>'
+                f'<d2p1:ДатаРождения>{birth_date}</d2p1:ДатаРождения>'
+                f'<d2p1:ИНН>{rnd.randrange(10 ** 11, 10 ** 12)}</d2p1:ИНН>'
+                f'<d2p1:СНИЛС>{rnd.randrange(10 ** 10, 10 ** 11)}</d2p1:СНИЛС>'
+                f'<d2p1:Код>{i:08d}</d2p1:Код>'
+                f'</Запись>\n')
+        for i in range(records_count - individuals_count):
+            employment_date = date(2000, 1, 1) + timedelta(days=rnd.randrange(7000))
+            f.write(
+                f'<Запись xmlns:d2p1="{EMPLOYEE_NS}" xsi:type="d2p1:Сотрудник">'
+                f'<d2p1:ИдентификаторВБазе>employee-{i}</d2p1:ИдентификаторВБазе>'
+                f'<d2p1:ПометкаУдаления>false</d2p1:ПометкаУдаления>'
+                f'<d2p1:ФизическоеЛицо><d2p1:ИдентификаторВБазе>individual-{i % individuals_count}'
+                f'</d2p1:ИдентификаторВБазе></d2p1:ФизическоеЛицо>'
+                f'<d2p1:ТабельныйНомер>{i:06d}</d2p1:ТабельныйНомер>'
+                f'<d2p1:Наименование>Сотрудник {i}</d2p1:Наименование>'
+                f'<d2p1:ДатаПриемаНаРаботу>{employment_date}</d2p1:ДатаПриемаНаРаботу>'
+                f'<d2p1:ДатаУвольнения>{employment_date + timedelta(days=3650)}</d2p1:ДатаУвольнения>'
+                f'<d2p1:ОсновноеМестоРаботы>true</d2p1:ОсновноеМестоРаботы>'
+                f'<d2p1:Код>{i:08d}</d2p1:Код>'
+                f'</Запись>\n')
+        f.write('</ПереченьЗаписей>')
+
+
+def generate_notifications(user, notifications_count: int, rnd: random.Random, batch_size: int = 10000) -> None:
+    """
+    Заполняет таблицу уведомлений пользователя пакетной вставкой
+    """
+    created = 0
+    while created < notifications_count:
+        batch = [Notification(user=user, math_model_id='wellproductionmodel', is_success=rnd.random() > 0.1,
+                              description='Прогнозирование добычи: операция завершена успешно',
+                              is_acknowledged=rnd.random() > 0.01)
+                 for _ in range(min(batch_size, notifications_count - created))]
+        Notification.objects.bulk_create(batch, batch_size=batch_size)
+        created += len(batch)
+
+
+def get_benchmark_user(username: str = 'benchmark'):
+    user, _ = get_user_model().objects.get_or_create(username=username)
+    user.user_permissions.set(Permission.objects.filter(
+        codename__in=['view_wellproductionmodel', 'change_wellproductionmodel']))
+    return user
+
+
+def bench_well_production_calculate(scale: dict, repeat: int) -> Iterator[BenchmarkResult]:
+    rnd = random.Random(RANDOM_SEED)
+    for rows_count in scale['niz_table_rows']:
+        model_instance = WellProductionModel(input_data=generate_well_production_input(rows_count, rnd))
+        yield f'WellProductionModel.calculate[niz_table={rows_count}]', measure(model_instance.calculate, repeat)
+
+
+def bench_import_nsi_data_from_xml(scale: dict, repeat: int) -> Iterator[BenchmarkResult]:
+    rnd = random.Random(RANDOM_SEED)
+    for records_count in scale['nsi_records']:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            xml_file_path = Path(temp_dir) / 'Message_000_008.xml'
+            generate_nsi_xml(xml_file_path, records_count, rnd)
+            with override_settings(NSI_EXPORTED_DATA_FILE_PATH=xml_file_path,
+                                   NSI_ACK_FILE_PATH=Path(temp_dir) / 'Message_008_000.xml'):
+                yield f'import_nsi_data_from_xml[records={records_count}]', measure(import_nsi_data_from_xml, repeat)
+
+
+def bench_notification_api(scale: dict, repeat: int) -> Iterator[BenchmarkResult]:
+    rnd = random.Random(RANDOM_SEED)
+    user = get_benchmark_user()
+    client = Client()
+    client.force_login(user)
+    generated_count = 0
+    for notifications_count in scale['notifications']:
+        generate_notifications(user, notifications_count - generated_count, rnd)
+        generated_count = notifications_count
+        yield (f'NotificationAPIView.get[new/3, notifications={notifications_count}]',
+               measure(lambda: client.get('/api/notification/new/3'), repeat))
+        yield (f'NotificationAPIView.put[notifications={notifications_count}]',
+               measure(lambda: client.put('/api/notification', json.dumps([1, 2, 3]),
+                                          content_type='application/json'), repeat))
+
+
+def bench_math_model_api(scale: dict, repeat: int) -> Iterator[BenchmarkResult]:
+    rnd = random.Random(RANDOM_SEED)
+    user = get_benchmark_user()
+    client = Client()
+    client.force_login(user)
+    yield 'MathModelAPIView.get[list]', measure(lambda: client.get('/api/math_model'), repeat)
+    client.get('/api/math_model/wellproductionmodel')
+    for rows_count in scale['niz_table_rows']:
+        request_body = json.dumps(generate_well_production_input(rows_count, rnd))
+        put = (lambda: client.put('/api/math_model/wellproductionmodel', request_body,
+                                  content_type='application/json'))
+        yield f'MathModelAPIView.put[wellproductionmodel, niz_table={rows_count}]', measure(put, repeat)
+        yield (f'MathModelAPIView.get[wellproductionmodel, niz_table={rows_count}]',
+               measure(lambda: client.get('/api/math_model/wellproductionmodel'), repeat))
+
+
+BENCHMARKS = {
+    'calculate': bench_well_production_calculate,
+    'nsi_import': bench_import_nsi_data_from_xml,
+    'notification_api': bench_notification_api,
+    'math_model_api': bench_math_model_api,
+}
+
+
+def run_benchmarks(scale_name: str, repeat: int, selected: Optional[List[str]] = None,
+                   log: Callable[[str], None] = print) -> dict:
+    """
+    Выполняет бенчмарки и возвращает результаты в виде, пригодном для сохранения в json
+    """
+    scale = SCALES[scale_name]
+    results = {}
+    for benchmark_name, benchmark in BENCHMARKS.items():
+        if selected and benchmark_name not in selected:
+            continue
+        for case_name, stats in benchmark(scale, repeat):
+            log(f'{case_name}: median {stats["median"] * 1000:.2f} ms, min {stats["min"] * 1000:.2f} ms')
+            results[case_name] = stats
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'platform': platform.platform(),
+            'timestamp': datetime.now().isoformat(),
+            'scale': scale_name,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Сравнивает медианы длительностей с базовыми значениями
+    :param threshold: допустимое относительное замедление, например 0.2 - на 20%. Для отдельных бенчмарков
+    порог может быть переопределен в разделе "thresholds" файла базовых значений
+    :return: список описаний выявленных регрессий
+    """
+    regressions = []
+    thresholds = baseline.get('thresholds', {})
+    for case_name, stats in results['results'].items():
+        baseline_stats = baseline.get('results', {}).get(case_name)
+        if not baseline_stats or not baseline_stats.get('median'):
+            continue
+        ratio = stats['median'] / baseline_stats['median']
+        case_threshold = thresholds.get(case_name, threshold)
+        if ratio > 1 + case_threshold:
+            regressions.append(f'{case_name}: {baseline_stats["median"] * 1000:.2f} ms -> '
+                               f'{stats["median"] * 1000:.2f} ms (+{(ratio - 1) * 100:.0f}%, '
+                               f'порог {case_threshold * 100:.0f}%)')
+    return regressions
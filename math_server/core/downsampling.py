@@ -0,0 +1,72 @@
+# coding: utf-8
+from typing import Any, List, Optional, Sequence
+
+
+def to_float(value: Any) -> Optional[float]:
+    if value is None or value == '' or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def lttb_indices(values: Sequence[Any], threshold: int) -> List[int]:
+    """
+    Выбирает точки ряда алгоритмом Largest-Triangle-Three-Buckets: ряд делится на threshold - 2 корзины,
+    из каждой корзины берется точка, образующая треугольник наибольшей площади с точкой, выбранной в предыдущей
+    корзине, и средней точкой следующей корзины. Первая и последняя точки сохраняются. Абсцисса точки - ее индекс,
+    пустые значения пропускаются
+    :return: индексы выбранных точек в порядке возрастания
+    """
+    points = [(index, y) for index, y in ((index, to_float(value)) for index, value in enumerate(values))
+              if y is not None]
+    count = len(points)
+    if threshold >= count or count <= 2:
+        return [index for index, _ in points]
+    if threshold < 3:
+        return [points[0][0], points[-1][0]]
+
+    bucket_size = (count - 2) / (threshold - 2)
+    selected = [points[0][0]]
+    a_x, a_y = points[0]
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        if bucket == threshold - 3:
+            next_start, next_end = count - 1, count
+        next_count = next_end - next_start
+        avg_x = sum(points[i][0] for i in range(next_start, next_end)) / next_count
+        avg_y = sum(points[i][1] for i in range(next_start, next_end)) / next_count
+
+        max_area = -1.0
+        max_point = points[start]
+        for i in range(start, end):
+            x, y = points[i]
+            # Удвоенная площадь треугольника, для сравнения множитель не важен
+            area = abs((a_x - avg_x) * (y - a_y) - (a_x - x) * (avg_y - a_y))
+            if area > max_area:
+                max_area = area
+                max_point = points[i]
+        selected.append(max_point[0])
+        a_x, a_y = max_point
+    selected.append(points[-1][0])
+    return selected
+
+
+def downsample_series(series: Sequence[Sequence[Any]], threshold: int) -> List[int]:
+    """
+    Прореживает несколько рядов с общей осью абсцисс. На каждый ряд приходится threshold / len(series) точек,
+    но не менее трех; точки рядов выбираются независимо, в результат входит объединение выбранных индексов
+    :return: индексы точек в порядке возрастания
+    """
+    if not series:
+        return []
+    per_series = max(threshold // len(series), 3)
+    indices = set()
+    for values in series:
+        indices.update(lttb_indices(values, per_series))
+    return sorted(indices)
@@ -0,0 +1,94 @@
+# coding: utf-8
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, List, Tuple
+from django.conf import settings
+from django.http import StreamingHttpResponse
+import dateutil.parser
+
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class ExportFormatError(ValueError):
+    pass
+
+
+class EchoBuffer(object):
+    """
+    Псевдо-файл для csv.writer, возвращающий записанную строку вместо ее буферизации
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def format_value(value: Any, column_type: str) -> Any:
+    """
+    Приводит значение ячейки таблицы результатов к формату экспорта
+    :param value: значение ячейки
+    :param column_type: тип столбца: date, decimal, либо любой другой тип для выгрузки значения без изменений
+    """
+    if value is None or value == '':
+        return ''
+    if column_type == 'date':
+        if not isinstance(value, (date, datetime)):
+            value = dateutil.parser.isoparse(value)
+        return value.strftime(settings.CUSTOM_DATETIME_FORMAT)
+    if column_type == 'decimal':
+        if not isinstance(value, Decimal):
+            value = Decimal(str(value))
+        return format(value, 'f')
+    return value
+
+
+def iter_formatted_rows(columns: List[Tuple[str, str]], rows: Iterable[list]) -> Iterator[list]:
+    """
+    Построчно приводит таблицу результатов к формату экспорта
+    """
+    column_types = [column_type for _, column_type in columns]
+    for row in rows:
+        yield [format_value(value, column_type) for value, column_type in zip(row, column_types)]
+
+
+def iter_csv(columns: List[Tuple[str, str]], rows: Iterable[list]) -> Iterator[str]:
+    """
+    Построчно формирует CSV с заголовком из наименований столбцов
+    """
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow([title for title, _ in columns])
+    for row in iter_formatted_rows(columns, rows):
+        yield writer.writerow(row)
+
+
+def iter_ndjson(columns: List[Tuple[str, str]], rows: Iterable[list]) -> Iterator[str]:
+    """
+    Построчно формирует NDJSON, каждая строка таблицы - объект с ключами из наименований столбцов
+    """
+    titles = [title for title, _ in columns]
+    for row in iter_formatted_rows(columns, rows):
+        yield json.dumps(dict(zip(titles, row)), ensure_ascii=False) + '\n'
+
+
+def streaming_export_response(columns: List[Tuple[str, str]], rows: Iterable[list], export_format: str,
+                              file_name: str) -> StreamingHttpResponse:
+    """
+    Возвращает потоковый HTTP-ответ с таблицей результатов в формате csv или ndjson
+    :raises ExportFormatError: в случае неподдерживаемого формата
+    """
+    if export_format == 'csv':
+        content = iter_csv(columns, rows)
+    elif export_format == 'ndjson':
+        content = iter_ndjson(columns, rows)
+    else:
+        raise ExportFormatError(f'Формат экспорта "{export_format}" не поддерживается')
+
+    response = StreamingHttpResponse((line.encode('utf-8') for line in content),
+                                     content_type=EXPORT_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{file_name}.{export_format}"'
+    return response
@@ -0,0 +1,269 @@
+# coding: utf-8
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import dateutil.parser
+from django.conf import settings
+from django.utils import timezone
+
+
+class InputSchemaError(ValueError):
+    """
+    Входные данные не соответствуют схеме. Текст исключения выводится пользователю
+    """
+    pass
+
+
+def is_empty(value: Any) -> bool:
+    return value is None or value == '' or value == []
+
+
+class Field(object):
+    """
+    Поле схемы входных данных. compile() возвращает функцию, приводящую значение поля к типу,
+    либо выбрасывающую InputSchemaError
+    """
+
+    def __init__(self, label: str, required: bool = True, required_message: Optional[str] = None) -> None:
+        self.label = label
+        self.required = required
+        self.required_message = required_message or f'Не указано значение “{label}”'
+
+    def invalid(self, reason: str = 'некорректное значение') -> InputSchemaError:
+        return InputSchemaError(f'“{self.label}”: {reason}')
+
+    def compile_converter(self) -> Callable[[Any], Any]:
+        raise NotImplementedError
+
+    def compile(self) -> Callable[[Any], Any]:
+        convert = self.compile_converter()
+        required = self.required
+        required_message = self.required_message
+
+        def parse(value: Any) -> Any:
+            if is_empty(value):
+                if required:
+                    raise InputSchemaError(required_message)
+                return None
+            return convert(value)
+
+        return parse
+
+
+class DecimalField(Field):
+    """
+    Число, приводится к Decimal. min_value и max_value - границы допустимого диапазона включительно,
+    positive - значение должно быть больше нуля
+    """
+
+    def __init__(self, label: str, min_value: Optional[Decimal] = None, max_value: Optional[Decimal] = None,
+                 positive: bool = False, **kwargs) -> None:
+        super().__init__(label, **kwargs)
+        self.min_value = None if min_value is None else Decimal(min_value)
+        self.max_value = None if max_value is None else Decimal(max_value)
+        self.positive = positive
+
+    def compile_converter(self) -> Callable[[Any], Decimal]:
+        min_value, max_value, positive = self.min_value, self.max_value, self.positive
+        invalid = self.invalid
+
+        def convert(value: Any) -> Decimal:
+            if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+                raise invalid('ожидается число')
+            try:
+                result = Decimal(value)
+            except (InvalidOperation, ValueError):
+                raise invalid('ожидается число')
+            if not result.is_finite():
+                raise invalid('ожидается число')
+            if positive and result <= 0:
+                raise invalid('значение должно быть больше нуля')
+            if min_value is not None and result < min_value:
+                raise invalid(f'значение должно быть не меньше {min_value}')
+            if max_value is not None and result > max_value:
+                raise invalid(f'значение должно быть не больше {max_value}')
+            return result
+
+        return convert
+
+
+class IntegerField(Field):
+    """
+    Целое число в диапазоне [min_value, max_value]
+    """
+
+    def __init__(self, label: str, min_value: Optional[int] = None, max_value: Optional[int] = None,
+                 **kwargs) -> None:
+        super().__init__(label, **kwargs)
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def compile_converter(self) -> Callable[[Any], int]:
+        min_value, max_value = self.min_value, self.max_value
+        invalid = self.invalid
+
+        def convert(value: Any) -> int:
+            if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+                raise invalid('ожидается целое число')
+            try:
+                number = Decimal(value)
+            except (InvalidOperation, ValueError):
+                raise invalid('ожидается целое число')
+            if not number.is_finite() or number != number.to_integral_value():
+                raise invalid('ожидается целое число')
+            result = int(number)
+            if min_value is not None and result < min_value:
+                raise invalid(f'значение должно быть не меньше {min_value}')
+            if max_value is not None and result > max_value:
+                raise invalid(f'значение должно быть не больше {max_value}')
+            return result
+
+        return convert
+
+
+def normalize_datetime(value: datetime) -> datetime:
+    """
+    Приводит дату к виду, принятому в приложении: при USE_TZ дата без часового пояса считается датой
+    в часовом поясе приложения, иначе дата с часовым поясом переводится в локальное время. Даты одного вида
+    можно сравнивать между собой
+    """
+    if settings.USE_TZ:
+        return timezone.make_aware(value, is_dst=False) if timezone.is_naive(value) else value
+    return timezone.make_naive(value) if timezone.is_aware(value) else value
+
+
+class DateField(Field):
+    """
+    Дата и время в формате ISO 8601, приводится к datetime с часовым поясом (см. normalize_datetime)
+    """
+
+    def compile_converter(self) -> Callable[[Any], datetime]:
+        invalid = self.invalid
+
+        def convert(value: Any) -> datetime:
+            if isinstance(value, datetime):
+                return normalize_datetime(value)
+            if not isinstance(value, str):
+                raise invalid('ожидается дата')
+            try:
+                return normalize_datetime(dateutil.parser.isoparse(value))
+            except (ValueError, OverflowError):
+                raise invalid('ожидается дата в формате ISO 8601')
+
+        return convert
+
+
+class ChoiceField(Field):
+    """
+    Значение из заданного набора
+    """
+
+    def __init__(self, label: str, choices: Sequence[Any], **kwargs) -> None:
+        super().__init__(label, **kwargs)
+        self.choices = frozenset(choices)
+
+    def compile_converter(self) -> Callable[[Any], Any]:
+        choices = self.choices
+        invalid = self.invalid
+
+        def convert(value: Any) -> Any:
+            if not isinstance(value, str) or value not in choices:
+                raise invalid('значение не поддерживается')
+            return value
+
+        return convert
+
+
+class TableField(Field):
+    """
+    Таблица - список строк фиксированной длины, значения столбцов которых приводятся к типам полей columns.
+    Столбцы с индексами из increasing_columns должны строго возрастать сверху вниз
+    """
+
+    def __init__(self, label: str, columns: Sequence[Field], min_rows: int = 1, max_rows: Optional[int] = None,
+                 increasing_columns: Sequence[int] = (), **kwargs) -> None:
+        kwargs.setdefault('required_message', f'Не заполнена таблица “{label}”')
+        super().__init__(label, **kwargs)
+        self.columns = list(columns)
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.increasing_columns = tuple(increasing_columns)
+
+    def compile_converter(self) -> Callable[[Any], List[list]]:
+        label = self.label
+        invalid = self.invalid
+        min_rows, max_rows = self.min_rows, self.max_rows
+        increasing_columns = self.increasing_columns
+        columns_count = len(self.columns)
+        parsers = [column.compile() for column in self.columns]
+        column_labels = [column.label for column in self.columns]
+
+        def convert(value: Any) -> List[list]:
+            if not isinstance(value, list):
+                raise invalid('ожидается таблица')
+            rows_count = len(value)
+            if rows_count < min_rows:
+                raise invalid(f'количество строк должно быть не меньше {min_rows}')
+            if max_rows is not None and rows_count > max_rows:
+                raise invalid(f'количество строк должно быть не больше {max_rows}')
+
+            result = []
+            previous: Optional[list] = None
+            for row_number, row in enumerate(value, 1):
+                if not isinstance(row, (list, tuple)) or len(row) != columns_count:
+                    raise InputSchemaError(f'Таблица “{label}”, строка {row_number}: ожидается {columns_count} '
+                                           f'столбца(ов)')
+                try:
+                    parsed_row = [parse(cell) for parse, cell in zip(parsers, row)]
+                except InputSchemaError as e:
+                    raise InputSchemaError(f'Таблица “{label}”, строка {row_number}. {e}')
+                if previous is not None:
+                    for index in increasing_columns:
+                        if parsed_row[index] is None or previous[index] is None:
+                            continue
+                        try:
+                            is_increasing = parsed_row[index] > previous[index]
+                        except TypeError:
+                            raise InputSchemaError(f'Таблица “{label}”, строка {row_number}: значения столбца '
+                                                   f'“{column_labels[index]}” несравнимы')
+                        if not is_increasing:
+                            raise InputSchemaError(f'Таблица “{label}”, строка {row_number}: значения столбца '
+                                                   f'“{column_labels[index]}” должны возрастать')
+                result.append(parsed_row)
+                previous = parsed_row
+            return result
+
+        return convert
+
+
+class InputSchema(object):
+    """
+    Схема входных данных математической модели. Схема компилируется в функцию разбора однократно,
+    при первом обращении; результат разбора - словарь значений, приведенных к типам полей
+    """
+
+    empty_message = 'Отсутствуют входные данные для алгоритма'
+
+    def __init__(self, **fields: Field) -> None:
+        self.fields = fields
+        self._parser: Optional[Callable[[Any], Dict[str, Any]]] = None
+
+    def compile(self) -> Callable[[Any], Dict[str, Any]]:
+        if self._parser is not None:
+            return self._parser
+
+        parsers: List[Tuple[str, Callable[[Any], Any]]] = [
+            (name, field.compile()) for name, field in self.fields.items()]
+        empty_message = self.empty_message
+
+        def parse(input_data: Any) -> Dict[str, Any]:
+            if not input_data or not isinstance(input_data, dict):
+                raise InputSchemaError(empty_message)
+            get = input_data.get
+            return {name: parse_field(get(name)) for name, parse_field in parsers}
+
+        self._parser = parse
+        return parse
+
+    def parse(self, input_data: Any) -> Dict[str, Any]:
+        return self.compile()(input_data)
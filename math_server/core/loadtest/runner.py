@@ -0,0 +1,238 @@
+# coding: utf-8
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+from core.benchmarks import generate_well_production_input
+
+
+SCENARIOS_DIR = Path(__file__).resolve().parent / 'scenarios'
+
+CSRF_TOKEN_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+BODY_GENERATORS = {
+    'well_production_input': lambda rnd, rows=120: generate_well_production_input(rows, rnd),
+    'calculator_input': lambda rnd: {'val1': rnd.randint(1, 100), 'val2': rnd.randint(1, 100),
+                                     'op': rnd.choice(['add', 'sub', 'mul', 'div'])},
+}
+
+
+class LoadTestError(RuntimeError):
+    pass
+
+
+class NoRedirectHandler(HTTPRedirectHandler):
+    """
+    Отключает следование перенаправлениям, чтобы ответ формы входа можно было проверить
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def load_scenario(scenario: str) -> dict:
+    """
+    Загружает сценарий по имени из каталога сценариев, либо по пути к json-файлу
+    """
+    scenario_path = Path(scenario)
+    if not scenario_path.is_file():
+        scenario_path = SCENARIOS_DIR / f'{scenario}.json'
+    try:
+        return json.loads(scenario_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError) as e:
+        raise LoadTestError(f'Невозможно загрузить сценарий "{scenario}": {e}')
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """
+    Перцентиль методом ближайшего ранга
+    """
+    if not sorted_values:
+        return 0.0
+    index = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class LoadTestStatistics(object):
+    """
+    Потокобезопасный сборщик длительностей и ошибок запросов в разрезе шагов сценария
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    def add(self, name: str, duration: float, is_error: bool) -> None:
+        with self._lock:
+            self.durations[name].append(duration)
+            if is_error:
+                self.errors[name] += 1
+
+    def get_report(self) -> dict:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        report = {}
+        for name, durations in sorted(self.durations.items()):
+            sorted_durations = sorted(durations)
+            report[name] = {
+                'requests': len(durations),
+                'errors': self.errors[name],
+                'error_rate': self.errors[name] / len(durations),
+                'throughput': len(durations) / elapsed if elapsed else 0.0,
+                'p50': percentile(sorted_durations, 50),
+                'p90': percentile(sorted_durations, 90),
+                'p95': percentile(sorted_durations, 95),
+                'p99': percentile(sorted_durations, 99),
+                'max': sorted_durations[-1],
+            }
+        return {'elapsed': elapsed, 'endpoints': report}
+
+
+class VirtualUser(object):
+    """
+    Пользователь SPA: проходит форму входа, затем выполняет шаги сценария, выбирая задачи по весам
+    """
+
+    def __init__(self, base_url: str, username: str, password: str, scenario: dict,
+                 statistics: LoadTestStatistics, rnd: random.Random) -> None:
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.scenario = scenario
+        self.statistics = statistics
+        self.rnd = rnd
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), NoRedirectHandler())
+
+    def get_cookie(self, name: str) -> Optional[str]:
+        for cookie in self.cookies:
+            if cookie.name == name:
+                return cookie.value
+        return None
+
+    def request(self, name: str, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None):
+        """
+        Выполняет запрос и учитывает его в статистике
+        :return: статус ответа и тело ответа
+        """
+        url = urljoin(self.base_url, path)
+        request_headers = {'Referer': url}
+        csrf_token = self.get_cookie('csrftoken')
+        if csrf_token:
+            request_headers['X-CSRFToken'] = csrf_token
+        request_headers.update(headers or {})
+
+        started = time.perf_counter()
+        try:
+            with self.opener.open(Request(url, data=body, method=method, headers=request_headers)) as response:
+                status, content = response.status, response.read()
+        except HTTPError as e:
+            status, content = e.code, e.read()
+        except (URLError, OSError):
+            status, content = 0, b''
+        self.statistics.add(name, time.perf_counter() - started, status == 0 or status >= 400)
+        return status, content
+
+    def login(self) -> None:
+        status, content = self.request('login_form', 'GET', self.scenario.get('login_url', '/login/'))
+        match = CSRF_TOKEN_RE.search(content.decode('utf-8', errors='replace'))
+        if not match:
+            raise LoadTestError(f'Форма входа недоступна (статус {status})')
+        body = urlencode({'username': self.username, 'password': self.password, 'next': '/',
+                          'csrfmiddlewaretoken': match.group(1)}).encode('utf-8')
+        self.request('login', 'POST', self.scenario.get('login_url', '/login/'), body,
+                     {'Content-Type': 'application/x-www-form-urlencoded'})
+        if not self.get_cookie('sessionid'):
+            raise LoadTestError(f'Не удалось выполнить вход пользователя "{self.username}"')
+
+    def get_step_body(self, step: dict) -> Optional[bytes]:
+        if 'body_generator' in step:
+            generator = BODY_GENERATORS[step['body_generator']]
+            return json.dumps(generator(self.rnd, **step.get('generator_params', {}))).encode('utf-8')
+        if 'body' in step:
+            return json.dumps(step['body']).encode('utf-8')
+        return None
+
+    def run_step(self, step: dict) -> None:
+        name = step.get('name', f'{step["method"]} {step["path"]}')
+        body = self.get_step_body(step)
+        headers = {'Content-Type': 'application/json'} if body is not None else None
+        status, content = self.request(name, step['method'], step['path'], body, headers)
+
+        poll = step.get('poll')
+        if poll and 0 < status < 400:
+            for _ in range(poll.get('max_attempts', 30)):
+                time.sleep(poll.get('interval', 2))
+                status, content = self.request(poll.get('name', f'{name} (poll)'), 'GET', poll['path'])
+                try:
+                    data = json.loads(content.decode('utf-8'))
+                except ValueError:
+                    break
+                if all(data.get(key) == value for key, value in poll['until'].items()):
+                    break
+
+    def think(self) -> None:
+        min_time, max_time = self.scenario.get('think_time', [0, 0])
+        time.sleep(self.rnd.uniform(min_time, max_time))
+
+    def run(self, deadline: float) -> None:
+        self.login()
+        for step in self.scenario.get('on_start', []):
+            self.run_step(step)
+
+        tasks = self.scenario['tasks']
+        weights = [task.get('weight', 1) for task in tasks]
+        while time.monotonic() < deadline:
+            task = self.rnd.choices(tasks, weights)[0]
+            for step in task['steps']:
+                self.run_step(step)
+            self.think()
+
+
+def run_load_test(base_url: str, scenario: dict, users: List[str], password: str, duration: float,
+                  ramp_up: float = 0.0, seed: int = 0) -> dict:
+    """
+    Запускает виртуальных пользователей в отдельных потоках и возвращает отчет по шагам сценария
+    :param users: имена пользователей, каждый пользователь выполняется в своем потоке
+    :param ramp_up: время, за которое запускаются все пользователи, сек
+    """
+    statistics = LoadTestStatistics()
+    deadline = time.monotonic() + duration
+    failures: List[str] = []
+
+    def worker(virtual_user: VirtualUser) -> None:
+        try:
+            virtual_user.run(deadline)
+        except LoadTestError as e:
+            failures.append(str(e))
+
+    threads = []
+    for index, username in enumerate(users):
+        if index and ramp_up:
+            time.sleep(ramp_up / (len(users) - 1))
+        virtual_user = VirtualUser(base_url, username, password, scenario, statistics,
+                                   random.Random(seed + index))
+        thread = threading.Thread(target=worker, args=(virtual_user,), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+    statistics.finished = time.monotonic()
+
+    report = statistics.get_report()
+    report['users'] = len(users)
+    report['failed_users'] = failures
+    return report
@@ -0,0 +1,74 @@
+# coding: utf-8
+import json
+import re
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from compressor.conf import settings as compressor_settings
+from compressor.storage import default_storage
+
+
+ASSET_URL_RE = re.compile(r'(?:src|href)="([^"]+)"')
+
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+
+class Command(BaseCommand):
+    help = 'Сборка и минификация js- и css-файлов SPA в файлы с хэшем содержимого в имени (django-compressor offline)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clean', action='store_true',
+                            help='Удалить сборки, не используемые в новом манифесте')
+
+    def get_manifest_names(self) -> list:
+        """
+        Возвращает имена файлов сборок, на которые ссылается манифест
+        """
+        manifest_name = f'{compressor_settings.COMPRESS_OUTPUT_DIR}/{compressor_settings.COMPRESS_OFFLINE_MANIFEST}'
+        try:
+            with default_storage.open(manifest_name) as f:
+                manifest = json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Невозможно прочитать манифест сборок: {e}')
+
+        # Ссылки в манифесте содержат заполнитель вместо COMPRESS_URL, поэтому из них выбирается путь в хранилище
+        output_dir = re.escape(compressor_settings.COMPRESS_OUTPUT_DIR)
+        names = set()
+        for rendered in manifest.values():
+            for url in ASSET_URL_RE.findall(rendered):
+                match = re.search(rf'(?:^|/)({output_dir}/[^?#]+)', url)
+                if match:
+                    names.add(match.group(1))
+        return sorted(names)
+
+    def get_compressed_names(self, name: str) -> list:
+        """
+        Возвращает имена сжатых копий файла сборки
+        """
+        return [f'{name}{suffix}' for suffix in COMPRESSED_SUFFIXES if default_storage.exists(f'{name}{suffix}')]
+
+    def clean(self, names: list) -> None:
+        used = set(names)
+        for name in names:
+            used.update(self.get_compressed_names(name))
+        for kind in ('js', 'css'):
+            directory = f'{compressor_settings.COMPRESS_OUTPUT_DIR}/{kind}'
+            if not default_storage.exists(directory):
+                continue
+            for file_name in default_storage.listdir(directory)[1]:
+                name = f'{directory}/{file_name}'
+                if name not in used:
+                    default_storage.delete(name)
+                    self.stdout.write(f'Удалена устаревшая сборка {name}')
+
+    def handle(self, *args, **options):
+        call_command('compress', force=True, verbosity=options['verbosity'])
+
+        names = self.get_manifest_names()
+        if options['clean'] and names:
+            self.clean(names)
+
+        for name in names:
+            sizes = ', '.join(f'{compressed_name.rsplit(".", 1)[1]} {default_storage.size(compressed_name)}'
+                              for compressed_name in self.get_compressed_names(name))
+            self.stdout.write(f'{name}: {default_storage.size(name)} байт' + (f' ({sizes})' if sizes else ''))
+        self.stdout.write(self.style.SUCCESS(f'Собрано файлов: {len(names)}'))
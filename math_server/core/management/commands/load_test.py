@@ -0,0 +1,63 @@
+# coding: utf-8
+import json
+from pathlib import Path
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.management.base import BaseCommand, CommandError
+from core.loadtest.runner import LoadTestError
+from core.loadtest.runner import load_scenario
+from core.loadtest.runner import run_load_test
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочное тестирование REST-API: N пользователей выполняют сценарий работы SPA на запущенном сервере'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/', help='Адрес тестируемого сервера')
+        parser.add_argument('--scenario', default='spa_user',
+                            help='Имя сценария из core/loadtest/scenarios, либо путь к json-файлу сценария')
+        parser.add_argument('--users', type=int, default=10, help='Количество одновременных пользователей')
+        parser.add_argument('--duration', type=float, default=60, help='Длительность теста, сек')
+        parser.add_argument('--ramp-up', type=float, default=0, help='Время запуска всех пользователей, сек')
+        parser.add_argument('--username-template', default='loadtest{}',
+                            help='Шаблон имени пользователя, {} заменяется номером пользователя')
+        parser.add_argument('--password', default='loadtest', help='Пароль пользователей')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Создать локальных пользователей с правами на модели в базе данных сервера')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--output', type=Path, help='Файл для сохранения отчета в формате json')
+
+    def create_users(self, usernames, password):
+        permissions = list(Permission.objects.filter(content_type__app_label='core',
+                                                     codename__regex=r'^(view|change)_'))
+        for username in usernames:
+            user, _ = get_user_model().objects.get_or_create(username=username)
+            user.set_password(password)
+            user.save()
+            user.user_permissions.set(permissions)
+
+    def handle(self, *args, **options):
+        usernames = [options['username_template'].format(i) for i in range(1, options['users'] + 1)]
+        if options['create_users']:
+            self.create_users(usernames, options['password'])
+
+        try:
+            scenario = load_scenario(options['scenario'])
+            report = run_load_test(options['url'], scenario, usernames, options['password'], options['duration'],
+                                   options['ramp_up'], options['seed'])
+        except LoadTestError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f'Пользователей: {report["users"]}, длительность: {report["elapsed"]:.1f} с')
+        self.stdout.write(f'{"Шаг сценария":<40} {"запр.":>7} {"запр/с":>8} {"ошибки":>7} '
+                          f'{"p50":>8} {"p95":>8} {"p99":>8} {"max":>8}')
+        for name, stats in report['endpoints'].items():
+            self.stdout.write(f'{name:<40} {stats["requests"]:>7} {stats["throughput"]:>8.2f} '
+                              f'{stats["error_rate"]:>7.1%} {stats["p50"] * 1000:>6.0f}мс '
+                              f'{stats["p95"] * 1000:>6.0f}мс {stats["p99"] * 1000:>6.0f}мс '
+                              f'{stats["max"] * 1000:>6.0f}мс')
+        for failure in report['failed_users']:
+            self.stderr.write(failure)
+
+        if options['output']:
+            options['output'].write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
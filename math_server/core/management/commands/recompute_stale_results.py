@@ -0,0 +1,42 @@
+# coding: utf-8
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.recompute import count_stale_results
+from core.recompute import recompute_stale_results
+from core.tasks import start_recompute_stale_task
+
+
+class Command(BaseCommand):
+    help = 'Пересчет результатов моделей, вычисленных предыдущими версиями алгоритмов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.RECOMPUTE_BATCH_SIZE,
+                            help='Количество экземпляров моделей в пакете')
+        parser.add_argument('--pause', type=float, default=settings.RECOMPUTE_BATCH_PAUSE,
+                            help='Пауза между пакетами, сек')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Максимальное количество пересчитываемых экземпляров')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Вывести количество устаревших результатов без пересчета')
+        parser.add_argument('--spool', action='store_true',
+                            help='Поставить пересчет в очередь спулера uWSGI с настройками RECOMPUTE_BATCH_*')
+
+    def handle(self, *args, **options):
+        stale = count_stale_results()
+        for model_id, count in stale.items():
+            self.stdout.write(f'{model_id}: устаревших результатов {count}')
+        if options['dry_run'] or not any(stale.values()):
+            return
+
+        if options['spool']:
+            start_recompute_stale_task()
+            self.stdout.write(self.style.SUCCESS('Пересчет поставлен в очередь'))
+            return
+
+        report = recompute_stale_results(options['batch_size'], options['pause'], options['limit'])
+        if options['verbosity'] > 1:
+            for model_id, count in report.recomputed.items():
+                self.stdout.write(f'{model_id}: пересчитано {count}')
+            for model_id, count in report.failed.items():
+                self.stdout.write(f'{model_id}: ошибок {count}')
+        self.stdout.write(self.style.SUCCESS(f'Пересчет завершен: {report}'))
@@ -0,0 +1,51 @@
+# coding: utf-8
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from core.benchmarks import BENCHMARKS, SCALES
+from core.benchmarks import compare_with_baseline
+from core.benchmarks import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Запуск бенчмарков моделей, импорта НСИ и REST-API на отдельной тестовой базе данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES.keys(), default='quick',
+                            help='Объем синтетических данных')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество повторов каждого замера')
+        parser.add_argument('--benchmark', action='append', choices=BENCHMARKS.keys(), dest='benchmarks',
+                            help='Запускаемый бенчмарк, по умолчанию - все')
+        parser.add_argument('--output', type=Path, help='Файл для сохранения результатов в формате json')
+        parser.add_argument('--baseline', type=Path, help='Файл базовых значений для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимое относительное замедление относительно базовых значений')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(options['scale'], options['repeat'], options['benchmarks'],
+                                     log=self.stdout.write)
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            options['output'].write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+
+        if options['baseline']:
+            try:
+                baseline = json.loads(options['baseline'].read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Невозможно прочитать файл базовых значений: {e}')
+
+            regressions = compare_with_baseline(results, baseline, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f'Выявлено замедление в {len(regressions)} бенчмарках')
+            self.stdout.write(self.style.SUCCESS('Замедлений относительно базовых значений не выявлено'))
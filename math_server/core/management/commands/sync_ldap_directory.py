@@ -0,0 +1,38 @@
+# coding: utf-8
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from math_server.ldap_sync import LDAPDirectorySync
+
+
+class Command(BaseCommand):
+    help = 'Синхронизация пользователей и групп Django с каталогом LDAP (AUTH_LDAP_USER_SEARCH, AUTH_LDAP_GROUP_SEARCH)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=500, help='Размер страницы поиска LDAP')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пакета записи в базу данных')
+        parser.add_argument('--dry-run', action='store_true', help='Вывести изменения без записи в базу данных')
+        parser.add_argument('--deactivate-missing', action='store_true',
+                            help='Заблокировать пользователей, созданных из LDAP и отсутствующих в каталоге')
+
+    def handle(self, *args, **options):
+        directory_sync = LDAPDirectorySync(options['page_size'], options['batch_size'])
+        try:
+            report = directory_sync.run(options['dry_run'], options['deactivate_missing'])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        except directory_sync.backend.ldap.LDAPError as e:
+            raise CommandError(f'Ошибка обращения к серверу LDAP: {e}')
+
+        if options['verbosity'] > 1:
+            for username in report.users_created:
+                self.stdout.write(f'+ {username}')
+            for username, fields in report.users_updated.items():
+                self.stdout.write(f'~ {username}: {", ".join(fields)}')
+            for username in report.users_missing:
+                suffix = ' (заблокирован)' if username in report.users_deactivated else ''
+                self.stdout.write(f'- {username}{suffix}')
+            for name in report.groups_created:
+                self.stdout.write(f'+ группа {name}')
+
+        prefix = 'Изменения (без записи в базу данных)' if options['dry_run'] else 'Синхронизация завершена'
+        self.stdout.write(self.style.SUCCESS(f'{prefix}: {report}'))
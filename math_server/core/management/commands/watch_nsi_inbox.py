@@ -0,0 +1,73 @@
+# coding: utf-8
+import logging
+import time
+from pathlib import Path
+from typing import List
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from core.nsi_inbox import InboxFile
+from core.nsi_inbox import NSIInboxPipeline
+from core.nsi_inbox import list_inbox_files
+from core.nsi_import_lock import NSIImportLease
+from core.nsi_import_lock import get_lease_owner
+from core.nsi_import_lock import has_queued_imports
+from core.nsi_import_queue import process_queued_imports
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Отслеживание каталога выгрузок НСИ и импорт новых файлов в порядке имен'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать имеющиеся файлы и завершить работу')
+        parser.add_argument('--interval', type=float, default=settings.NSI_INBOX_POLL_INTERVAL,
+                            help='Интервал опроса каталога, сек')
+        parser.add_argument('--queue-size', type=int, default=settings.NSI_INBOX_QUEUE_SIZE,
+                            help='Размер очередей между стадиями конвейера, пакетов')
+
+    def handle(self, *args, **options):
+        inbox_dir = Path(settings.NSI_EXPORTED_DATA_DIR)
+        self.stdout.write(f'Отслеживается каталог {inbox_dir}, шаблон {settings.NSI_INBOX_FILE_PATTERN}')
+        lease = NSIImportLease(get_lease_owner('inbox'), settings.NSI_IMPORT_LEASE_TTL)
+        while True:
+            paths = list_inbox_files(inbox_dir, settings.NSI_INBOX_FILE_PATTERN, settings.NSI_INBOX_SETTLE_TIME)
+            if paths:
+                try:
+                    self.process_files(paths, lease, options['queue_size'])
+                except Exception as e:
+                    # Ошибка обработки (например, недоступность базы данных) не завершает отслеживание каталога,
+                    # необработанные файлы остаются в каталоге и обрабатываются при следующем опросе
+                    logger.exception('NSI inbox processing failed')
+                    connections.close_all()
+                    if options['once']:
+                        raise CommandError(f'Ошибка обработки каталога: {e}')
+                    self.stderr.write(f'Ошибка обработки каталога: {e}')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def process_files(self, paths: List[Path], lease: NSIImportLease, queue_size: int) -> None:
+        if not lease.acquire():
+            self.stdout.write('Выполняется другой импорт, обработка отложена')
+            return
+        try:
+            pipeline = NSIInboxPipeline(Path(settings.NSI_ARCHIVE_DIR), Path(settings.NSI_FAILED_DIR), queue_size,
+                                        on_file_processed=self.report_file, lease=lease)
+            pipeline.run(paths)
+        finally:
+            lease.release()
+        # Импорт, запрошенный пользователем во время обработки каталога, выполняется после ее окончания
+        if has_queued_imports():
+            process_queued_imports(lease.owner)
+
+    def report_file(self, inbox_file: InboxFile) -> None:
+        if inbox_file.error:
+            self.stderr.write(f'{inbox_file.path.name}: {inbox_file.error}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{inbox_file.path.name}: {inbox_file.report}'))
+        for record in inbox_file.report.rejected[:settings.NSI_IMPORT_REJECTED_REPORT_LIMIT]:
+            self.stderr.write(f'  {record.model_name} "{record.nsi_id}": {record.reason}')
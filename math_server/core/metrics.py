@@ -0,0 +1,146 @@
+# coding: utf-8
+import logging
+import time
+from typing import Optional
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import AsyncMathModel
+from .models import BaseMathModel
+from .models import PerformanceMetric
+from .profiling import claim_profiling_request
+from .profiling import profile_calculation
+from .timing import RequestTiming
+from .timing import measure_phase
+
+
+logger = logging.getLogger(__name__)
+
+# Вес последнего измерения в экспоненциальном скользящем среднем длительности на единицу данных
+EWMA_ALPHA = 0.3
+
+CALCULATION_METRIC = 'calculate'
+
+REQUEST_METRIC = 'request'
+
+
+def record_duration(name: str, key: str, duration: float, units: int = 1, queries_count: int = 0) -> None:
+    """
+    Добавляет измерение длительности операции в агрегированную статистику
+    :param name: наименование метрики
+    :param key: ключ метрики, например идентификатор модели
+    :param duration: длительность операции, сек
+    :param units: объем обработанных данных
+    :param queries_count: количество SQL-запросов, выполненных в ходе операции
+    """
+    units = max(units, 1)
+    unit_duration = duration / units
+    updated_count = PerformanceMetric.objects.filter(name=name, key=key).update(
+        calls_count=F('calls_count') + 1,
+        total_duration=F('total_duration') + duration,
+        max_duration=Greatest(F('max_duration'), Value(duration)),
+        total_units=F('total_units') + units,
+        total_queries=F('total_queries') + queries_count,
+        unit_duration_ewma=Case(
+            When(calls_count=0, then=Value(unit_duration)),
+            default=F('unit_duration_ewma') * (1 - EWMA_ALPHA) + unit_duration * EWMA_ALPHA,
+        ),
+        updated_timestamp=timezone.now(),
+    )
+    if not updated_count:
+        try:
+            # Строка может быть создана параллельным процессом. Точка сохранения откатывает только неудачную
+            # вставку, не прерывая внешнюю транзакцию, и измерение добавляется повторным обновлением
+            with transaction.atomic():
+                PerformanceMetric.objects.create(name=name, key=key, calls_count=1, total_duration=duration,
+                                                 max_duration=duration, total_units=units,
+                                                 total_queries=queries_count, unit_duration_ewma=unit_duration)
+        except IntegrityError:
+            record_duration(name, key, duration, units, queries_count)
+
+
+def predict_calculation_time(model_id: str, input_size: int) -> Optional[float]:
+    """
+    Прогнозирует длительность вычисления модели по статистике предыдущих вычислений
+    :return: длительность в секундах, либо None, если статистика отсутствует
+    """
+    unit_duration = PerformanceMetric.objects.filter(name=CALCULATION_METRIC, key=model_id).values_list(
+        'unit_duration_ewma', flat=True).first()
+    if unit_duration is None:
+        return None
+    return unit_duration * max(input_size, 1)
+
+
+def is_async_calculation_required(model_instance: BaseMathModel) -> bool:
+    """
+    Определяет, необходимо ли выполнять вычисление модели асинхронно.
+    Асинхронные модели вычисляются асинхронно всегда, синхронные - если прогноз длительности вычислений
+    превышает бюджет задержки модели
+    """
+    if isinstance(model_instance, AsyncMathModel):
+        return True
+
+    latency_budget = model_instance.latency_budget
+    if latency_budget is None:
+        return False
+
+    input_size = model_instance.get_input_size()
+    if model_instance.max_sync_input_size is not None and input_size > model_instance.max_sync_input_size:
+        return True
+
+    predicted_time = predict_calculation_time(type(model_instance).__name__.lower(), input_size)
+    return predicted_time is not None and predicted_time > latency_budget
+
+
+def run_calculation(model_instance: BaseMathModel):
+    """
+    Выполняет calculate() модели, отмечает результат текущей версией алгоритма и сохраняет длительность
+    вычисления в статистику.
+    Если для модели или пользователя есть запрос на профилирование, вычисление выполняется под профилировщиком
+    :return: результат calculate()
+    """
+    model_id = type(model_instance).__name__.lower()
+    profiling_request = claim_profiling_request(model_id, model_instance.user_id)
+
+    started = time.perf_counter()
+    with measure_phase('calculate'):
+        if profiling_request:
+            with profile_calculation(profiling_request, model_id, model_instance.user):
+                result = model_instance.calculate()
+        else:
+            result = model_instance.calculate()
+    duration = time.perf_counter() - started
+    model_instance.output_algorithm_version = model_instance.algorithm_version
+    record_duration(CALCULATION_METRIC, model_id, duration, model_instance.get_input_size())
+    return result
+
+
+def get_request_metric_key(request) -> str:
+    """
+    Возвращает ключ метрики запроса: HTTP-метод и шаблон URL, для API моделей - с идентификатором модели
+    """
+    match = request.resolver_match
+    if match is None:
+        return f'{request.method} {request.path}'
+    key = f'{request.method} {match.route}'
+    model_id = match.kwargs.get('model_id')
+    if model_id:
+        key = f'{key} [{model_id}]'
+    return key
+
+
+def record_request_timing(request, timing: RequestTiming, total_duration: float) -> None:
+    """
+    Сохраняет замеры фаз обработки запроса в статистику производительности
+    """
+    key = get_request_metric_key(request)
+    try:
+        with transaction.atomic():
+            record_duration(REQUEST_METRIC, key, total_duration, queries_count=timing.queries_count)
+            record_duration(f'{REQUEST_METRIC}.db', key, timing.db_duration, queries_count=timing.queries_count)
+            for phase, duration in timing.phases.items():
+                record_duration(f'{REQUEST_METRIC}.{phase}', key, duration,
+                                queries_count=timing.phase_queries[phase])
+    except DatabaseError as e:
+        logger.warning(f'Unable to record request timing for "{key}": {e}')
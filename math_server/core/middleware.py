@@ -0,0 +1,36 @@
+# coding: utf-8
+import random
+import time
+from django.conf import settings
+from django.db import connection
+from .metrics import record_request_timing
+from .timing import start_request_timing
+from .timing import stop_request_timing
+
+
+class RequestTimingMiddleware(object):
+    """
+    Замеряет длительность фаз обработки запроса (вычисление, сохранение, сериализация, SQL-запросы),
+    добавляет к ответу заголовок Server-Timing и сохраняет замеры в статистику производительности.
+    Замеряется только доля запросов, заданная settings.REQUEST_TIMING_SAMPLE_RATE
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_TIMING_SAMPLE_RATE', 0)
+
+    def __call__(self, request):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timing = start_request_timing()
+        try:
+            with connection.execute_wrapper(timing.execute_wrapper):
+                response = self.get_response(request)
+        finally:
+            stop_request_timing()
+
+        total_duration = time.perf_counter() - timing.started
+        response['Server-Timing'] = timing.get_server_timing_header(total_duration)
+        record_request_timing(request, timing, total_duration)
+        return response
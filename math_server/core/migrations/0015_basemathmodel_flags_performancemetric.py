@@ -0,0 +1,62 @@
+# Generated by Django 3.2.12 on 2026-10-19 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_alter_notification_math_model_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simplecalculatormodel',
+            name='is_processing',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='simplecalculatormodel',
+            name='is_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='vnswellmodel',
+            name='is_processing',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='vnswellmodel',
+            name='is_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='wellproductionmodel',
+            name='is_processing',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='wellproductionmodel',
+            name='is_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='PerformanceMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Метрика')),
+                ('key', models.CharField(max_length=255, verbose_name='Ключ')),
+                ('calls_count', models.PositiveBigIntegerField(default=0, verbose_name='Количество вызовов')),
+                ('total_duration', models.FloatField(default=0, verbose_name='Суммарная длительность, сек')),
+                ('max_duration', models.FloatField(default=0, verbose_name='Максимальная длительность, сек')),
+                ('total_units', models.PositiveBigIntegerField(default=0, verbose_name='Суммарный объем входных данных')),
+                ('unit_duration_ewma', models.FloatField(default=0, verbose_name='Длительность на единицу данных, сек')),
+                ('updated_timestamp', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Метрика производительности',
+                'verbose_name_plural': 'Метрики производительности',
+                'unique_together': {('name', 'key')},
+            },
+        ),
+    ]
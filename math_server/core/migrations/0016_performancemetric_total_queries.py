@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-19 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_basemathmodel_flags_performancemetric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='performancemetric',
+            name='total_queries',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Суммарное количество SQL-запросов'),
+        ),
+    ]
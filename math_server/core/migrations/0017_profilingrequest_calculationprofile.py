@@ -0,0 +1,49 @@
+# Generated by Django 3.2.12 on 2026-10-19 13:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0016_performancemetric_total_queries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('math_model_id', models.CharField(blank=True, max_length=50, null=True, verbose_name='Модель')),
+                ('profiler', models.CharField(choices=[('deterministic', 'Детерминированный (cProfile)'), ('sampling', 'Сэмплирующий')], default='deterministic', max_length=20, verbose_name='Профилировщик')),
+                ('remaining_count', models.PositiveIntegerField(default=1, verbose_name='Осталось вычислений')),
+                ('created_timestamp', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запрос на профилирование',
+                'verbose_name_plural': 'Запросы на профилирование',
+            },
+        ),
+        migrations.CreateModel(
+            name='CalculationProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('math_model_id', models.CharField(max_length=50, verbose_name='Модель')),
+                ('profiler', models.CharField(choices=[('deterministic', 'Детерминированный (cProfile)'), ('sampling', 'Сэмплирующий')], max_length=20, verbose_name='Профилировщик')),
+                ('created_timestamp', models.DateTimeField(auto_now_add=True)),
+                ('duration', models.FloatField(verbose_name='Длительность, сек')),
+                ('pstats_path', models.CharField(blank=True, max_length=255, null=True, verbose_name='Файл pstats')),
+                ('collapsed_path', models.CharField(blank=True, max_length=255, null=True, verbose_name='Файл collapsed stacks')),
+                ('profiling_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.profilingrequest', verbose_name='Запрос на профилирование')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Профиль вычисления',
+                'verbose_name_plural': 'Профили вычислений',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.12 on 2026-10-19 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_profilingrequest_calculationprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, verbose_name='Отпечаток содержимого'),
+        ),
+        migrations.AddField(
+            model_name='individual',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, verbose_name='Отпечаток содержимого'),
+        ),
+    ]
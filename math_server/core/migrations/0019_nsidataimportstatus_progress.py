@@ -0,0 +1,63 @@
+# Generated by Django 3.2.12 on 2026-10-19 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_nsi_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='bytes_processed',
+            field=models.BigIntegerField(default=0, verbose_name='Прочитано байт'),
+        ),
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='bytes_total',
+            field=models.BigIntegerField(default=0, verbose_name='Размер файла, байт'),
+        ),
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='eta',
+            field=models.FloatField(blank=True, null=True, verbose_name='Оценка оставшегося времени, сек'),
+        ),
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='finished_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='phase',
+            field=models.CharField(choices=[('queued', 'В очереди'), ('parse', 'Разбор файла'), ('validate', 'Проверка изменений'), ('write', 'Запись в базу данных'), ('ack', 'Формирование квитанции'), ('finished', 'Завершен'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Фаза'),
+        ),
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='phase_durations',
+            field=models.JSONField(default=dict, verbose_name='Длительность фаз, сек'),
+        ),
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='rate',
+            field=models.FloatField(default=0, verbose_name='Скорость, записей/сек'),
+        ),
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='records_processed',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обработано записей'),
+        ),
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='result',
+            field=models.TextField(blank=True, null=True, verbose_name='Итоги импорта'),
+        ),
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='updated_timestamp',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-19 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_nsidataimportstatus_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nsidataimportstatus',
+            name='rejected_report',
+            field=models.JSONField(blank=True, null=True, verbose_name='Отклоненные записи'),
+        ),
+    ]
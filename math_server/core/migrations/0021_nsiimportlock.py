@@ -0,0 +1,26 @@
+# Generated by Django 3.2.12 on 2026-10-19 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_nsidataimportstatus_rejected_report'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NSIImportLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(blank=True, max_length=100, null=True, verbose_name='Владелец')),
+                ('acquired_timestamp', models.DateTimeField(blank=True, null=True, verbose_name='Получена')),
+                ('expires_timestamp', models.DateTimeField(blank=True, null=True, verbose_name='Истекает')),
+            ],
+            options={
+                'verbose_name': 'Блокировка импорта данных из НСИ',
+                'verbose_name_plural': 'Блокировки импорта данных из НСИ',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.12 on 2026-10-19 13:56
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0021_nsiimportlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineNodeResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('input_hash', models.CharField(max_length=64, unique=True, verbose_name='Хэш входных данных')),
+                ('math_model_id', models.CharField(max_length=50, verbose_name='Модель')),
+                ('output_data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('hits_count', models.PositiveIntegerField(default=0, verbose_name='Количество обращений')),
+                ('created_timestamp', models.DateTimeField(auto_now_add=True)),
+                ('used_timestamp', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Последнее обращение')),
+            ],
+            options={
+                'verbose_name': 'Результат узла конвейера',
+                'verbose_name_plural': 'Результаты узлов конвейеров',
+            },
+        ),
+        migrations.CreateModel(
+            name='PipelineInstance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pipeline_id', models.CharField(max_length=50, verbose_name='Конвейер')),
+                ('input_data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('output_data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('cached_nodes', models.JSONField(default=list)),
+                ('error', models.TextField(blank=True, default='')),
+                ('is_ready', models.BooleanField(default=False)),
+                ('is_processing', models.BooleanField(default=False)),
+                ('updated_timestamp', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Конвейер моделей',
+                'verbose_name_plural': 'Конвейеры моделей',
+                'unique_together': {('user', 'pipeline_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.12 on 2026-10-19 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_pipelines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asynccalculatormodel',
+            name='output_algorithm_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='simplecalculatormodel',
+            name='output_algorithm_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='vnswellmodel',
+            name='output_algorithm_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='wellproductionmodel',
+            name='output_algorithm_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -1,10 +1,15 @@
+from typing import Iterable, List, Optional, Tuple
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 from bisect import bisect_left
-from decimal import Decimal
+from datetime import date, datetime
 from django.core.serializers.json import DjangoJSONEncoder
-import dateutil.parser
+from .input_schema import ChoiceField, DateField, DecimalField, InputSchema, InputSchemaError, TableField
+from .input_schema import IntegerField
+from .vns_engine import ProfileBatch, WellParams, calculate_profiles, get_production_table
 import time
 
 
@@ -26,9 +31,122 @@ class BaseMathModel(models.Model):
 
     output_data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
 
+    is_ready = models.BooleanField(default=False)
+
+    is_processing = models.BooleanField(default=False)
+
+    # Версия алгоритма, которым вычислен output_data
+    output_algorithm_version = models.PositiveIntegerField(default=1)
+
+    # Флаги состояния вычислений. Опрос и обновление состояния затрагивают только эти столбцы,
+    # без загрузки и записи input_data и output_data
+    status_fields = ['is_ready', 'is_processing']
+
+    # Столбцы, записываемые по окончании вычисления
+    result_fields = ['output_data', 'output_algorithm_version']
+
+    # Версия алгоритма calculate(). Увеличивается при изменении алгоритма, после чего сохраненные результаты
+    # считаются устаревшими и пересчитываются в фоне (core.recompute)
+    algorithm_version = 1
+
+    # Допустимая длительность синхронного вычисления, сек. Если прогноз длительности превышает бюджет,
+    # вычисление выполняется асинхронно. None - модель всегда вычисляется синхронно
+    latency_budget: Optional[float] = None
+
+    # Размер входных данных, начиная с которого вычисление выполняется асинхронно без учета статистики
+    max_sync_input_size: Optional[int] = None
+
+    # Схема входных данных. Входные данные проверяются по схеме до постановки вычисления в очередь,
+    # calculate() получает результат разбора через get_parsed_input(). None - входные данные не проверяются
+    input_schema: Optional[InputSchema] = None
+
     def calculate(self):
         raise NotImplementedError
 
+    @classmethod
+    def parse_input(cls, input_data) -> Optional[dict]:
+        """
+        Проверяет входные данные по схеме модели и возвращает значения, приведенные к типам полей схемы
+        """
+        if cls.input_schema is None:
+            return None
+        try:
+            return cls.input_schema.parse(input_data)
+        except InputSchemaError as e:
+            raise CalculationError(str(e))
+
+    def validate_input(self) -> None:
+        """
+        Разбирает input_data и сохраняет результат для последующего вычисления
+        """
+        self._parsed_input = (self.input_data, self.parse_input(self.input_data))
+
+    def get_parsed_input(self) -> Optional[dict]:
+        """
+        Возвращает разобранные входные данные. Повторный разбор выполняется, только если input_data изменились
+        """
+        parsed_input = getattr(self, '_parsed_input', None)
+        if parsed_input is None or parsed_input[0] is not self.input_data:
+            self.validate_input()
+        return self._parsed_input[1]
+
+    # Таблица output_data, выгружаемая при экспорте результатов, и ее столбцы: (заголовок, тип значения)
+    export_table: Optional[str] = None
+
+    export_columns: List[Tuple[str, str]] = []
+
+    @classmethod
+    def get_status(cls, user) -> Optional[dict]:
+        """
+        Возвращает флаги состояния вычислений модели пользователя и признак устаревшего результата
+        """
+        status = cls.objects.filter(user=user).values(*cls.status_fields, 'output_algorithm_version').first()
+        if status is None:
+            return None
+        status['is_stale'] = status['is_ready'] and status.pop('output_algorithm_version') != cls.algorithm_version
+        return status
+
+    @classmethod
+    def get_stale_queryset(cls) -> models.QuerySet:
+        """
+        Возвращает экземпляры модели с результатами, вычисленными предыдущими версиями алгоритма
+        """
+        return cls.objects.filter(is_ready=True, is_processing=False).exclude(
+            output_algorithm_version=cls.algorithm_version)
+
+    def is_output_stale(self) -> bool:
+        return self.is_ready and self.output_algorithm_version != self.algorithm_version
+
+    def save_status(self) -> None:
+        self.save(update_fields=self.status_fields)
+
+    def get_input_size(self) -> int:
+        """
+        Возвращает размер входных данных, используемый для прогноза длительности вычислений
+        """
+        return 1
+
+    def get_export_columns(self) -> List[Tuple[str, str]]:
+        """
+        Возвращает столбцы таблицы результатов для экспорта
+        """
+        return self.export_columns
+
+    def get_export_rows(self) -> Iterable[list]:
+        """
+        Возвращает строки таблицы результатов для экспорта
+        """
+        if not self.export_table or not self.output_data:
+            return []
+        return self.output_data.get(self.export_table) or []
+
+    def get_chart_series(self) -> Tuple[list, List[Tuple[str, list]]]:
+        """
+        Возвращает данные графика результатов: значения оси абсцисс и ряды (наименование, значения).
+        Значения рядов соответствуют значениям оси абсцисс по индексу
+        """
+        return [], []
+
     @staticmethod
     def get_icon_path():
         return 'core/img/default_model_icon.png'
@@ -45,14 +163,20 @@ class AsyncMathModel(BaseMathModel):
     """
     Async math models
     """
-    is_ready = models.BooleanField(default=False)
-
-    is_processing = models.BooleanField(default=False)
 
     class Meta:
         abstract = True
 
 
+def get_local_date(value: datetime) -> date:
+    """
+    Возвращает дату в часовом поясе приложения. Клиент передает даты в UTC
+    """
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
 def take_closest_index(src_list, number):
     """
     Assumes myList is sorted. Returns closest value to myNumber.
@@ -76,39 +200,55 @@ class WellProductionModel(BaseMathModel):
     """
     Model predicts oil production
     """
+    latency_budget = 2.0
+
+    max_sync_input_size = 20000
+
+    export_table = 'production_table'
+
+    export_columns = [('Дата', 'date'), ('Добыча в месяц, м3', 'decimal'), ('Дебит в сутки, м3', 'decimal')]
+
+    input_schema = InputSchema(
+        niz_table=TableField('Отбор от НИЗ / Обводненность', max_rows=100000, increasing_columns=(0,), columns=[
+            DateField('Дата'),
+            DecimalField('Отбор от НИЗ', min_value=0),
+            DecimalField('Обводненность', min_value=0, max_value=1),
+        ]),
+        kin=DecimalField('КИН', positive=True, required_message='Не указан КИН'),
+        debit=DecimalField('Дебит жидкости', positive=True, required_message='Не указан дебит жидкости'),
+        total=DecimalField('Геологические запасы', positive=True,
+                           required_message='Не указана величина геологических запасов'),
+    )
+
+    def get_input_size(self) -> int:
+        niz_table = self.input_data.get('niz_table') if self.input_data else None
+        return len(niz_table) if niz_table else 1
+
+    def get_chart_series(self) -> Tuple[list, List[Tuple[str, list]]]:
+        production_table = self.output_data.get('production_table') if self.output_data else None
+        if not production_table:
+            return [], []
+        series = [('Прогноз', [row[2] for row in production_table])]
+        for referent_model in (self.input_data or {}).get('referent_models') or []:
+            series.append((referent_model.get('name', ''), referent_model.get('table') or []))
+        return [row[0] for row in production_table], series
 
     def calculate(self):
-        if not self.input_data:
-            raise CalculationError('Отсутствуют входные данные для алгоритма')
-
-        niz_table = self.input_data.get('niz_table')
-        if not niz_table:
-            raise CalculationError('Не заполнена таблица “Отбор от НИЗ / Обводненность”')
-
-        kin = self.input_data.get('kin')
-        if not kin:
-            raise CalculationError('Не указан КИН')
-        kin = Decimal(kin)
-
-        debit = self.input_data.get('debit')
-        if not debit:
-            raise CalculationError('Не указан дебит жидкости')
-        debit = Decimal(debit)
-
-        total = self.input_data.get('total')
-        if not total:
-            raise CalculationError('Не указана величина геологических запасов')
-        total = Decimal(total)
+        input_data = self.get_parsed_input()
+        niz_table = input_data['niz_table']
+        kin = input_data['kin']
+        debit = input_data['debit']
+        total = input_data['total']
 
         production_table = []
         current_sum = 0
         niz = total * kin
-        niz_search_column = [Decimal(row[1]) for row in niz_table]
+        niz_search_column = [row[1] for row in niz_table]
 
         for index, niz_row in enumerate(niz_table):
-            current_date = dateutil.parser.isoparse(niz_row[0])
+            current_date = niz_row[0]
             if index < (len(niz_table) - 1):
-                next_date = dateutil.parser.isoparse(niz_table[index + 1][0])
+                next_date = niz_table[index + 1][0]
             else:
                 next_date = current_date.replace(day=1) + relativedelta(months=1)
 
@@ -118,7 +258,7 @@ class WellProductionModel(BaseMathModel):
             niz_current = current_sum / niz
             i = take_closest_index(niz_search_column, niz_current)
 
-            delta = 1 - Decimal(niz_table[i][2])
+            delta = 1 - niz_table[i][2]
             month_sum *= delta
 
             current_debit = month_sum / days_in_month
@@ -142,11 +282,98 @@ class WellProductionModel(BaseMathModel):
 
 
 class VNSWellModel(BaseMathModel):
+    """
+    Model calculates production profile of a new well with decline curve and effects of scheduled GTM
+    """
+    latency_budget = 2.0
+
+    export_table = 'production_table'
+
+    export_columns = [('Дата', 'date'), ('Добыча в месяц, м3', 'decimal'), ('Дебит в сутки, м3', 'decimal'),
+                      ('Дебит без учета ГТМ, м3', 'decimal')]
+
+    input_schema = InputSchema(
+        date_begin=DateField('Дата ввода скважины в эксплуатацию'),
+        start_debit=DecimalField('Стартовый дебит жидкости', positive=True),
+        decline_rate=DecimalField('Темп падения дебита', min_value=0, max_value=10),
+        decline_exponent=DecimalField('Показатель степени кривой падения', min_value=0, max_value=2, required=False),
+        horizon=IntegerField('Горизонт прогноза', min_value=1, max_value=600),
+        gtm_table=TableField('ГТМ', required=False, max_rows=1000, columns=[
+            DateField('Дата'),
+            DecimalField('Прирост дебита'),
+            DecimalField('Длительность выхода на эффект', min_value=0, max_value=120),
+        ]),
+    )
+
+    def get_input_size(self) -> int:
+        horizon = self.input_data.get('horizon') if self.input_data else None
+        try:
+            return max(int(horizon), 1)
+        except (TypeError, ValueError):
+            return 1
+
+    @staticmethod
+    def get_well_params(input_data: dict) -> WellParams:
+        """
+        Формирует параметры профиля скважины из входных данных, разобранных по input_schema
+        """
+        start_date = get_local_date(input_data['date_begin'])
+        gtm = []
+        for gtm_date, increment, ramp in input_data['gtm_table'] or []:
+            gtm_date = get_local_date(gtm_date)
+            if gtm_date < start_date:
+                raise CalculationError(f'Дата ГТМ {gtm_date:%d.%m.%Y} раньше даты ввода скважины в эксплуатацию')
+            gtm.append((gtm_date, float(increment), float(ramp)))
+        return WellParams(start_date, float(input_data['start_debit']), float(input_data['decline_rate']),
+                          float(input_data['decline_exponent'] or 0), input_data['horizon'], gtm)
+
+    @classmethod
+    def calculate_batch(cls, wells_input_data: List[dict]) -> List[dict]:
+        """
+        Рассчитывает профили нескольких скважин за один вызов
+        :param wells_input_data: входные данные скважин в формате input_data модели
+        :return: output_data для каждой скважины
+        """
+        wells = [cls.get_well_params(cls.parse_input(input_data)) for input_data in wells_input_data]
+        return cls.get_output_data(wells, calculate_profiles(wells))
+
+    @staticmethod
+    def get_output_data(wells: List[WellParams], batch: ProfileBatch) -> List[dict]:
+        outputs = []
+        for index, well in enumerate(wells):
+            production_table = get_production_table(batch, index, well.horizon, well.start_date)
+            base_production = batch.base_debit[index, :well.horizon] * batch.days[index, :well.horizon]
+            outputs.append({
+                'production_table': production_table,
+                'base_debit': batch.base_debit[index, :well.horizon].tolist(),
+                'total': float(batch.production[index, :well.horizon].sum()),
+                'gtm_total': float(batch.production[index, :well.horizon].sum() - base_production.sum()),
+            })
+        return outputs
 
     def calculate(self):
-        self.output_data = {'test': 'test'}
+        well = self.get_well_params(self.get_parsed_input())
+        self.output_data = self.get_output_data([well], calculate_profiles([well]))[0]
         return self.output_data
 
+    def get_export_rows(self) -> Iterable[list]:
+        """
+        Строки таблицы добычи дополняются дебитом без учета ГТМ
+        """
+        if not self.output_data:
+            return []
+        base_debit = self.output_data.get('base_debit') or []
+        return (row + [base] for row, base in zip(self.output_data.get('production_table') or [], base_debit))
+
+    def get_chart_series(self) -> Tuple[list, List[Tuple[str, list]]]:
+        production_table = self.output_data.get('production_table') if self.output_data else None
+        if not production_table:
+            return [], []
+        return [row[0] for row in production_table], [
+            ('Дебит с учетом ГТМ', [row[2] for row in production_table]),
+            ('Дебит без учета ГТМ', self.output_data.get('base_debit') or []),
+        ]
+
     @staticmethod
     def get_icon_path():
         return 'core/img/well2.png'
@@ -172,25 +399,20 @@ class Calculator(object):
             'div': lambda a, b: a / b if b > 0 else 0,
         }
 
+    input_schema = InputSchema(
+        val1=DecimalField('Оператор №1', required_message='Не указан опертор №1'),
+        val2=DecimalField('Оператор №2', required_message='Не указан опертор №2'),
+        op=ChoiceField('Арифметическая операция', choices=['add', 'sub', 'mul', 'div'],
+                       required_message='Не указана арифметическая операция, либо операция не поддерживается'),
+    )
+
     @staticmethod
     def calculate(input_data):
-        if not input_data:
-            raise CalculationError('Отсутствуют входные данные для алгоритма')
-
-        val1 = input_data.get('val1')
-        if val1 is None or val1 == '':
-            raise CalculationError('Не указан опертор №1')
-        val1 = Decimal(val1)
-
-        val2 = input_data.get('val2')
-        if val2 is None or val2 == '':
-            raise CalculationError('Не указан опертор №2')
-        val2 = Decimal(val2)
-
-        requested_opeartion = Calculator.get_operations().get(input_data.get('op'))
-        if not requested_opeartion:
-            raise CalculationError('Не указана арифметическая операция, либо операция не поддерживается')
-        return float(requested_opeartion(val1, val2))
+        """
+        :param input_data: входные данные, разобранные по Calculator.input_schema
+        """
+        requested_opeartion = Calculator.get_operations()[input_data['op']]
+        return float(requested_opeartion(input_data['val1'], input_data['val2']))
 
 
 class SimpleCalculatorModel(BaseMathModel):
@@ -198,8 +420,10 @@ class SimpleCalculatorModel(BaseMathModel):
     Model predicts oil production
     """
 
+    input_schema = Calculator.input_schema
+
     def calculate(self):
-        self.output_data['result'] = Calculator.calculate(self.input_data)
+        self.output_data['result'] = Calculator.calculate(self.get_parsed_input())
         return self.output_data
 
     @staticmethod
@@ -223,8 +447,10 @@ class AsyncCalculatorModel(AsyncMathModel):
     Model predicts oil production
     """
 
+    input_schema = Calculator.input_schema
+
     def calculate(self):
-        self.output_data['result'] = Calculator.calculate(self.input_data)
+        self.output_data['result'] = Calculator.calculate(self.get_parsed_input())
         time.sleep(30)
         return self.output_data
 
@@ -265,21 +491,177 @@ class Notification(models.Model):
         verbose_name_plural = 'Уведомления'
 
 
+class PerformanceMetric(models.Model):
+    """
+    Агрегированная статистика длительности операций, используется для прогноза длительности вычислений
+    """
+    name = models.CharField(max_length=100, verbose_name='Метрика')
+
+    key = models.CharField(max_length=255, verbose_name='Ключ')
+
+    calls_count = models.PositiveBigIntegerField(default=0, verbose_name='Количество вызовов')
+
+    total_duration = models.FloatField(default=0, verbose_name='Суммарная длительность, сек')
+
+    max_duration = models.FloatField(default=0, verbose_name='Максимальная длительность, сек')
+
+    total_units = models.PositiveBigIntegerField(default=0, verbose_name='Суммарный объем входных данных')
+
+    total_queries = models.PositiveBigIntegerField(default=0, verbose_name='Суммарное количество SQL-запросов')
+
+    unit_duration_ewma = models.FloatField(default=0, verbose_name='Длительность на единицу данных, сек')
+
+    updated_timestamp = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Метрика производительности'
+        verbose_name_plural = 'Метрики производительности'
+        unique_together = ('name', 'key')
+
+
+class ProfilingRequest(models.Model):
+    """
+    Запрос на профилирование ближайших вычислений математической модели
+    """
+    PROFILER_DETERMINISTIC = 'deterministic'
+    PROFILER_SAMPLING = 'sampling'
+    PROFILER_CHOICES = (
+        (PROFILER_DETERMINISTIC, 'Детерминированный (cProfile)'),
+        (PROFILER_SAMPLING, 'Сэмплирующий'),
+    )
+
+    math_model_id = models.CharField(max_length=50, verbose_name='Модель', blank=True, null=True)
+
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, verbose_name='Пользователь',
+                             blank=True, null=True)
+
+    profiler = models.CharField(max_length=20, verbose_name='Профилировщик', choices=PROFILER_CHOICES,
+                                default=PROFILER_DETERMINISTIC)
+
+    remaining_count = models.PositiveIntegerField(verbose_name='Осталось вычислений', default=1)
+
+    created_timestamp = models.DateTimeField(auto_now_add=True)
+
+    def clean(self):
+        if not self.math_model_id and not self.user_id:
+            raise ValidationError('Укажите модель и/или пользователя, вычисления которых требуется профилировать')
+
+    def matches(self, math_model_id: str, user_id: int) -> bool:
+        return ((not self.math_model_id or self.math_model_id == math_model_id) and
+                (not self.user_id or self.user_id == user_id))
+
+    class Meta:
+        verbose_name = 'Запрос на профилирование'
+        verbose_name_plural = 'Запросы на профилирование'
+
+
+class CalculationProfile(models.Model):
+    """
+    Результат профилирования вычисления математической модели
+    """
+    profiling_request = models.ForeignKey(ProfilingRequest, on_delete=models.SET_NULL, blank=True, null=True,
+                                          verbose_name='Запрос на профилирование')
+
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, verbose_name='Пользователь')
+
+    math_model_id = models.CharField(max_length=50, verbose_name='Модель')
+
+    profiler = models.CharField(max_length=20, verbose_name='Профилировщик',
+                                choices=ProfilingRequest.PROFILER_CHOICES)
+
+    created_timestamp = models.DateTimeField(auto_now_add=True)
+
+    duration = models.FloatField(verbose_name='Длительность, сек')
+
+    pstats_path = models.CharField(max_length=255, verbose_name='Файл pstats', blank=True, null=True)
+
+    collapsed_path = models.CharField(max_length=255, verbose_name='Файл collapsed stacks', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Профиль вычисления'
+        verbose_name_plural = 'Профили вычислений'
+
+
 class NSIDataImportStatus(models.Model):
     """
-    Состояние импорта данных из НСИ, необходимо для реализации пессимистичной блокировки
+    Состояние импорта данных из НСИ, необходимо для реализации пессимистичной блокировки и отображения
+    хода выполнения фонового импорта
     """
+    PHASE_QUEUED = 'queued'
+    PHASE_PARSE = 'parse'
+    PHASE_VALIDATE = 'validate'
+    PHASE_WRITE = 'write'
+    PHASE_ACK = 'ack'
+    PHASE_FINISHED = 'finished'
+    PHASE_FAILED = 'failed'
+
+    PHASE_CHOICES = [
+        (PHASE_QUEUED, 'В очереди'),
+        (PHASE_PARSE, 'Разбор файла'),
+        (PHASE_VALIDATE, 'Проверка изменений'),
+        (PHASE_WRITE, 'Запись в базу данных'),
+        (PHASE_ACK, 'Формирование квитанции'),
+        (PHASE_FINISHED, 'Завершен'),
+        (PHASE_FAILED, 'Ошибка'),
+    ]
+
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
 
     created_timestamp = models.DateTimeField(auto_now_add=True)
 
     is_pending = models.BooleanField(default=True)
 
+    phase = models.CharField(verbose_name='Фаза', max_length=20, choices=PHASE_CHOICES, default=PHASE_QUEUED)
+
+    records_processed = models.PositiveIntegerField(verbose_name='Обработано записей', default=0)
+
+    bytes_processed = models.BigIntegerField(verbose_name='Прочитано байт', default=0)
+
+    bytes_total = models.BigIntegerField(verbose_name='Размер файла, байт', default=0)
+
+    rate = models.FloatField(verbose_name='Скорость, записей/сек', default=0)
+
+    eta = models.FloatField(verbose_name='Оценка оставшегося времени, сек', blank=True, null=True)
+
+    phase_durations = models.JSONField(verbose_name='Длительность фаз, сек', default=dict)
+
+    result = models.TextField(verbose_name='Итоги импорта', blank=True, null=True)
+
+    rejected_report = models.JSONField(verbose_name='Отклоненные записи', blank=True, null=True)
+
+    updated_timestamp = models.DateTimeField(auto_now=True)
+
+    finished_timestamp = models.DateTimeField(blank=True, null=True)
+
+    def get_progress(self) -> Optional[float]:
+        """
+        Доля прочитанной части входного файла от 0 до 1
+        """
+        if not self.bytes_total:
+            return None
+        return min(self.bytes_processed / self.bytes_total, 1.0)
+
     class Meta:
         verbose_name = 'Статус импорта данных из НСИ'
         verbose_name_plural = 'Статусы импорта данных из НСИ'
 
 
+class NSIImportLock(models.Model):
+    """
+    Аренда (lease) на выполнение импорта данных из НСИ. Таблица содержит единственную запись, владелец
+    аренды периодически продлевает ее; аренда с истекшим сроком считается брошенной и может быть захвачена
+    """
+    owner = models.CharField(verbose_name='Владелец', max_length=100, blank=True, null=True)
+
+    acquired_timestamp = models.DateTimeField(verbose_name='Получена', blank=True, null=True)
+
+    expires_timestamp = models.DateTimeField(verbose_name='Истекает', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Блокировка импорта данных из НСИ'
+        verbose_name_plural = 'Блокировки импорта данных из НСИ'
+
+
 class Individual(models.Model):
     """
     Физическое лицо, экспортированное из 1С НСИ
@@ -302,6 +684,9 @@ class Individual(models.Model):
 
     code = models.CharField(verbose_name='Код', blank=True, null=True, max_length=100)
 
+    fingerprint = models.CharField(verbose_name='Отпечаток содержимого', max_length=40, blank=True, null=True,
+                                   editable=False)
+
     def __str__(self) -> str:
         return f'{self.name} {self.surname} {self.patronymic}'
 
@@ -333,9 +718,69 @@ class Employee(models.Model):
 
     is_primary_workplace = models.BooleanField(verbose_name='Основное место работы', default=True)
 
+    fingerprint = models.CharField(verbose_name='Отпечаток содержимого', max_length=40, blank=True, null=True,
+                                   editable=False)
+
     def __str__(self) -> str:
         return f'{self.employee_number} {self.full_name}'
 
     class Meta:
         verbose_name = 'Сотрудник'
         verbose_name_plural = 'Сотрудники'
+
+
+class PipelineInstance(models.Model):
+    """
+    Экземпляр конвейера моделей пользователя: параметры узлов и результаты последнего выполнения
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+
+    pipeline_id = models.CharField(max_length=50, verbose_name='Конвейер')
+
+    # Входные данные узлов, заданные пользователем: {узел: {поле: значение}}
+    input_data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    # Результаты узлов: {узел: output_data}
+    output_data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    # Узлы, результат которых при последнем выполнении взят из кэша
+    cached_nodes = models.JSONField(default=list)
+
+    error = models.TextField(blank=True, default='')
+
+    is_ready = models.BooleanField(default=False)
+
+    is_processing = models.BooleanField(default=False)
+
+    status_fields = ['is_ready', 'is_processing']
+
+    updated_timestamp = models.DateTimeField(auto_now=True)
+
+    def save_status(self) -> None:
+        self.save(update_fields=self.status_fields)
+
+    class Meta:
+        verbose_name = 'Конвейер моделей'
+        verbose_name_plural = 'Конвейеры моделей'
+        unique_together = ('user', 'pipeline_id')
+
+
+class PipelineNodeResult(models.Model):
+    """
+    Кэш результатов узлов конвейеров по хэшу класса модели и входных данных
+    """
+    input_hash = models.CharField(max_length=64, unique=True, verbose_name='Хэш входных данных')
+
+    math_model_id = models.CharField(max_length=50, verbose_name='Модель')
+
+    output_data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    hits_count = models.PositiveIntegerField(default=0, verbose_name='Количество обращений')
+
+    created_timestamp = models.DateTimeField(auto_now_add=True)
+
+    used_timestamp = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Последнее обращение')
+
+    class Meta:
+        verbose_name = 'Результат узла конвейера'
+        verbose_name_plural = 'Результаты узлов конвейеров'
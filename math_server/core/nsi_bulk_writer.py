@@ -0,0 +1,104 @@
+from typing import Any, List, NamedTuple, Tuple
+import logging
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models.base import ModelBase as DomainObjectModel
+from django.db.utils import DataError, IntegrityError
+
+
+logger = logging.getLogger(__name__)
+
+# Ограничение PostgreSQL на количество параметров в одном запросе
+MAX_QUERY_PARAMS = 65535
+
+
+class RejectedRecord(NamedTuple):
+    """
+    Запись выгрузки НСИ, отклоненная при сохранении в базу данных
+    """
+    model_name: str
+    nsi_id: str
+    reason: str
+
+
+def build_upsert_sql(model_class: DomainObjectModel, rows_count: int) -> str:
+    """
+    Формирует запрос INSERT ... ON CONFLICT (pk) DO UPDATE для rows_count записей.
+    Синтаксис поддерживается PostgreSQL и SQLite >= 3.24
+    """
+    opts = model_class._meta  # type: ignore
+    qn = connection.ops.quote_name
+    columns = [qn(f.column) for f in opts.concrete_fields]
+    row_placeholder = '({})'.format(', '.join(['%s'] * len(columns)))
+    pk_column = qn(opts.pk.column)
+    updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in columns if c != pk_column)
+    return (f'INSERT INTO {qn(opts.db_table)} ({", ".join(columns)}) '
+            f'VALUES {", ".join([row_placeholder] * rows_count)} '
+            f'ON CONFLICT ({pk_column}) DO UPDATE SET {updates}')
+
+
+def get_row_params(obj: Any) -> List[Any]:
+    """
+    Возвращает значения полей объекта, подготовленные для записи в базу данных
+    :raises ValidationError: в случае некорректного значения поля
+    """
+    return [f.get_db_prep_save(getattr(obj, f.attname), connection) for f in obj._meta.concrete_fields]
+
+
+def execute_upsert(model_class: DomainObjectModel, rows_params: List[List[Any]]) -> None:
+    """
+    Выполняет запись пакета строк в отдельной транзакции с немедленной проверкой внешних ключей
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(build_upsert_sql(model_class, len(rows_params)),
+                           [value for row_params in rows_params for value in row_params])
+        if any(f.is_relation for f in model_class._meta.concrete_fields):  # type: ignore
+            connection.check_constraints(table_names=[model_class._meta.db_table])  # type: ignore
+
+
+def bulk_upsert(model_class: DomainObjectModel, objects: List[Any],
+                batch_size: int) -> Tuple[List[Any], List[RejectedRecord]]:
+    """
+    Сохраняет объекты пакетами по batch_size записей, обновляя существующие записи с тем же первичным ключом.
+    Если пакет не может быть записан, его записи сохраняются по одной, чтобы отклонить только ошибочные
+    :return: сохраненные и отклоненные записи
+    """
+    model_name = model_class.__name__
+    fields = model_class._meta.concrete_fields  # type: ignore
+
+    # Повторные записи с одним ключом в пределах одного INSERT ... ON CONFLICT недопустимы, сохраняется последняя
+    unique_objects = list({obj.pk: obj for obj in objects}.values())
+    batch_size = max(min(batch_size, connection.ops.bulk_batch_size(fields, unique_objects) or batch_size,
+                         MAX_QUERY_PARAMS // len(fields)), 1)
+
+    written: List[Any] = []
+    rejected: List[RejectedRecord] = []
+    for batch_start in range(0, len(unique_objects), batch_size):
+        batch: List[Any] = []
+        rows_params: List[List[Any]] = []
+        for obj in unique_objects[batch_start:batch_start + batch_size]:
+            try:
+                rows_params.append(get_row_params(obj))
+                batch.append(obj)
+            except ValidationError as e:
+                rejected.append(RejectedRecord(model_name, obj.pk, '; '.join(e.messages)))
+            except (ValueError, TypeError) as e:
+                rejected.append(RejectedRecord(model_name, obj.pk, str(e)))
+
+        if not batch:
+            continue
+        try:
+            execute_upsert(model_class, rows_params)
+            written.extend(batch)
+        except (IntegrityError, DataError):
+            for obj, row_params in zip(batch, rows_params):
+                try:
+                    execute_upsert(model_class, [row_params])
+                    written.append(obj)
+                except (IntegrityError, DataError) as e:
+                    rejected.append(RejectedRecord(model_name, obj.pk, str(e).strip()))
+
+    for record in rejected:
+        logger.error(f'Rejected {record.model_name} "{record.nsi_id}": {record.reason}')
+    return written, rejected
@@ -1,27 +1,50 @@
-from typing import Dict, Generic, List, Optional, TypeVar
-import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import ElementTree, Element
+from typing import Any, BinaryIO, Deque, Dict, Iterator, List, Optional, Set, Tuple
+import hashlib
 import multiprocessing
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import xml.etree.ElementTree as ET
+from xml.etree.ElementTree import Element
 from pathlib import Path
 from django.conf import settings
-from .models import Employee, Individual
+from django.core.exceptions import ValidationError
+from django.db import connections
+from .models import Employee, Individual, NSIDataImportStatus
 import logging
 from datetime import date
 from django.db.models.base import ModelBase as DomainObjectModel
-from django.db import transaction
-from django.db.utils import IntegrityError
-from .models import Notification
-from django.template.loader import render_to_string
+from .nsi_bulk_writer import RejectedRecord
+from .nsi_import_lock import NSIImportLease
+from .nsi_bulk_writer import bulk_upsert
+from .nsi_sharding import Shard
+from .nsi_sharding import ShardReader
+from .nsi_sharding import split_file_to_shards
+from django.utils.html import escape
+from django.utils import timezone
+from contextlib import contextmanager
+from collections import deque
+from multiprocessing.pool import AsyncResult
+from multiprocessing.pool import Pool
 import time
 
 
 logger = logging.getLogger(__name__)
 
 
+XSI_TYPE_ATTRIBUTE = '{http://www.w3.org/2001/XMLSchema-instance}type'
+
+
 class ImportNSIDataError(RuntimeError):
     pass
 
 
+# Значения полей записи в виде пар (имя поля, значение)
+ParsedRecord = Tuple[Tuple[str, Any], ...]
+
+
 class NSIRecordsParser(object):
     """
     Общий класс для xml парсеров
@@ -33,33 +56,53 @@ class NSIRecordsParser(object):
         self.fields_ns = fields_ns
         self.fields_mapping = fields_mapping
         self.model_class = model_class
-        self.record_ns = '{http://www.w3.org/2001/XMLSchema-instance}'
 
-    def parse(self, xml_data: ElementTree) -> List[DomainObjectModel]:
-        parsed_objects = []
-        root = xml_data.getroot()
+    def parse_values(self, el: Element) -> ParsedRecord:
+        """
+        Извлекает значения полей из xml-элемента записи в виде пар (имя поля, значение).
+        Компактное представление используется для передачи записей из процессов разбора шардов
+        """
+        values = []
+        for f in el:
+            tag = f.tag.split('}')[1]
+            domain_object_field_name = self.fields_mapping.get(tag)
+            if domain_object_field_name:
+                if type(domain_object_field_name) == tuple and callable(domain_object_field_name[1]):
+                    values.append((domain_object_field_name[0], domain_object_field_name[1](f)))
+                else:
+                    values.append((domain_object_field_name, f.text))
+        return tuple(values)
 
-        for el in list(root):
-            if el.attrib[f'{self.record_ns}type'] == self.record_type:
-                parsed_object = self.model_class()  # type: ignore
-                for f in list(el):
-                    tag = f.tag.split('}')[1]
-                    domain_object_field_name = self.fields_mapping.get(tag)
-                    if domain_object_field_name:
-                        if type(domain_object_field_name) == tuple and callable(domain_object_field_name[1]):
-                            setattr(parsed_object, domain_object_field_name[0], domain_object_field_name[1](f))
-                        else:
-                            setattr(parsed_object, domain_object_field_name, f.text)
+    def build_model(self, values: ParsedRecord) -> DomainObjectModel:
+        """
+        Создает объект доменной модели из значений полей
+        """
+        parsed_object = self.model_class()  # type: ignore
+        for field_name, value in values:
+            setattr(parsed_object, field_name, value)
+        return parsed_object
 
-                parsed_objects.append(parsed_object)
-        return parsed_objects
+    def parse_record(self, el: Element) -> DomainObjectModel:
+        """
+        Создает объект доменной модели из xml-элемента записи
+        """
+        return self.build_model(self.parse_values(el))
 
 
-def individual_parser(xml_data: ElementTree, result: dict) -> None:
+def foreign_key_parser(node: Element) -> Optional[str]:
     """
-    Функция парсинга для объектов Individual
+    Извлекает значение id для внешнего ключа xml-записи
     """
-    fields_mapping = {
+    child_elements = list(node)
+    if child_elements:
+        return child_elements[0].text
+
+
+individual_parser = NSIRecordsParser(
+    record_type='d2p1:ФизическоеЛицо',
+    fields_ns='{http://replication-message-person.org}',
+    model_class=Individual,
+    fields_mapping={
         'ИдентификаторВБазе': 'nsi_id',
         'ПометкаУдаления': ('is_deleted', lambda s: s.text.capitalize()),
         'Имя': 'name',
@@ -70,30 +113,13 @@ def individual_parser(xml_data: ElementTree, result: dict) -> None:
         'СНИЛС': 'snils',
         'Код': 'code',
     }
+)
 
-    p = NSIRecordsParser(
-        record_type='d2p1:ФизическоеЛицо',
-        fields_ns='{http://replication-message-person.org}',
-        model_class=Individual,
-        fields_mapping=fields_mapping
-    )
-    result[Individual] = p.parse(xml_data)
-
-
-def foreign_key_parser(node: Element) -> Optional[str]:
-    """
-    Извлекает значение id для внешнего ключа xml-записи
-    """
-    child_elements = list(node)
-    if child_elements:
-        return child_elements[0].text
-
-
-def employeeParser(xml_data: ElementTree, result: dict) -> None:
-    """
-    Функция парсинга для объектов Employee
-    """
-    fields_mapping = {
+employee_parser = NSIRecordsParser(
+    record_type='d2p1:Сотрудник',
+    fields_ns='{http://replication-message-employee.org}',
+    model_class=Employee,
+    fields_mapping={
         'ИдентификаторВБазе': 'nsi_id',
         'ПометкаУдаления': ('is_deleted', lambda s: s.text.capitalize()),
         'ФизическоеЛицо': ('individual_id', foreign_key_parser),
@@ -104,81 +130,645 @@ def employeeParser(xml_data: ElementTree, result: dict) -> None:
         'ОсновноеМестоРаботы': ('is_primary_workplace', lambda s: s.text.capitalize()),
         'Код': 'code',
     }
+)
 
-    p = NSIRecordsParser(
-        record_type='d2p1:Сотрудник',
-        fields_ns='{http://replication-message-employee.org}',
-        model_class=Employee,
-        fields_mapping=fields_mapping
-    )
-    result[Employee] = p.parse(xml_data)
+# Парсеры записей в порядке сохранения в базу данных, по значению атрибута xsi:type
+RECORD_PARSERS = {p.record_type: p for p in (individual_parser, employee_parser)}
 
 
-def get_models_from_xml(exported_data_file_path: Path) -> Dict[DomainObjectModel, List[DomainObjectModel]]:
+class NSIImportProgress(object):
     """
-    Возвращает словарь объектов доменной модели, полученных путем парсинга входного файла
+    Ход выполнения импорта: текущая фаза, количество обработанных записей, скорость и оценка оставшегося времени.
+    Состояние сохраняется в NSIDataImportStatus не чаще settings.NSI_IMPORT_PROGRESS_SAVE_INTERVAL секунд,
+    чтобы опрос состояния клиентом не замедлял импорт. При сохранении продлевается аренда импорта
     """
-    manager = multiprocessing.Manager()
-    parsed_objects: Dict[DomainObjectModel, List[DomainObjectModel]] = manager.dict()
+
+    def __init__(self, status: Optional[NSIDataImportStatus] = None,
+                 lease: Optional[NSIImportLease] = None) -> None:
+        self.status = status
+        self.lease = lease
+        self.started = time.perf_counter()
+        self.saved = 0.0
+        self.phase = NSIDataImportStatus.PHASE_QUEUED
+        self.phase_durations: Dict[str, float] = {}
+        self.records_processed = 0
+        self.bytes_processed = 0
+        self.bytes_total = 0
+
+    @contextmanager
+    def measure(self, phase: str):
+        """
+        Учитывает длительность фазы импорта, фазы разных пакетов суммируются
+        """
+        self.phase = phase
+        self.save()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_durations[phase] = self.phase_durations.get(phase, 0.0) + time.perf_counter() - started
+
+    def get_rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.records_processed / elapsed if elapsed > 0 else 0.0
+
+    def get_eta(self) -> Optional[float]:
+        """
+        Оценивает оставшееся время по доле прочитанной части файла
+        """
+        if not self.bytes_total or not self.bytes_processed:
+            return None
+        elapsed = time.perf_counter() - self.started
+        return elapsed * (self.bytes_total - self.bytes_processed) / self.bytes_processed
+
+    def save(self, force: bool = False) -> None:
+        if self.lease:
+            self.lease.heartbeat()
+        if self.status is None:
+            return
+        now = time.perf_counter()
+        if not force and now - self.saved < settings.NSI_IMPORT_PROGRESS_SAVE_INTERVAL:
+            return
+        self.saved = now
+        self.status.phase = self.phase
+        self.status.records_processed = self.records_processed
+        self.status.bytes_processed = self.bytes_processed
+        self.status.bytes_total = self.bytes_total
+        self.status.rate = self.get_rate()
+        self.status.eta = self.get_eta()
+        self.status.phase_durations = {phase: round(d, 3) for phase, d in self.phase_durations.items()}
+        self.status.save(update_fields=['phase', 'records_processed', 'bytes_processed', 'bytes_total', 'rate',
+                                        'eta', 'phase_durations', 'updated_timestamp'])
+
+    def finish(self, phase: str, result: str, rejected_report: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Сохраняет итоговое состояние импорта и снимает блокировку
+        """
+        self.phase = phase
+        if self.status is None:
+            return
+        self.status.is_pending = False
+        self.status.result = result
+        self.status.rejected_report = rejected_report
+        self.status.finished_timestamp = timezone.now()
+        self.status.save(update_fields=['is_pending', 'result', 'rejected_report', 'finished_timestamp'])
+        self.save(force=True)
+
+
+def iter_record_elements(source: BinaryIO) -> Iterator[Element]:
+    """
+    Потоково разбирает xml и возвращает элементы записей верхнего уровня. После обработки записи
+    xml-элементы удаляются из дерева, поэтому потребление памяти не зависит от размера файла
+    """
+    depth = 0
+    root = None
+    for event, el in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = el
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            yield el
+            root.clear()
+
+
+def new_batch() -> Dict[DomainObjectModel, List[DomainObjectModel]]:
+    return {p.model_class: [] for p in RECORD_PARSERS.values()}
+
+
+def iter_models_from_xml(exported_data_file_path: Path, batch_size: int,
+                         progress: Optional[NSIImportProgress] = None
+                         ) -> Iterator[Dict[DomainObjectModel, List[DomainObjectModel]]]:
+    """
+    Потоково разбирает входной файл и возвращает объекты доменной модели пакетами не более batch_size записей
+    :param progress: при указании учитывает прочитанную часть файла
+    """
+    batch = new_batch()
+    batch_records_count = 0
 
     try:
-        with exported_data_file_path.open() as f:
-            xml_data = ET.parse(f, parser=ET.XMLParser(encoding="utf-8"))
+        with exported_data_file_path.open('rb') as f:
+            if progress:
+                progress.bytes_total = exported_data_file_path.stat().st_size
+            for el in iter_record_elements(f):
+                parser = RECORD_PARSERS.get(el.attrib.get(XSI_TYPE_ATTRIBUTE))
+                if not parser:
+                    continue
+                batch[parser.model_class].append(parser.parse_record(el))
+                batch_records_count += 1
+
+                if batch_records_count >= batch_size:
+                    if progress:
+                        progress.bytes_processed = f.tell()
+                    yield batch
+                    batch = new_batch()
+                    batch_records_count = 0
     except OSError as e:
         logger.error(f"Unable to read xml file, {e}")
         raise ImportNSIDataError("Ошибка чтения данных из НСИ!")
+    except ET.ParseError as e:
+        logger.error(f"Unable to parse xml file, {e}")
+        raise ImportNSIDataError("Ошибка разбора данных из НСИ!")
+
+    if progress:
+        progress.bytes_processed = progress.bytes_total
+    if batch_records_count:
+        yield batch
 
-    workers_pool = []
-    for worker, args in (
-        (individual_parser, (xml_data, parsed_objects)),
-            (employeeParser, (xml_data, parsed_objects)),):
-        p = multiprocessing.Process(target=worker, args=args)
-        p.start()
-        workers_pool.append(p)
 
-    for worker in workers_pool:
-        worker.join()
-    return parsed_objects
+def parse_shard(exported_data_file_path: Path, shard: Shard, header: bytes,
+                footer: bytes) -> List[Tuple[str, ParsedRecord]]:
+    """
+    Разбирает шард входного файла в отдельном процессе
+    :return: записи шарда в порядке следования в файле в виде пар (тип записи, значения полей)
+    """
+    records = []
+    with exported_data_file_path.open('rb') as f:
+        for el in iter_record_elements(ShardReader(f, shard, header, footer)):  # type: ignore
+            record_type = el.attrib.get(XSI_TYPE_ATTRIBUTE)
+            parser = RECORD_PARSERS.get(record_type)
+            if parser:
+                records.append((record_type, parser.parse_values(el)))
+    return records
 
 
-def save_models_to_database(models_dict: Dict[DomainObjectModel, List[DomainObjectModel]]) -> List[DomainObjectModel]:
+def create_parse_pool(workers: int) -> Pool:
     """
-    Содержит логику сохранения объектов доменной модели в базу данных приложения
+    Создает пул процессов разбора шардов. Процессы создаются fork, поэтому пул следует создавать до запуска
+    других потоков процесса: дочерний процесс наследует блокировки, захваченные другими потоками в момент fork
+    """
+    # Дочерние процессы не должны использовать унаследованное соединение с базой данных
+    connections.close_all()
+    return multiprocessing.get_context('fork').Pool(workers)
+
+
+def iter_models_from_xml_sharded(exported_data_file_path: Path, batch_size: int, workers: int,
+                                 progress: Optional[NSIImportProgress] = None, pool: Optional[Pool] = None
+                                 ) -> Iterator[Dict[DomainObjectModel, List[DomainObjectModel]]]:
+    """
+    Разбивает входной файл на шарды по границам записей и разбирает их в пуле из workers процессов.
+    Результаты объединяются в порядке следования шардов в файле, поэтому пакеты совпадают с результатом
+    iter_models_from_xml. Количество одновременно разбираемых шардов ограничено, чтобы результаты, которые
+    еще не записаны в базу данных, не накапливались в памяти
+    :param pool: пул процессов разбора, созданный вызывающим кодом (create_parse_pool), при отсутствии пул
+    создается на время разбора файла
     """
-    ack_records: List[DomainObjectModel] = []
     try:
-        with transaction.atomic():
-            individuals_list: List[DomainObjectModel] = models_dict.get(Individual, [])
-            for i in individuals_list:
-                i.save()  # type: ignore
-        ack_records = individuals_list
-    except IntegrityError as e:
-        logger.error(f'Integrity error: {e}')
-
-    # with transaction.atomic():
-    for e in models_dict.get(Employee, []):
+        sharded_file = split_file_to_shards(exported_data_file_path, settings.NSI_IMPORT_SHARD_SIZE)
+    except OSError as e:
+        logger.error(f"Unable to read xml file, {e}")
+        raise ImportNSIDataError("Ошибка чтения данных из НСИ!")
+    except ValueError as e:
+        logger.error(f"Unable to parse xml file, {e}")
+        raise ImportNSIDataError("Ошибка разбора данных из НСИ!")
+    if progress:
+        progress.bytes_total = exported_data_file_path.stat().st_size
+
+    batch = new_batch()
+    batch_records_count = 0
+    pending: Deque[Tuple[Shard, AsyncResult]] = deque()
+    shards = iter(sharded_file.shards)
+
+    own_pool = pool is None
+    if pool is None:
+        pool = create_parse_pool(workers)
+    try:
+        while True:
+            while len(pending) < workers * 2:
+                shard = next(shards, None)
+                if shard is None:
+                    break
+                pending.append((shard, pool.apply_async(parse_shard, (exported_data_file_path, shard,
+                                                                      sharded_file.header, sharded_file.footer))))
+            if not pending:
+                break
+
+            shard, result = pending.popleft()
+            try:
+                records = result.get()
+            except OSError as e:
+                logger.error(f"Unable to read xml file, {e}")
+                raise ImportNSIDataError("Ошибка чтения данных из НСИ!")
+            except ET.ParseError as e:
+                logger.error(f"Unable to parse xml file, {e}")
+                raise ImportNSIDataError("Ошибка разбора данных из НСИ!")
+
+            for record_type, values in records:
+                parser = RECORD_PARSERS[record_type]
+                batch[parser.model_class].append(parser.build_model(values))
+                batch_records_count += 1
+                if batch_records_count >= batch_size:
+                    yield batch
+                    batch = new_batch()
+                    batch_records_count = 0
+            if progress:
+                progress.bytes_processed = shard.end
+    finally:
+        if own_pool:
+            pool.terminate()
+
+    if progress:
+        progress.bytes_processed = progress.bytes_total
+    if batch_records_count:
+        yield batch
+
+
+# Количество значений первичного ключа в одном запросе при загрузке отпечатков существующих записей
+FINGERPRINTS_QUERY_CHUNK_SIZE = 900
+
+
+class NSIImportReport(object):
+    """
+    Итоги импорта данных НСИ
+    """
+
+    def __init__(self) -> None:
+        self.inserted_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.rejected: List[RejectedRecord] = []
+
+    def __str__(self) -> str:
+        return (f'добавлено: {self.inserted_count}, обновлено: {self.updated_count}, '
+                f'без изменений: {self.unchanged_count}, отклонено: {len(self.rejected)}')
+
+    def get_rejected_report(self, limit: int) -> Dict[str, Any]:
+        """
+        Сводка отклоненных записей: количество в разрезе моделей и первые limit записей с причинами
+        """
+        counts: Dict[str, int] = {}
+        for record in self.rejected:
+            counts[record.model_name] = counts.get(record.model_name, 0) + 1
+        return {
+            'total': len(self.rejected),
+            'by_model': counts,
+            'records': [record._asdict() for record in self.rejected[:limit]],
+        }
+
+
+def compute_fingerprint(obj: DomainObjectModel) -> Optional[str]:
+    """
+    Вычисляет отпечаток содержимого записи по нормализованным значениям полей
+    :return: sha1 в шестнадцатеричном виде, либо None, если значения полей некорректны
+    """
+    digest = hashlib.sha1()
+    for f in obj._meta.concrete_fields:  # type: ignore
+        if f.attname == 'fingerprint':
+            continue
         try:
-            e.save()  # type: ignore
-            ack_records.append(e)
-        except IntegrityError as e:
-            logger.error(f'Integrity error: {e}')
+            value = f.to_python(getattr(obj, f.attname))
+        except ValidationError:
+            return None
+        digest.update(b'\x00' if value is None else str(value).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def load_fingerprints(model_class: DomainObjectModel, nsi_ids: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Загружает отпечатки существующих записей пакетными запросами
+    """
+    fingerprints: Dict[str, Optional[str]] = {}
+    for chunk_start in range(0, len(nsi_ids), FINGERPRINTS_QUERY_CHUNK_SIZE):
+        chunk = nsi_ids[chunk_start:chunk_start + FINGERPRINTS_QUERY_CHUNK_SIZE]
+        fingerprints.update(model_class.objects.filter(pk__in=chunk).values_list('pk', 'fingerprint'))  # type: ignore
+    return fingerprints
+
+
+def load_existing_ids(model_class: DomainObjectModel, nsi_ids: List[str]) -> Set[str]:
+    """
+    Возвращает идентификаторы записей, существующих в базе данных, загружая их пакетными запросами
+    """
+    existing_ids: Set[str] = set()
+    for chunk_start in range(0, len(nsi_ids), FINGERPRINTS_QUERY_CHUNK_SIZE):
+        chunk = nsi_ids[chunk_start:chunk_start + FINGERPRINTS_QUERY_CHUNK_SIZE]
+        existing_ids.update(model_class.objects.filter(pk__in=chunk).values_list('pk', flat=True))  # type: ignore
+    return existing_ids
+
+
+def validate_references(model_class: DomainObjectModel, objects: List[DomainObjectModel],
+                        accepted_ids: Dict[DomainObjectModel, Set[str]]
+                        ) -> Tuple[List[DomainObjectModel], List[Tuple[DomainObjectModel, str]]]:
+    """
+    Проверяет ссылки объектов на записи других моделей до записи в базу данных. Ссылка корректна, если
+    запись принята в текущем пакете импорта (accepted_ids), либо существует в базе данных. Отсутствующие
+    в пакете записи загружаются одним пакетным запросом на каждое поле. Записи предыдущих пакетов файла
+    к этому моменту сохранены в базу данных, записи последующих пакетов проверяются после их сохранения
+    (см. DeferredRecords)
+    :return: объекты с корректными ссылками и объекты со ссылками на отсутствующие записи с описанием причины
+    """
+    valid_objects = objects
+    unresolved: List[Tuple[DomainObjectModel, str]] = []
+    for f in model_class._meta.concrete_fields:  # type: ignore
+        if not f.many_to_one:
+            continue
+        known_ids = accepted_ids.get(f.related_model, set())
+        referenced_ids = {getattr(obj, f.attname) for obj in valid_objects} - known_ids
+        referenced_ids.discard(None)
+        known_ids = known_ids | load_existing_ids(f.related_model, list(referenced_ids))
+
+        checked_objects = []
+        for obj in valid_objects:
+            value = getattr(obj, f.attname)
+            if value is None or value in known_ids:
+                checked_objects.append(obj)
+            else:
+                unresolved.append((obj, f'{f.verbose_name}: запись "{value}" отсутствует'))
+        valid_objects = checked_objects
+    return valid_objects, unresolved
+
+
+class DeferredRecords(object):
+    """
+    Записи, ссылающиеся на записи, которые еще не сохранены в базу данных. В выгрузке сотрудник может
+    предшествовать своему физическому лицу, в том числе в другом пакете, поэтому такие записи сохраняются
+    после записи всех пакетов файла. Из нескольких записей с одним идентификатором сохраняется последняя.
+    В памяти хранится не более memory_limit записей, остальные выгружаются во временную базу данных SQLite,
+    поэтому потребление памяти не зависит от размера файла, даже если все сотрудники предшествуют физическим
+    лицам. Временная база данных удаляется методом close()
+    """
+
+    def __init__(self, memory_limit: Optional[int] = None) -> None:
+        self.memory_limit = memory_limit or settings.NSI_IMPORT_BATCH_SIZE
+        self.records: Dict[DomainObjectModel, Dict[str, DomainObjectModel]] = {}
+        self.spill_path: Optional[Path] = None
+        self.spill: Optional[sqlite3.Connection] = None
+
+    def add(self, obj: DomainObjectModel) -> None:
+        if self.spill is not None:
+            self.spill.execute('DELETE FROM records WHERE model = ? AND pk = ?', (obj._meta.label, obj.pk))
+        self.records.setdefault(type(obj), {})[obj.pk] = obj
+        if sum(len(records) for records in self.records.values()) > self.memory_limit:
+            self.spill_records()
+
+    def spill_records(self) -> None:
+        if self.spill is None:
+            fd, path = tempfile.mkstemp(prefix='nsi_deferred_', suffix='.sqlite3')
+            os.close(fd)
+            self.spill_path = Path(path)
+            self.spill = sqlite3.connect(path, check_same_thread=False)
+            self.spill.execute('CREATE TABLE records (model TEXT, pk TEXT, data BLOB, PRIMARY KEY (model, pk))')
+        self.spill.executemany('INSERT OR REPLACE INTO records (model, pk, data) VALUES (?, ?, ?)', (
+            (model_class._meta.label, pk, pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+            for model_class, records in self.records.items() for pk, obj in records.items()))
+        self.records = {}
+
+    def discard(self, model_class: DomainObjectModel, objects: List[DomainObjectModel]) -> None:
+        """
+        Исключает отложенные записи, замененные более поздними записями с тем же идентификатором
+        """
+        records = self.records.get(model_class)
+        if records:
+            for obj in objects:
+                records.pop(obj.pk, None)
+        if self.spill is not None:
+            for chunk_start in range(0, len(objects), FINGERPRINTS_QUERY_CHUNK_SIZE):
+                chunk = [obj.pk for obj in objects[chunk_start:chunk_start + FINGERPRINTS_QUERY_CHUNK_SIZE]]
+                self.spill.execute(f'DELETE FROM records WHERE model = ? AND pk IN ({", ".join("?" * len(chunk))})',
+                                   [model_class._meta.label] + chunk)
+
+    def iter_batches(self, batch_size: int) -> Iterator[Dict[DomainObjectModel, List[DomainObjectModel]]]:
+        """
+        Возвращает отложенные записи пакетами не более batch_size записей и удаляет временную базу данных
+        """
+        batch = new_batch()
+        count = 0
+        if self.spill is not None:
+            model_classes = {model_class._meta.label: model_class for model_class in batch}
+            for label, data in self.spill.execute('SELECT model, data FROM records ORDER BY rowid'):
+                batch[model_classes[label]].append(pickle.loads(data))
+                count += 1
+                if count == batch_size:
+                    yield batch
+                    batch, count = new_batch(), 0
+        for model_class, records in self.records.items():
+            for obj in records.values():
+                batch[model_class].append(obj)
+                count += 1
+                if count == batch_size:
+                    yield batch
+                    batch, count = new_batch(), 0
+        if count:
+            yield batch
+        self.close()
+
+    def close(self) -> None:
+        self.records = {}
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+        if self.spill_path is not None:
+            self.spill_path.unlink(missing_ok=True)
+            self.spill_path = None
+
+    def __bool__(self) -> bool:
+        if any(self.records.values()):
+            return True
+        return self.spill is not None and self.spill.execute('SELECT 1 FROM records LIMIT 1').fetchone() is not None
+
+
+def save_models_to_database(models_dict: Dict[DomainObjectModel, List[DomainObjectModel]],
+                            report: NSIImportReport, progress: NSIImportProgress,
+                            deferred: Optional[DeferredRecords] = None) -> List[DomainObjectModel]:
+    """
+    Содержит логику сохранения объектов доменной модели в базу данных приложения.
+    Физические лица сохраняются раньше сотрудников, ссылающихся на них. Записываются только новые и
+    измененные записи, изменения определяются сравнением отпечатков содержимого. Записи со ссылками на
+    отсутствующие записи отклоняются до записи в базу данных
+    :param deferred: при указании записи со ссылками на отсутствующие записи не отклоняются, а откладываются
+    до сохранения всех пакетов файла, так как запись, на которую они ссылаются, может находиться в следующих
+    пакетах. Отложенные записи сохраняются повторными вызовами для пакетов deferred.iter_batches() без deferred
+    :return: принятые объекты, включая неизмененные, для которых формируется квитанция
+    """
+    ack_records: List[DomainObjectModel] = []
+    accepted_ids: Dict[DomainObjectModel, Set[str]] = {}
+    for parser in RECORD_PARSERS.values():
+        objects = models_dict.get(parser.model_class, [])
+        deferred_count = 0
+        if deferred is not None:
+            deferred.discard(parser.model_class, objects)
+        with progress.measure(NSIDataImportStatus.PHASE_VALIDATE):
+            existing_fingerprints = load_fingerprints(parser.model_class, [obj.pk for obj in objects])
+
+            changed_objects = []
+            accepted_objects = []
+            for obj in objects:
+                obj.fingerprint = compute_fingerprint(obj)
+                if obj.fingerprint is not None and existing_fingerprints.get(obj.pk) == obj.fingerprint:
+                    accepted_objects.append(obj)
+                    report.unchanged_count += 1
+                else:
+                    changed_objects.append(obj)
+
+            changed_objects, unresolved = validate_references(parser.model_class, changed_objects, accepted_ids)
+            if deferred is not None:
+                for obj, _ in unresolved:
+                    deferred.add(obj)
+                deferred_count = len(unresolved)
+                unresolved = []
+            invalid = [RejectedRecord(parser.model_class.__name__, obj.pk, reason) for obj, reason in unresolved]
+            if invalid:
+                logger.warning(f'{len(invalid)} {parser.model_class.__name__} records rejected due to broken '
+                               f'references, first: "{invalid[0].nsi_id}" ({invalid[0].reason})')
+            report.rejected.extend(invalid)
+
+        with progress.measure(NSIDataImportStatus.PHASE_WRITE):
+            written, rejected = bulk_upsert(parser.model_class, changed_objects,
+                                            settings.NSI_IMPORT_WRITE_BATCH_SIZE)
+        for obj in written:
+            if obj.pk in existing_fingerprints:
+                report.updated_count += 1
+            else:
+                report.inserted_count += 1
+        report.rejected.extend(rejected)
+        # Квитанция перечисляет записи в порядке следования в файле
+        positions = {id(obj): index for index, obj in enumerate(objects)}
+        accepted_objects.extend(written)
+        accepted_objects.sort(key=lambda obj: positions[id(obj)])
+        ack_records.extend(accepted_objects)
+        accepted_ids[parser.model_class] = {obj.pk for obj in accepted_objects}
+        progress.records_processed += len(objects) - deferred_count
     return ack_records
 
 
-def generate_ack_file(models: List[DomainObjectModel]) -> None:
+class AckFileWriter(object):
     """
-    Генерирует файл-квитанцию для сохраненных в базе данных объектов
+    Потоково формирует файл-квитанцию для сохраненных в базе данных объектов. Записи квитанции пишутся
+    во временный файл в каталоге квитанции по мере сохранения пакетов, после успешного завершения импорта
+    файл атомарно переименовывается в ack_file_path. При ошибке импорта временный файл удаляется.
+    Как и до потоковой записи, квитанция перечисляет сначала все физические лица, затем всех сотрудников
+    (порядок RECORD_PARSERS): записи последующих моделей накапливаются в отдельных временных файлах
+    и дописываются в квитанцию при ее завершении
     """
-    ack_xml = render_to_string('nsi_data_import/ack.xml', {'ack_records': models})
-    Path(settings.NSI_ACK_FILE_PATH).write_text(ack_xml)
+    HEADER = ('<?xml version="1.0" encoding="utf-8"?>\n'
+              '<ПереченьЗаписей xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+              'xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns="http://replication-messages.org">\n'
+              '<Запись xmlns:q1="http://Receipt.org" xsi:type="q1:ПереченьКвитанций">')
+    RECORD = '\n<q1:Запись><q1:ИдентификаторВБазе>{}</q1:ИдентификаторВБазе></q1:Запись>'
+    FOOTER = '\n</Запись>\n</ПереченьЗаписей>'
+
+    def __init__(self, ack_file_path: Path) -> None:
+        self.ack_file_path = ack_file_path
+        self.temp_file_path: Optional[str] = None
+        self.file = None
+        # Временные файлы записей моделей, следующих за первой моделью RECORD_PARSERS
+        self.section_files: Dict[DomainObjectModel, Any] = {}
 
+    def open(self) -> None:
+        fd, self.temp_file_path = tempfile.mkstemp(prefix=f'.{self.ack_file_path.name}.', suffix='.tmp',
+                                                   dir=str(self.ack_file_path.parent))
+        # mkstemp создает файл с правами 0600, квитанция должна быть доступна для чтения системе НСИ
+        os.chmod(self.temp_file_path, 0o644)
+        self.file = os.fdopen(fd, 'w', encoding='utf-8', newline='')
+        self.file.write(self.HEADER)
 
-def import_nsi_data_from_xml() -> None:
+    def write_records(self, models: List[DomainObjectModel]) -> None:
+        first_model_class = next(iter(RECORD_PARSERS.values())).model_class
+        for model_class in new_batch():
+            records = ''.join(self.RECORD.format(escape(obj.nsi_id)) for obj in models  # type: ignore
+                              if isinstance(obj, model_class))
+            if not records:
+                continue
+            if model_class is first_model_class:
+                self.file.write(records)  # type: ignore
+                continue
+            if model_class not in self.section_files:
+                self.section_files[model_class] = tempfile.TemporaryFile(
+                    'w+', encoding='utf-8', newline='', dir=str(self.ack_file_path.parent))
+            self.section_files[model_class].write(records)
+
+    def commit(self) -> None:
+        """
+        Дописывает окончание квитанции и атомарно заменяет ей файл ack_file_path
+        """
+        try:
+            for model_class in new_batch():
+                section_file = self.section_files.get(model_class)
+                if section_file is not None:
+                    section_file.seek(0)
+                    shutil.copyfileobj(section_file, self.file)
+            self.file.write(self.FOOTER)  # type: ignore
+            self.file.flush()  # type: ignore
+            os.fsync(self.file.fileno())  # type: ignore
+            self.file.close()  # type: ignore
+            os.replace(self.temp_file_path, str(self.ack_file_path))
+        finally:
+            self.abort()
+
+    def abort(self) -> None:
+        """
+        Удаляет временный файл незавершенной квитанции
+        """
+        if self.file is not None:
+            self.file.close()
+        for section_file in self.section_files.values():
+            section_file.close()
+        self.section_files = {}
+        if self.temp_file_path and os.path.exists(self.temp_file_path):
+            os.remove(self.temp_file_path)
+
+    def __enter__(self) -> 'AckFileWriter':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def is_parallel_parse(xml_file_path: Path) -> bool:
+    """
+    Проверяет, разбирается ли файл параллельно в пуле процессов
+    """
+    return settings.NSI_IMPORT_WORKERS > 1 and xml_file_path.is_file() and \
+        xml_file_path.stat().st_size >= settings.NSI_IMPORT_PARALLEL_MIN_FILE_SIZE
+
+
+def iter_models_from_file(xml_file_path: Path, progress: Optional[NSIImportProgress] = None,
+                          pool: Optional[Pool] = None) -> Iterator[Dict[DomainObjectModel, List[DomainObjectModel]]]:
+    """
+    Возвращает объекты доменной модели пакетами, большие файлы разбираются параллельно
+    :param pool: пул процессов разбора для больших файлов, см. iter_models_from_xml_sharded
+    """
+    if is_parallel_parse(xml_file_path):
+        return iter_models_from_xml_sharded(xml_file_path, settings.NSI_IMPORT_BATCH_SIZE,
+                                            settings.NSI_IMPORT_WORKERS, progress, pool)
+    return iter_models_from_xml(xml_file_path, settings.NSI_IMPORT_BATCH_SIZE, progress)
+
+
+def import_nsi_data_from_xml(progress: Optional[NSIImportProgress] = None) -> NSIImportReport:
     """
     Импорт данных из xml-файла систем НСИ
+    :param progress: ход выполнения импорта, при указании обновляется по фазам
     """
+    progress = progress or NSIImportProgress()
     xml_file_path = Path(settings.NSI_EXPORTED_DATA_FILE_PATH)
-    parsed_objects = get_models_from_xml(xml_file_path)
-    ack_records = save_models_to_database(parsed_objects)
-    generate_ack_file(ack_records)
-    time.sleep(30)
+    report = NSIImportReport()
+    deferred = DeferredRecords()
+    batches = iter_models_from_file(xml_file_path, progress)
+    try:
+        with AckFileWriter(Path(settings.NSI_ACK_FILE_PATH)) as ack_writer:
+            while True:
+                with progress.measure(NSIDataImportStatus.PHASE_PARSE):
+                    parsed_objects = next(batches, None)
+                if parsed_objects is None:
+                    break
+                ack_records = save_models_to_database(parsed_objects, report, progress, deferred)
+                with progress.measure(NSIDataImportStatus.PHASE_ACK):
+                    ack_writer.write_records(ack_records)
+            for deferred_objects in deferred.iter_batches(settings.NSI_IMPORT_BATCH_SIZE):
+                ack_records = save_models_to_database(deferred_objects, report, progress)
+                with progress.measure(NSIDataImportStatus.PHASE_ACK):
+                    ack_writer.write_records(ack_records)
+    except OSError as e:
+        logger.error(f"Unable to write ack file, {e}")
+        raise ImportNSIDataError("Ошибка записи квитанции!")
+    finally:
+        deferred.close()
+    logger.info(f'NSI data import finished: {report}, phases: {progress.phase_durations}')
+    return report
@@ -0,0 +1,110 @@
+# coding: utf-8
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import NSIDataImportStatus
+from .models import NSIImportLock
+
+
+logger = logging.getLogger(__name__)
+
+LOCK_ID = 1
+
+
+class NSIImportLeaseLost(RuntimeError):
+    pass
+
+
+def get_lease_owner(prefix: str) -> str:
+    return f'{prefix}:{socket.gethostname()}:{os.getpid()}'
+
+
+def ensure_import_lock() -> None:
+    """
+    Создает запись блокировки импорта при первом обращении
+    """
+    if not NSIImportLock.objects.filter(pk=LOCK_ID).exists():
+        try:
+            with transaction.atomic():
+                NSIImportLock.objects.create(pk=LOCK_ID)
+        except IntegrityError:
+            pass
+
+
+class NSIImportLease(object):
+    """
+    Аренда на выполнение импорта данных из НСИ. Захват и продление выполняются условными UPDATE единственной
+    записи NSIImportLock, поэтому работают одинаково для PostgreSQL и SQLite. Если владелец аварийно завершился
+    и перестал продлевать аренду, по истечении ttl она захватывается следующим импортом, а незавершенные
+    статусы импорта помечаются как прерванные
+    """
+
+    def __init__(self, owner: str, ttl: float) -> None:
+        self.owner = owner
+        self.ttl = ttl
+        self.renewed = 0.0
+
+    def acquire(self) -> bool:
+        ensure_import_lock()
+        now = timezone.now()
+        acquired = NSIImportLock.objects.filter(pk=LOCK_ID).filter(
+            Q(owner__isnull=True) | Q(expires_timestamp__lt=now) | Q(owner=self.owner)
+        ).update(owner=self.owner, acquired_timestamp=now, expires_timestamp=now + timedelta(seconds=self.ttl))
+        if not acquired:
+            return False
+        self.renewed = time.monotonic()
+        self.fail_abandoned_imports()
+        return True
+
+    def heartbeat(self) -> None:
+        """
+        Продлевает аренду, не чаще чем раз в треть ttl
+        :raises NSIImportLeaseLost: если аренда была захвачена другим импортом
+        """
+        if time.monotonic() - self.renewed < self.ttl / 3:
+            return
+        renewed = NSIImportLock.objects.filter(pk=LOCK_ID, owner=self.owner).update(
+            expires_timestamp=timezone.now() + timedelta(seconds=self.ttl))
+        if not renewed:
+            raise NSIImportLeaseLost(f'NSI import lease of "{self.owner}" is lost')
+        self.renewed = time.monotonic()
+
+    def release(self) -> None:
+        NSIImportLock.objects.filter(pk=LOCK_ID, owner=self.owner).update(owner=None, expires_timestamp=None)
+
+    @staticmethod
+    def fail_abandoned_imports() -> None:
+        """
+        Импорт выполняется только владельцем аренды, поэтому выполняющиеся на момент захвата аренды импорты
+        брошены аварийно завершившимся владельцем
+        """
+        abandoned = NSIDataImportStatus.objects.filter(is_pending=True).exclude(
+            phase=NSIDataImportStatus.PHASE_QUEUED)
+        for status in abandoned:
+            logger.warning(f'NSI data import with status id="{status.pk}" was abandoned, marking it as failed')
+        abandoned.update(is_pending=False, phase=NSIDataImportStatus.PHASE_FAILED, finished_timestamp=timezone.now(),
+                         result='Импорт прерван: процесс импорта аварийно завершился')
+
+
+def has_queued_imports() -> bool:
+    return NSIDataImportStatus.objects.filter(is_pending=True, phase=NSIDataImportStatus.PHASE_QUEUED).exists()
+
+
+def claim_queued_import():
+    """
+    Переводит самый ранний импорт из очереди в выполнение, вызывается владельцем аренды
+    :return: статус импорта, либо None, если очередь пуста
+    """
+    for status in NSIDataImportStatus.objects.select_related('user').filter(
+            is_pending=True, phase=NSIDataImportStatus.PHASE_QUEUED).order_by('created_timestamp'):
+        claimed = NSIDataImportStatus.objects.filter(pk=status.pk, phase=NSIDataImportStatus.PHASE_QUEUED).update(
+            phase=NSIDataImportStatus.PHASE_PARSE)
+        if claimed:
+            status.phase = NSIDataImportStatus.PHASE_PARSE
+            return status
+    return None
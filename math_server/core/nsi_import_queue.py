@@ -0,0 +1,62 @@
+# coding: utf-8
+import logging
+from django.conf import settings
+from .models import Notification
+from .models import NSIDataImportStatus
+from .nsi_data_import import ImportNSIDataError
+from .nsi_data_import import NSIImportProgress
+from .nsi_data_import import import_nsi_data_from_xml
+from .nsi_import_lock import NSIImportLease
+from .nsi_import_lock import claim_queued_import
+from .nsi_import_lock import has_queued_imports
+
+
+logger = logging.getLogger(__name__)
+
+
+def process_queued_imports(owner: str) -> None:
+    """
+    Выполняет импорты из очереди по одному, удерживая аренду импорта. Если аренда занята другим процессом,
+    очередь обрабатывается владельцем аренды после окончания текущего импорта
+    :param owner: идентификатор процесса для аренды
+    """
+    lease = NSIImportLease(owner, settings.NSI_IMPORT_LEASE_TTL)
+    while True:
+        if not lease.acquire():
+            return
+        try:
+            status = claim_queued_import()
+            if status:
+                run_nsi_data_import(status, lease)
+        finally:
+            lease.release()
+        # Импорт мог быть поставлен в очередь, пока аренда была занята
+        if not has_queued_imports():
+            return
+
+
+def run_nsi_data_import(status: NSIDataImportStatus, lease: NSIImportLease) -> None:
+    """
+    Выполняет импорт, сохраняет итоги в статус импорта и отправляет уведомление пользователю
+    """
+    progress = NSIImportProgress(status, lease)
+    try:
+        report = import_nsi_data_from_xml(progress)
+    except Exception as e:
+        if not isinstance(e, ImportNSIDataError):
+            logger.exception(f'NSI data import with status id="{status.pk}" failed')
+        progress.finish(NSIDataImportStatus.PHASE_FAILED, str(e))
+        Notification.objects.create(
+            user=status.user,
+            is_success=False,
+            description='Импорт данных НСИ: операция не выполнена!'
+        )
+        return
+
+    progress.finish(NSIDataImportStatus.PHASE_FINISHED, str(report),
+                    report.get_rejected_report(settings.NSI_IMPORT_REJECTED_REPORT_LIMIT))
+    Notification.objects.create(
+        user=status.user,
+        is_success=True,
+        description='Импорт данных НСИ: операция завершена успешно'
+    )
@@ -0,0 +1,238 @@
+# coding: utf-8
+import logging
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+from multiprocessing.pool import Pool
+from typing import Any, Callable, List, Optional
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from .nsi_data_import import AckFileWriter
+from .nsi_data_import import DeferredRecords
+from .nsi_data_import import ImportNSIDataError
+from .nsi_data_import import NSIImportProgress
+from .nsi_data_import import NSIImportReport
+from .nsi_data_import import create_parse_pool
+from .nsi_data_import import is_parallel_parse
+from .nsi_data_import import iter_models_from_file
+from .nsi_data_import import save_models_to_database
+from .nsi_import_lock import NSIImportLease
+
+
+logger = logging.getLogger(__name__)
+
+# Признак окончания потока данных в очереди между стадиями конвейера
+STOP = object()
+
+
+class InboxFile(object):
+    """
+    Файл выгрузки НСИ, обрабатываемый конвейером
+    """
+
+    def __init__(self, path: Path, lease: Optional[NSIImportLease] = None) -> None:
+        self.path = path
+        self.ack_path = get_ack_file_path(path)
+        self.report = NSIImportReport()
+        self.deferred = DeferredRecords()
+        self.progress = NSIImportProgress(lease=lease)
+        self.error: Optional[Exception] = None
+        self.ack_writer: Optional[AckFileWriter] = None
+
+
+class PipelineAborted(RuntimeError):
+    pass
+
+
+def get_ack_file_path(xml_file_path: Path) -> Path:
+    """
+    Возвращает путь к файлу-квитанции для файла выгрузки: Message_000_008*.xml -> Message_008_000*.xml
+    """
+    exported_prefix = Path(settings.NSI_EXPORTED_DATA_FILE_PATH).stem
+    ack_prefix = Path(settings.NSI_ACK_FILE_PATH).stem
+    return xml_file_path.with_name(xml_file_path.name.replace(exported_prefix, ack_prefix, 1))
+
+
+def list_inbox_files(inbox_dir: Path, pattern: str, settle_time: float) -> List[Path]:
+    """
+    Возвращает файлы выгрузки в порядке имен. Файлы, изменявшиеся за последние settle_time секунд,
+    пропускаются, так как могут еще записываться системой НСИ
+    """
+    now = time.time()
+    files = []
+    for path in sorted(inbox_dir.glob(pattern)):
+        try:
+            if path.is_file() and now - path.stat().st_mtime >= settle_time:
+                files.append(path)
+        except OSError:
+            continue
+    return files
+
+
+def archive_file(path: Path, archive_dir: Path) -> Path:
+    """
+    Перемещает обработанный файл в архив, к имени файла добавляется время обработки
+    """
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    archived_path = archive_dir / f'{path.stem}_{timezone.now():%Y%m%d_%H%M%S_%f}{path.suffix}'
+    shutil.move(str(path), str(archived_path))
+    return archived_path
+
+
+class NSIInboxPipeline(object):
+    """
+    Конвейер обработки файлов выгрузки НСИ: разбор -> проверка и запись в базу данных -> квитанция.
+    Стадии выполняются в отдельных потоках и связаны очередями ограниченного размера, поэтому разбор
+    следующего файла выполняется одновременно с записью в базу данных текущего, а потребление памяти
+    ограничено размером очередей
+    """
+
+    def __init__(self, archive_dir: Path, failed_dir: Path, queue_size: int,
+                 on_file_processed: Optional[Callable[[InboxFile], None]] = None,
+                 lease: Optional[NSIImportLease] = None) -> None:
+        self.archive_dir = archive_dir
+        self.lease = lease
+        self.failed_dir = failed_dir
+        self.parsed_queue: queue.Queue = queue.Queue(queue_size)
+        self.ack_queue: queue.Queue = queue.Queue(queue_size)
+        self.on_file_processed = on_file_processed
+        self.abort_event = threading.Event()
+        self.stage_error: Optional[BaseException] = None
+
+    def put(self, target_queue: queue.Queue, item: Any) -> None:
+        while True:
+            if self.abort_event.is_set():
+                raise PipelineAborted()
+            try:
+                target_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, source_queue: queue.Queue) -> Any:
+        while True:
+            if self.abort_event.is_set():
+                raise PipelineAborted()
+            try:
+                return source_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def run_stage(self, stage: Callable[[], None]) -> None:
+        try:
+            stage()
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            logger.exception('NSI inbox pipeline stage failed')
+            self.stage_error = e
+            self.abort_event.set()
+        finally:
+            connections.close_all()
+
+    def parse_stage(self, files: List[InboxFile], pool: Optional[Pool] = None) -> None:
+        for inbox_file in files:
+            try:
+                for batch in iter_models_from_file(inbox_file.path, inbox_file.progress, pool):
+                    self.put(self.parsed_queue, (inbox_file, batch))
+            except ImportNSIDataError as e:
+                inbox_file.error = e
+            self.put(self.parsed_queue, (inbox_file, None))
+        self.put(self.parsed_queue, STOP)
+
+    def write_stage(self) -> None:
+        while True:
+            item = self.get(self.parsed_queue)
+            if item is STOP:
+                self.put(self.ack_queue, STOP)
+                return
+            inbox_file, batch = item
+            if batch is not None:
+                batch = save_models_to_database(batch, inbox_file.report, inbox_file.progress, inbox_file.deferred)
+            else:
+                if not inbox_file.error:
+                    # Записи, ссылающиеся на записи из последующих пакетов, сохраняются после всех пакетов файла
+                    for deferred_batch in inbox_file.deferred.iter_batches(settings.NSI_IMPORT_BATCH_SIZE):
+                        self.put(self.ack_queue, (inbox_file, save_models_to_database(
+                            deferred_batch, inbox_file.report, inbox_file.progress)))
+                inbox_file.deferred.close()
+            self.put(self.ack_queue, (inbox_file, batch))
+
+    def ack_stage(self) -> None:
+        while True:
+            item = self.get(self.ack_queue)
+            if item is STOP:
+                return
+            inbox_file, ack_records = item
+            if inbox_file.error and ack_records is not None:
+                # Квитанция по файлу с ошибкой не формируется
+                continue
+            try:
+                if inbox_file.ack_writer is None:
+                    inbox_file.ack_writer = AckFileWriter(inbox_file.ack_path)
+                    inbox_file.ack_writer.open()
+                if ack_records is not None:
+                    inbox_file.ack_writer.write_records(ack_records)
+                    continue
+                if inbox_file.error:
+                    inbox_file.ack_writer.abort()
+                else:
+                    inbox_file.ack_writer.commit()
+            except OSError as e:
+                logger.error(f'Unable to write ack file "{inbox_file.ack_path}", {e}')
+                inbox_file.ack_writer.abort()  # type: ignore
+                inbox_file.error = ImportNSIDataError('Ошибка записи квитанции!')
+                if ack_records is not None:
+                    continue
+            self.finish_file(inbox_file)
+
+    def finish_file(self, inbox_file: InboxFile) -> None:
+        try:
+            archive_file(inbox_file.path, self.failed_dir if inbox_file.error else self.archive_dir)
+        except OSError as e:
+            logger.error(f'Unable to archive file "{inbox_file.path}", {e}')
+        if inbox_file.error:
+            logger.error(f'NSI file "{inbox_file.path.name}" import failed: {inbox_file.error}')
+        else:
+            logger.info(f'NSI file "{inbox_file.path.name}" imported: {inbox_file.report}')
+        if self.on_file_processed:
+            self.on_file_processed(inbox_file)
+
+    def run(self, paths: List[Path]) -> List[InboxFile]:
+        """
+        Обрабатывает файлы в переданном порядке
+        :raises: исключение стадии конвейера, если обработка была прервана
+        """
+        files = [InboxFile(path, self.lease) for path in paths]
+        # Пул процессов разбора больших файлов создается до запуска потоков стадий, так как процессы пула
+        # создаются fork и не должны наследовать блокировки, захваченные потоками стадий
+        pool = create_parse_pool(settings.NSI_IMPORT_WORKERS) if any(
+            is_parallel_parse(inbox_file.path) for inbox_file in files) else None
+        stages = [threading.Thread(target=self.run_stage, args=(self.write_stage,), daemon=True),
+                  threading.Thread(target=self.run_stage, args=(self.ack_stage,), daemon=True)]
+        for stage in stages:
+            stage.start()
+        try:
+            self.parse_stage(files, pool)
+        except PipelineAborted:
+            pass
+        except BaseException:
+            self.abort_event.set()
+            raise
+        finally:
+            for stage in stages:
+                stage.join()
+            if pool is not None:
+                pool.terminate()
+            for inbox_file in files:
+                inbox_file.deferred.close()
+        if self.stage_error:
+            # Незавершенные квитанции удаляются, файлы будут обработаны повторно
+            for inbox_file in files:
+                if inbox_file.ack_writer is not None:
+                    inbox_file.ack_writer.abort()
+            raise self.stage_error
+        return files
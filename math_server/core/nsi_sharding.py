@@ -0,0 +1,117 @@
+from typing import BinaryIO, List, NamedTuple, Optional
+from pathlib import Path
+
+
+# Начало записи верхнего уровня выгрузки НСИ. Вложенные элементы записей всегда содержат префикс пространства имен
+RECORD_START = '<Запись'.encode('utf-8')
+
+SCAN_CHUNK_SIZE = 64 * 1024
+
+
+class Shard(NamedTuple):
+    """
+    Диапазон байт входного файла, содержащий целое число записей
+    """
+    start: int
+    end: int
+
+
+class ShardedFile(NamedTuple):
+    """
+    Разбиение xml-файла на шарды. Заголовок (объявление xml и открывающий тег корневого элемента) и
+    окончание (закрывающий тег корневого элемента) дописываются к каждому шарду при разборе
+    """
+    header: bytes
+    footer: bytes
+    shards: List[Shard]
+
+
+def find_record_start(f: BinaryIO, offset: int, limit: int) -> Optional[int]:
+    """
+    Ищет начало ближайшей записи верхнего уровня, начиная с позиции offset и не далее позиции limit
+    """
+    f.seek(offset)
+    position = offset
+    tail = b''
+    while position < limit:
+        chunk = f.read(min(SCAN_CHUNK_SIZE, limit - position))
+        if not chunk:
+            return None
+        data = tail + chunk
+        data_start = position - len(tail)
+        index = data.find(RECORD_START)
+        while index != -1:
+            next_byte = data[index + len(RECORD_START):index + len(RECORD_START) + 1]
+            if next_byte in (b' ', b'>', b'\t', b'\r', b'\n'):
+                return data_start + index
+            if not next_byte and data_start + index + len(RECORD_START) < limit:
+                # Символ после имени тега еще не прочитан, поиск продолжится со следующего фрагмента
+                break
+            index = data.find(RECORD_START, index + 1)
+        position += len(chunk)
+        tail = data[-len(RECORD_START):]
+    return None
+
+
+def split_file_to_shards(file_path: Path, shard_size: int) -> ShardedFile:
+    """
+    Разбивает файл на диапазоны размером около shard_size байт по границам записей верхнего уровня
+    :raises ValueError: если файл не содержит записей
+    """
+    file_size = file_path.stat().st_size
+    with file_path.open('rb') as f:
+        content_start = find_record_start(f, 0, file_size)
+        if content_start is None:
+            raise ValueError(f'File "{file_path}" contains no records')
+
+        # Корневой элемент закрывается последним закрывающим тегом файла
+        tail_start = max(file_size - SCAN_CHUNK_SIZE, content_start)
+        f.seek(tail_start)
+        tail = f.read()
+        content_end = tail_start + tail.rfind(b'</')
+        if content_end < tail_start:
+            raise ValueError(f'File "{file_path}" has no closing root tag')
+
+        f.seek(0)
+        header = f.read(content_start)
+        f.seek(content_end)
+        footer = f.read()
+
+        boundaries = [content_start]
+        while True:
+            boundary = find_record_start(f, boundaries[-1] + max(shard_size, 1), content_end)
+            if boundary is None:
+                break
+            boundaries.append(boundary)
+        boundaries.append(content_end)
+
+    return ShardedFile(header, footer, [Shard(start, end) for start, end in zip(boundaries, boundaries[1:])])
+
+
+class ShardReader(object):
+    """
+    Файлоподобный объект для потокового разбора шарда: возвращает заголовок, байты шарда из файла и окончание,
+    не загружая шард в память целиком
+    """
+
+    def __init__(self, f: BinaryIO, shard: Shard, header: bytes, footer: bytes) -> None:
+        self.f = f
+        self.remaining = shard.end - shard.start
+        self.prefix = header
+        self.suffix = footer
+        f.seek(shard.start)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self.prefix) + self.remaining + len(self.suffix)
+        if self.prefix:
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+            return data
+        if self.remaining:
+            data = self.f.read(min(size, self.remaining))
+            if not data:
+                raise OSError('Unexpected end of file')
+            self.remaining -= len(data)
+            return data
+        data, self.suffix = self.suffix[:size], self.suffix[size:]
+        return data
@@ -0,0 +1,327 @@
+# coding: utf-8
+import hashlib
+import json
+import multiprocessing
+import queue
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .metrics import CALCULATION_METRIC
+from .metrics import record_duration
+from .models import BaseMathModel
+from .models import CalculationError
+from .models import PipelineNodeResult
+
+
+# Интервал проверки работоспособности процессов пула при ожидании результатов узлов, сек
+POOL_POLL_INTERVAL = 1.0
+
+
+class PipelineNode(object):
+    """
+    Узел конвейера - математическая модель. Входные данные узла складываются из значений по умолчанию
+    из определения конвейера, значений, заданных пользователем, и результатов других узлов (links)
+    """
+
+    def __init__(self, name: str, model_path: str, input_data: Optional[dict] = None,
+                 links: Optional[Dict[str, str]] = None, verbose_name: Optional[str] = None) -> None:
+        self.name = name
+        self.model_path = model_path
+        try:
+            self.model_class = import_string(model_path)
+        except ImportError:
+            raise ImproperlyConfigured(f'Pipeline node "{name}" refers to unknown model "{model_path}"')
+        if not issubclass(self.model_class, BaseMathModel):
+            raise ImproperlyConfigured(f'Pipeline node "{name}": "{model_path}" is not a math model')
+        self.model_id = self.model_class.__name__.lower()
+        self.verbose_name = verbose_name or str(self.model_class._meta.verbose_name)
+        self.input_data = input_data or {}
+        # Поле входных данных -> (узел-источник, путь к значению в output_data источника)
+        self.links: Dict[str, Tuple[str, List[str]]] = {}
+        for field, reference in (links or {}).items():
+            source, _, path = reference.partition('.')
+            if not path:
+                raise ImproperlyConfigured(f'Pipeline node "{name}": link "{reference}" must be "node.output_key"')
+            self.links[field] = (source, path.split('.'))
+        self.dependencies: Set[str] = {source for source, _ in self.links.values()}
+
+    def get_input_data(self, params: Optional[dict], outputs: Dict[str, Any]) -> dict:
+        input_data = dict(self.input_data)
+        input_data.update(params or {})
+        for field, (source, path) in self.links.items():
+            input_data[field] = get_output_value(outputs[source], path, f'{source}.{".".join(path)}')
+        return input_data
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'model_id': self.model_id,
+            'verbose_name': self.verbose_name,
+            'dependencies': sorted(self.dependencies),
+            'links': {field: f'{source}.{".".join(path)}' for field, (source, path) in self.links.items()},
+        }
+
+
+class Pipeline(object):
+    """
+    Конвейер моделей - ациклический граф узлов. Узлы упорядочиваются топологически при создании конвейера
+    """
+
+    def __init__(self, pipeline_id: str, verbose_name: str, nodes: List[PipelineNode]) -> None:
+        self.id = pipeline_id
+        self.verbose_name = verbose_name
+        self.nodes: Dict[str, PipelineNode] = {}
+        for node in nodes:
+            self.nodes[node.name] = node
+        for node in nodes:
+            unknown = node.dependencies - self.nodes.keys()
+            if unknown:
+                raise ImproperlyConfigured(f'Pipeline "{pipeline_id}": node "{node.name}" refers to unknown nodes '
+                                           f'{", ".join(sorted(unknown))}')
+        self.levels = self.get_levels()
+
+    @classmethod
+    def from_definition(cls, pipeline_id: str, definition: dict) -> 'Pipeline':
+        nodes = [PipelineNode(name, node_definition['model'], node_definition.get('input_data'),
+                              node_definition.get('links'), node_definition.get('verbose_name'))
+                 for name, node_definition in definition['nodes'].items()]
+        return cls(pipeline_id, definition.get('verbose_name', pipeline_id), nodes)
+
+    def get_levels(self) -> List[List[PipelineNode]]:
+        """
+        Разбивает узлы на уровни: узлы уровня зависят только от узлов предыдущих уровней
+        и могут вычисляться параллельно
+        """
+        levels = []
+        done: Set[str] = set()
+        remaining = list(self.nodes.values())
+        while remaining:
+            level = [node for node in remaining if node.dependencies <= done]
+            if not level:
+                raise ImproperlyConfigured(f'Pipeline "{self.id}" contains a cycle between nodes '
+                                           f'{", ".join(node.name for node in remaining)}')
+            levels.append(level)
+            done.update(node.name for node in level)
+            remaining = [node for node in remaining if node.name not in done]
+        return levels
+
+    def get_root_nodes(self) -> List[PipelineNode]:
+        return self.levels[0]
+
+    def get_model_ids(self) -> Set[str]:
+        return {node.model_id for node in self.nodes.values()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'verbose_name': self.verbose_name,
+            'nodes': [node.to_dict() for level in self.levels for node in level],
+        }
+
+
+_pipelines: Optional[Dict[str, Pipeline]] = None
+
+
+def get_pipelines() -> Dict[str, Pipeline]:
+    """
+    Возвращает конвейеры, объявленные в settings.MATH_PIPELINES_AVAILABLE
+    """
+    global _pipelines
+    if _pipelines is None:
+        _pipelines = {pipeline_id: Pipeline.from_definition(pipeline_id, definition)
+                      for pipeline_id, definition in getattr(settings, 'MATH_PIPELINES_AVAILABLE', {}).items()}
+    return _pipelines
+
+
+def get_output_value(output_data: Any, path: List[str], reference: str) -> Any:
+    value = output_data
+    for key in path:
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise CalculationError(f'Отсутствует результат “{reference}”')
+    return value
+
+
+def normalize_data(data: Any) -> Any:
+    """
+    Приводит данные к виду, в котором они хранятся в JSONField: даты и Decimal - к строкам
+    """
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def get_input_hash(model_path: str, algorithm_version: int, input_data: dict) -> str:
+    """
+    Возвращает ключ кэша результата узла. Версия алгоритма входит в ключ, поэтому после изменения алгоритма
+    модели результаты ее узлов вычисляются заново
+    """
+    payload = json.dumps([model_path, algorithm_version, input_data], cls=DjangoJSONEncoder, sort_keys=True,
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def calculate_node(model_path: str, input_data: dict) -> Tuple[Any, float, int]:
+    """
+    Вычисляет модель узла. Выполняется, в том числе, в дочернем процессе, поэтому не обращается к базе данных
+    :return: результат вычисления, длительность вычисления, размер входных данных
+    """
+    model_instance = import_string(model_path)(input_data=input_data)
+    started = time.perf_counter()
+    output_data = model_instance.calculate()
+    duration = time.perf_counter() - started
+    return normalize_data(output_data), duration, model_instance.get_input_size()
+
+
+def load_node_result(input_hash: str) -> Optional[Any]:
+    output_data = PipelineNodeResult.objects.filter(input_hash=input_hash).values_list(
+        'output_data', flat=True).first()
+    if output_data is not None:
+        PipelineNodeResult.objects.filter(input_hash=input_hash).update(hits_count=F('hits_count') + 1,
+                                                                        used_timestamp=timezone.now())
+    return output_data
+
+
+def save_node_result(input_hash: str, node: PipelineNode, output_data: Any) -> None:
+    PipelineNodeResult.objects.bulk_create([PipelineNodeResult(
+        input_hash=input_hash, math_model_id=node.model_id, output_data=output_data)], ignore_conflicts=True)
+
+
+def prune_node_results() -> int:
+    """
+    Удаляет результаты узлов, к которым не обращались дольше PIPELINE_RESULT_TTL
+    """
+    expired = timezone.now() - timedelta(seconds=settings.PIPELINE_RESULT_TTL)
+    deleted_count, _ = PipelineNodeResult.objects.filter(used_timestamp__lt=expired).delete()
+    return deleted_count
+
+
+class PipelineRunner(object):
+    """
+    Выполняет конвейер: узел вычисляется, как только готовы результаты узлов, от которых он зависит.
+    Результат узла ищется в кэше по хэшу модели, версии алгоритма и входных данных, поэтому изменение
+    параметров узла не приводит к повторному вычислению предшествующих узлов. Если одновременно требуется
+    вычислить несколько независимых узлов и workers > 1, узлы вычисляются в пуле процессов
+    """
+
+    def __init__(self, pipeline: Pipeline, workers: int) -> None:
+        self.pipeline = pipeline
+        self.workers = workers
+        self.outputs: Dict[str, Any] = {}
+        self.cached_nodes: List[str] = []
+        self.calculated_nodes: List[str] = []
+
+    def get_node_input(self, node: PipelineNode, params: dict) -> Tuple[dict, str]:
+        """
+        Формирует входные данные узла
+        :return: входные данные и их хэш
+        """
+        try:
+            input_data = normalize_data(node.get_input_data(params.get(node.name), self.outputs))
+        except CalculationError as e:
+            raise CalculationError(f'{node.verbose_name}: {e}')
+        return input_data, get_input_hash(node.model_path, node.model_class.algorithm_version, input_data)
+
+    def finish(self, node: PipelineNode, input_hash: str, result: Tuple[Any, float, int]) -> None:
+        output_data, duration, input_size = result
+        record_duration(CALCULATION_METRIC, node.model_id, duration, input_size)
+        save_node_result(input_hash, node, output_data)
+        self.outputs[node.name] = output_data
+        self.calculated_nodes.append(node.name)
+
+    def calculate(self, node: PipelineNode, input_data: dict, input_hash: str) -> None:
+        try:
+            self.finish(node, input_hash, calculate_node(node.model_path, input_data))
+        except CalculationError as e:
+            raise CalculationError(f'{node.verbose_name}: {e}')
+
+    def wait_completed(self, pool: Any, worker_pids: Set[int], running: Dict[str, Tuple[str, float]],
+                       completed: queue.Queue) -> Tuple[str, Any, Optional[BaseException]]:
+        """
+        Ожидает завершения вычисления одного из узлов, выполняемых в пуле процессов. Задача, процесс которой
+        аварийно завершился, никогда не вернет результат, поэтому гибель процесса пула и превышение
+        PIPELINE_NODE_TIMEOUT прерывают выполнение конвейера
+        :return: имя узла, результат вычисления, исключение
+        """
+        while True:
+            try:
+                return completed.get(timeout=POOL_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+            # Пул заменяет аварийно завершившиеся процессы новыми, поэтому изменение состава процессов
+            # означает, что одна из задач потеряна
+            if any(process.exitcode is not None for process in pool._pool) or \
+                    {process.pid for process in pool._pool} != worker_pids:
+                names = ', '.join(self.pipeline.nodes[name].verbose_name for name in running)
+                raise CalculationError(f'{names}: процесс вычисления аварийно завершился')
+            now = time.monotonic()
+            for name, (_, started) in running.items():
+                if now - started > settings.PIPELINE_NODE_TIMEOUT:
+                    raise CalculationError(f'{self.pipeline.nodes[name].verbose_name}: превышено время вычисления')
+
+    def run(self, params: Optional[dict] = None) -> Dict[str, Any]:
+        """
+        :param params: входные данные узлов, заданные пользователем: {узел: {поле: значение}}
+        :return: результаты узлов
+        """
+        params = params or {}
+        pending = [node for level in self.pipeline.levels for node in level]
+        # Узел -> (хэш входных данных, время начала вычисления)
+        running: Dict[str, Tuple[str, float]] = {}
+        completed: queue.Queue = queue.Queue()
+        pool = None
+        worker_pids: Set[int] = set()
+        try:
+            while pending or running:
+                ready = [node for node in pending if node.dependencies <= self.outputs.keys()]
+                to_calculate = []
+                for node in ready:
+                    pending.remove(node)
+                    input_data, input_hash = self.get_node_input(node, params)
+                    output_data = load_node_result(input_hash)
+                    if output_data is not None:
+                        self.outputs[node.name] = output_data
+                        self.cached_nodes.append(node.name)
+                    else:
+                        to_calculate.append((node, input_data, input_hash))
+
+                if pool is None and (self.workers < 2 or len(to_calculate) < 2):
+                    # Независимые узлы, требующие вычисления, отсутствуют - пул процессов не создается
+                    for node, input_data, input_hash in to_calculate:
+                        self.calculate(node, input_data, input_hash)
+                    continue
+
+                if pool is None:
+                    # Дочерние процессы не должны использовать унаследованное соединение с базой данных
+                    connections.close_all()
+                    pool = multiprocessing.get_context('fork').Pool(min(self.workers, len(self.pipeline.nodes)))
+                    worker_pids = {process.pid for process in pool._pool}
+                for node, input_data, input_hash in to_calculate:
+                    running[node.name] = (input_hash, time.monotonic())
+                    pool.apply_async(calculate_node, (node.model_path, input_data),
+                                     callback=lambda result, name=node.name: completed.put((name, result, None)),
+                                     error_callback=lambda error, name=node.name: completed.put((name, None, error)))
+                if ready and any(node.dependencies <= self.outputs.keys() for node in pending):
+                    # Часть результатов взята из кэша, и зависящие от них узлы уже можно вычислять
+                    continue
+                if not running:
+                    break
+
+                name, result, error = self.wait_completed(pool, worker_pids, running, completed)
+                node = self.pipeline.nodes[name]
+                input_hash, _ = running.pop(name)
+                if error is not None:
+                    if isinstance(error, CalculationError):
+                        raise CalculationError(f'{node.verbose_name}: {error}')
+                    raise error
+                self.finish(node, input_hash, result)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return self.outputs
@@ -0,0 +1,139 @@
+# coding: utf-8
+import cProfile
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .models import CalculationProfile
+from .models import ProfilingRequest
+
+
+logger = logging.getLogger(__name__)
+
+# Время жизни закэшированного в процессе списка активных запросов на профилирование, сек
+ACTIVE_REQUESTS_CACHE_TTL = 5
+
+_active_requests_cache = {'expires': 0.0, 'requests': []}
+
+
+class StackSampler(object):
+    """
+    Сэмплирующий профилировщик: в отдельном потоке периодически снимает стек профилируемого потока
+    и накапливает его в формате collapsed stacks (для построения flame graph)
+    """
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+    def get_collapsed_stacks(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def get_active_profiling_requests() -> List[ProfilingRequest]:
+    """
+    Возвращает активные запросы на профилирование. Список кэшируется в процессе, чтобы проверка
+    не добавляла SQL-запрос к каждому вычислению
+    """
+    now = time.monotonic()
+    if _active_requests_cache['expires'] < now:
+        _active_requests_cache['requests'] = list(ProfilingRequest.objects.filter(remaining_count__gt=0))
+        _active_requests_cache['expires'] = now + ACTIVE_REQUESTS_CACHE_TTL
+    return _active_requests_cache['requests']
+
+
+def claim_profiling_request(math_model_id: str, user_id: int) -> Optional[ProfilingRequest]:
+    """
+    Резервирует одно вычисление из подходящего запроса на профилирование
+    :return: запрос на профилирование, либо None, если вычисление профилировать не требуется
+    """
+    for profiling_request in get_active_profiling_requests():
+        if profiling_request.matches(math_model_id, user_id):
+            claimed = ProfilingRequest.objects.filter(pk=profiling_request.pk, remaining_count__gt=0).update(
+                remaining_count=F('remaining_count') - 1)
+            if claimed:
+                return profiling_request
+            _active_requests_cache['expires'] = 0.0
+    return None
+
+
+@contextmanager
+def profile_calculation(profiling_request: ProfilingRequest, math_model_id: str, user):
+    """
+    Выполняет вложенный блок под профилировщиком и сохраняет результаты на диск
+    """
+    sampler = StackSampler(threading.get_ident(), settings.MATH_MODEL_PROFILING_SAMPLE_INTERVAL)
+    profiler = None
+    if profiling_request.profiler == ProfilingRequest.PROFILER_DETERMINISTIC:
+        profiler = cProfile.Profile()
+
+    started = time.perf_counter()
+    sampler.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        sampler.stop()
+        duration = time.perf_counter() - started
+        save_calculation_profile(profiling_request, math_model_id, user, duration, profiler, sampler)
+
+
+def save_calculation_profile(profiling_request: ProfilingRequest, math_model_id: str, user, duration: float,
+                             profiler: Optional[cProfile.Profile], sampler: StackSampler) -> None:
+    """
+    Сохраняет pstats и collapsed stacks в settings.MATH_MODEL_PROFILES_DIR и регистрирует профиль в базе данных
+    """
+    profiles_dir = Path(settings.MATH_MODEL_PROFILES_DIR)
+    file_name = f'{math_model_id}_{user.pk}_{timezone.now():%Y%m%d_%H%M%S_%f}'
+    try:
+        profiles_dir.mkdir(parents=True, exist_ok=True)
+        pstats_path = None
+        if profiler:
+            pstats_path = profiles_dir / f'{file_name}.pstats'
+            profiler.dump_stats(str(pstats_path))
+        collapsed_path = profiles_dir / f'{file_name}.collapsed.txt'
+        collapsed_path.write_text(sampler.get_collapsed_stacks(), encoding='utf-8')
+    except OSError as e:
+        logger.error(f'Unable to save calculation profile for model "{math_model_id}": {e}')
+        return
+
+    CalculationProfile.objects.create(
+        profiling_request=profiling_request,
+        user=user,
+        math_model_id=math_model_id,
+        profiler=profiling_request.profiler,
+        duration=duration,
+        pstats_path=str(pstats_path) if pstats_path else None,
+        collapsed_path=str(collapsed_path),
+    )
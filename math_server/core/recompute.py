@@ -0,0 +1,132 @@
+# coding: utf-8
+import copy
+import logging
+import time
+from typing import Dict, List, Optional, Set, Type
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .metrics import run_calculation
+from .models import BaseMathModel
+from .models import CalculationError
+from .models import Notification
+
+
+logger = logging.getLogger(__name__)
+
+
+class RecomputeReport(object):
+    """
+    Итоги пересчета устаревших результатов
+    """
+
+    def __init__(self) -> None:
+        self.recomputed: Dict[str, int] = {}
+        self.failed: Dict[str, int] = {}
+        self.skipped = 0
+
+    def add(self, counter: Dict[str, int], model_id: str) -> None:
+        counter[model_id] = counter.get(model_id, 0) + 1
+
+    def __str__(self) -> str:
+        return (f'пересчитано {sum(self.recomputed.values())}, ошибок {sum(self.failed.values())}, '
+                f'пропущено {self.skipped}')
+
+
+def get_math_model_classes() -> List[Type[BaseMathModel]]:
+    """
+    Возвращает классы моделей, объявленные в settings.MATH_MODELS_AVAILABLE
+    """
+    classes = []
+    for classes_list in settings.MATH_MODELS_AVAILABLE.values():
+        for class_path in classes_list:
+            try:
+                cls = import_string(class_path)
+            except ImportError:
+                logger.warning('Unable to load class "{}" defined in settings.MATH_MODELS_AVAILABLE'.format(
+                    class_path))
+                continue
+            if cls not in classes:
+                classes.append(cls)
+    return classes
+
+
+def count_stale_results(classes: Optional[List[Type[BaseMathModel]]] = None) -> Dict[str, int]:
+    return {cls.__name__.lower(): cls.get_stale_queryset().count() for cls in classes or get_math_model_classes()}
+
+
+def recompute_instance(cls: Type[BaseMathModel], pk: int, report: RecomputeReport) -> None:
+    """
+    Пересчитывает результат экземпляра модели. Экземпляры, которые в это время вычисляются по запросу
+    пользователя, пропускаются. Захват экземпляра - флаг is_processing при сохранении is_ready и входных данных,
+    с которыми начат пересчет. Запрос пользователя изменяет входные данные и сбрасывает is_ready или
+    is_processing, поэтому после такого запроса захват утрачивается и результат пересчета не записывается
+    """
+    model_id = cls.__name__.lower()
+    instance = cls.get_stale_queryset().filter(pk=pk).first()
+    if instance is None or not cls.get_stale_queryset().filter(
+            pk=pk, input_data=instance.input_data).update(is_processing=True):
+        report.skipped += 1
+        return
+    # Входные данные копируются: calculate() не должна, но может изменить instance.input_data
+    claimed = cls.objects.filter(pk=pk, is_processing=True, is_ready=True,
+                                 input_data=copy.deepcopy(instance.input_data),
+                                 output_algorithm_version=instance.output_algorithm_version)
+
+    try:
+        run_calculation(instance)
+    except CalculationError as e:
+        logger.warning('Unable to recompute stale result of model "{}" with id="{}". Reason "{}"'.format(
+            model_id, pk, e))
+        if not claimed.update(is_ready=False, is_processing=False):
+            report.skipped += 1
+            return
+        Notification.objects.create(
+            user=instance.user,
+            is_success=False,
+            math_model_id=model_id,
+            description='{}: результат устарел после обновления алгоритма, пересчет завершился ошибкой. {}'.format(
+                cls._meta.verbose_name, str(e))
+        )
+        report.add(report.failed, model_id)
+        return
+    except Exception:
+        claimed.update(is_processing=False)
+        raise
+
+    updated = claimed.update(output_data=instance.output_data,
+                             output_algorithm_version=instance.output_algorithm_version, is_processing=False)
+    if updated:
+        report.add(report.recomputed, model_id)
+    else:
+        report.skipped += 1
+
+
+def recompute_stale_results(batch_size: int, pause: float, limit: Optional[int] = None,
+                            classes: Optional[List[Type[BaseMathModel]]] = None) -> RecomputeReport:
+    """
+    Пересчитывает устаревшие результаты пакетами по batch_size экземпляров с паузой pause секунд
+    между пакетами, чтобы фоновый пересчет не вытеснял вычисления пользователей
+    :param limit: максимальное количество пересчитываемых экземпляров, None - без ограничения
+    """
+    report = RecomputeReport()
+    processed = 0
+    for cls in classes or get_math_model_classes():
+        attempted: Set[int] = set()
+        while limit is None or processed < limit:
+            count = batch_size if limit is None else min(batch_size, limit - processed)
+            pks = list(cls.get_stale_queryset().exclude(pk__in=attempted).order_by('pk').values_list(
+                'pk', flat=True)[:count])
+            if not pks:
+                break
+            if processed:
+                time.sleep(pause)
+            for pk in pks:
+                attempted.add(pk)
+                try:
+                    recompute_instance(cls, pk, report)
+                except Exception:
+                    logger.exception('Unexpected error while recomputing model "{}" with id="{}"'.format(
+                        cls.__name__.lower(), pk))
+                    report.add(report.failed, cls.__name__.lower())
+            processed += len(pks)
+    return report
@@ -0,0 +1,51 @@
+# coding: utf-8
+import hashlib
+from pathlib import Path
+from typing import Callable, Optional
+from django.conf import settings
+from django.core.cache import caches
+
+
+APP_DIR = Path(__file__).resolve().parent
+
+_cache_version: Optional[str] = None
+
+
+def compute_cache_version() -> str:
+    """
+    Вычисляет версию кэша ответов по файлам приложения (исходный код и шаблоны) и значениям настроек
+    из settings.RESPONSE_CACHE_VERSION_SETTINGS. Версия изменяется при развертывании и изменении настроек,
+    поэтому ранее закэшированные ответы не используются, в том числе в разделяемом между процессами кэше
+    """
+    digest = hashlib.sha1()
+    for name in settings.RESPONSE_CACHE_VERSION_SETTINGS:
+        digest.update(f'{name}={getattr(settings, name, None)!r}\n'.encode('utf-8'))
+    app_files = list(APP_DIR.glob('*.py')) + list((APP_DIR / 'templates').rglob('*.html'))
+    for path in sorted(app_files):
+        stat = path.stat()
+        digest.update(f'{path.relative_to(APP_DIR)}:{stat.st_mtime_ns}:{stat.st_size}\n'.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def get_cache_version() -> str:
+    global _cache_version
+    if _cache_version is None:
+        _cache_version = compute_cache_version()
+    return _cache_version
+
+
+def get_cached_content(key: str, render: Callable[[], bytes]) -> bytes:
+    """
+    Возвращает закэшированное содержимое ответа, при отсутствии в кэше формирует его функцией render.
+    Используется только для ответов, не зависящих от пользователя и параметров запроса. В режиме отладки
+    кэш не используется, чтобы изменения шаблонов отображались без перезапуска сервера
+    """
+    if settings.DEBUG:
+        return render()
+    cache = caches[settings.RESPONSE_CACHE_ALIAS]
+    version = get_cache_version()
+    content = cache.get(key, version=version)
+    if content is None:
+        content = render()
+        cache.set(key, content, timeout=None, version=version)
+    return content
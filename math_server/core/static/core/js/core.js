@@ -147,12 +147,17 @@
       restrict: 'E',
       scope: {
         table: '=',
-        isInvalid: '='
+        isInvalid: '=',
+        title: '@',
+        columns: '<'
       },
       transclude: true,
       controller: ($scope, excelClipboardParser, ruLocaleDateParser, numberParser) => {
         let modalInstance
 
+        $scope.title = $scope.title || 'Отбор от НИЗ / Обводнённость'
+        $scope.columns = $scope.columns || ['Дата', 'Отбор от НИЗ, м³', 'Обводнённость']
+
         $scope.showModal = () => {
           $scope.niz_table_temp = angular.copy($scope.table) || []
           $scope.validationError = undefined
@@ -476,6 +481,26 @@
 
     $scope.modelIsAvailable = false
 
+    $scope.isProcessing = false
+
+    $scope.pollModel = () => {
+      $scope.interval = setInterval(() => {
+        $http.get('/api/math_model/wellproductionmodel/status').then(response => {
+          if (!response.data.is_processing) {
+            clearInterval($scope.interval)
+            $http.get('/api/math_model/wellproductionmodel').then(response => {
+              $scope.modelInstance.output_data = response.data.output_data
+              $scope.isProcessing = false
+            })
+          }
+        })
+      }, 2000)
+    }
+
+    $scope.$on('$destroy', () => {
+      clearInterval($scope.interval)
+    })
+
     $http.get('/api/math_model/wellproductionmodel').then(response => {
       $scope.modelInstance = response.data
       if (isEmptyObjectChecker($scope.modelInstance.input_data)) {
@@ -487,6 +512,10 @@
           referent_models: []
         }
       }
+      if ($scope.modelInstance.is_processing) {
+        $scope.isProcessing = true
+        $scope.pollModel()
+      }
     }).then(successResponse => {
       $scope.modelIsAvailable = true
     }, errorResponse => {
@@ -496,7 +525,6 @@
       $scope.dataIsReady = true
     })
 
-    $scope.isProcessing = false
     $scope.chartSeries = {}
     $scope.validationErrors = {}
     $scope.copyToClipboardButtonsState = {}
@@ -506,19 +534,34 @@
       return new bootstrap.Tooltip(tooltipTriggerEl)
     })
 
+    // Прореженный на сервере график прогноза: количество точек соответствует ширине экрана
+    $scope.downsampledChart = undefined
+
+    $scope.loadChart = () => {
+      const points = Math.max(Math.min(window.innerWidth, 1000), 100)
+      $http.get('/api/math_model/wellproductionmodel/chart', { params: { points: points } }).then(response => {
+        $scope.downsampledChart = response.data
+        $scope.updateChartSeries()
+      })
+    }
+
     $scope.updateChartSeries = () => {
       const res = { labels: [], datasets: [] }
-      const productionSeries = { label: 'Прогноз', data: [] }
+      const chart = $scope.downsampledChart
+      if (!chart || !chart.datasets.length) {
+        $scope.chartSeries = res
+        return
+      }
 
-      angular.forEach($scope.modelInstance.output_data.production_table, row => {
-        productionSeries.data.push(row[2])
-        res.labels.push($filter('date')(row[0], 'dd.MM.yy'))
+      chart.labels.forEach(label => {
+        res.labels.push($filter('date')(label, 'dd.MM.yy'))
       })
-      res.datasets.push(productionSeries)
+      res.datasets.push(chart.datasets[0])
+      // Референтные модели берутся из редактируемых входных данных в точках прореженного графика
       angular.forEach($scope.modelInstance.input_data.referent_models, (model) => {
         res.datasets.push({
           label: model.name,
-          data: model.table
+          data: chart.indices.map(index => model.table[index])
         })
       })
       $scope.chartSeries = res
@@ -526,7 +569,7 @@
 
     $scope.$watch('modelInstance.output_data', (newValue) => {
       if (newValue) {
-        $scope.updateChartSeries()
+        $scope.loadChart()
       }
     }, true)
 
@@ -560,10 +603,141 @@
         $scope.isProcessing = true
         $http.put('/api/math_model/wellproductionmodel', $scope.modelInstance.input_data, { headers: { 'Content-Type': 'application/json', charset: 'utf-8' } }).then(
           response => {
-            $scope.modelInstance.output_data = response.data
+            if (response.status === 202) {
+              $scope.pollModel()
+            } else {
+              $scope.modelInstance.output_data = response.data
+              $scope.isProcessing = false
+            }
+          }, rejection => {
+            if (rejection.status === 400) $scope.validationErrors.bad_request_reason = rejection.data.bad_request_reason
+            $scope.isProcessing = false
+          })
+      }
+    }
+
+    $scope.onCopyToClipboardSuccess = (e) => {
+      const buttonId = e.trigger.id
+      if (buttonId) $scope.copyToClipboardButtonsState[e.trigger.id] = true
+      e.clearSelection()
+    }
+
+    $scope.onCopyToClipboardError = (e) => {
+      e.clearSelection()
+    }
+  })
+
+  mathServer.controller('vnswellmodelController', function ($scope, $http, numberParser, isEmptyObjectChecker, $filter) {
+    $scope.dataIsReady = false
+
+    $scope.modelIsAvailable = false
+
+    $scope.isProcessing = false
+
+    $scope.gtmTableColumns = ['Дата', 'Прирост дебита, м³/сут', 'Выход на эффект, мес']
+
+    $scope.pollModel = () => {
+      $scope.interval = setInterval(() => {
+        $http.get('/api/math_model/vnswellmodel/status').then(response => {
+          if (!response.data.is_processing) {
+            clearInterval($scope.interval)
+            $http.get('/api/math_model/vnswellmodel').then(response => {
+              $scope.modelInstance.output_data = response.data.output_data
+              $scope.isProcessing = false
+            })
+          }
+        })
+      }, 2000)
+    }
+
+    $scope.$on('$destroy', () => {
+      clearInterval($scope.interval)
+    })
+
+    $http.get('/api/math_model/vnswellmodel').then(response => {
+      $scope.modelInstance = response.data
+      if (isEmptyObjectChecker($scope.modelInstance.input_data)) {
+        $scope.modelInstance.input_data = {
+          date_begin: undefined,
+          start_debit: 0,
+          decline_rate: 0,
+          decline_exponent: 0,
+          horizon: 120,
+          gtm_table: []
+        }
+      } else if ($scope.modelInstance.input_data.date_begin) {
+        $scope.modelInstance.input_data.date_begin = new Date($scope.modelInstance.input_data.date_begin)
+      }
+      if ($scope.modelInstance.is_processing) {
+        $scope.isProcessing = true
+        $scope.pollModel()
+      }
+    }).then(successResponse => {
+      $scope.modelIsAvailable = true
+    }, errorResponse => {
+      $scope.modelIsAvailable = false
+      $scope.errorText = `Ошибка ${errorResponse.status}: ${errorResponse.data || errorResponse.statusText}`
+    }).finally(() => {
+      $scope.dataIsReady = true
+    })
+
+    $scope.chartSeries = {}
+    $scope.validationErrors = {}
+    $scope.copyToClipboardButtonsState = {}
+
+    const tooltipTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle="tooltip"]'))
+    tooltipTriggerList.map(tooltipTriggerEl => {
+      return new bootstrap.Tooltip(tooltipTriggerEl)
+    })
+
+    $scope.loadChart = () => {
+      const points = Math.max(Math.min(window.innerWidth, 1000), 100)
+      $http.get('/api/math_model/vnswellmodel/chart', { params: { points: points } }).then(response => {
+        $scope.chartSeries = {
+          labels: response.data.labels.map(label => $filter('date')(label, 'dd.MM.yy')),
+          datasets: response.data.datasets
+        }
+      })
+    }
+
+    $scope.$watch('modelInstance.output_data', (newValue) => {
+      if (newValue) {
+        $scope.loadChart()
+      }
+    }, true)
+
+    $scope.validateInput = () => {
+      $scope.validationErrors = {}
+      if (!$scope.modelInstance.input_data.date_begin) {
+        $scope.validationErrors.date_begin = 'Не указана дата ввода скважины в эксплуатацию'
+      }
+
+      const numberFields = ['start_debit', 'decline_rate', 'decline_exponent', 'horizon']
+      numberFields.forEach((fieldName) => {
+        try {
+          numberParser($scope.modelInstance.input_data[fieldName])
+        } catch (e) {
+          if (e instanceof ValidationError) {
+            $scope.validationErrors[fieldName] = `Ошибка валидации! ${e.message}`
+          } else throw e
+        }
+      })
+    }
+
+    $scope.calculate = () => {
+      $scope.validateInput()
+      if (isEmptyObjectChecker($scope.validationErrors)) {
+        $scope.isProcessing = true
+        $http.put('/api/math_model/vnswellmodel', $scope.modelInstance.input_data, { headers: { 'Content-Type': 'application/json', charset: 'utf-8' } }).then(
+          response => {
+            if (response.status === 202) {
+              $scope.pollModel()
+            } else {
+              $scope.modelInstance.output_data = response.data
+              $scope.isProcessing = false
+            }
           }, rejection => {
             if (rejection.status === 400) $scope.validationErrors.bad_request_reason = rejection.data.bad_request_reason
-          }).finally(() => {
             $scope.isProcessing = false
           })
       }
@@ -717,7 +891,11 @@
       if (newValue !== undefined) {
         if ($scope.modelInstance.is_processing === true) {
           $scope.interval = setInterval(() => {
-            $scope.loadModel()
+            $http.get('/api/math_model/asynccalculatormodel/status').then(response => {
+              if (!response.data.is_processing) {
+                $scope.loadModel()
+              }
+            })
           }, 2000)
         } else {
           clearInterval($scope.interval)
@@ -746,26 +924,56 @@
     $scope.importIsPending = false
     $scope.employeeToShow = {}
 
+    $scope.showImportStatus = (importStatus) => {
+      const timestamp = $filter('date')(importStatus.created_timestamp, 'dd.MM.yy в HH:mm')
+      $scope.pendingMessage = `Пользователь ${importStatus.user} инициировал импорт данных ${timestamp}`
+      $scope.importStatus = importStatus
+    }
+
+    $scope.pollImportStatus = () => {
+      clearInterval($scope.interval)
+      $scope.interval = setInterval(() => {
+        $http.get('/api/nsi_data_import').then(response => {
+          $scope.showImportStatus(response.data)
+          if (response.status != 202) {
+            clearInterval($scope.interval)
+            $scope.importIsPending = false
+            $scope.loadEmployees()
+          }
+        })
+      }, 2000)
+    }
+
+    $scope.$on('$destroy', () => {
+      clearInterval($scope.interval)
+    })
+
     $scope.importData = () => {
+      $scope.importIsPending = true
       $http.put('/api/nsi_data_import', {}, {
         headers: {
           'Content-Type': 'application/json',
           charset: 'utf-8'
         }
-      }).finally(() => {
+      }).then(response => {
+        $scope.showImportStatus(response.data)
+        if (response.status == 202) {
+          $scope.pollImportStatus()
+        } else {
+          $scope.importIsPending = false
+          $scope.loadEmployees()
+        }
+      }, () => {
         $scope.importIsPending = false
-        $scope.loadEmployees()
       })
-      $scope.importIsPending = true
     }
 
     $scope.getImportStatus = () => {
       $http.get('/api/nsi_data_import').then((response) => {
         if (response.status == 202) {
           $scope.importIsPending = true
-          const importStatus = response.data
-          const timestamp = $filter('date')(importStatus.created_timestamp, 'dd.MM.yy в HH:mm')
-          $scope.pendingMessage = `Пользователь ${importStatus.user} инициировал импорт данных ${timestamp}`
+          $scope.showImportStatus(response.data)
+          $scope.pollImportStatus()
         }
       })
     }
@@ -0,0 +1,43 @@
+# coding: utf-8
+import gzip
+import os
+import time
+from compressor.storage import CompressorFileStorage
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+
+class PrecompressedCompressorFileStorage(CompressorFileStorage):
+    """
+    Хранилище сборок django-compressor, дополнительно сохраняющее сжатые копии файлов (.gz и, при наличии
+    пакета Brotli, .br), которые веб-сервер отдает без сжатия на лету
+    """
+
+    precompressed_extensions = ('.js', '.css')
+
+    def save(self, name, content, max_length=None):
+        name = super().save(name, content, max_length=max_length)
+        if not name.endswith(self.precompressed_extensions):
+            return name
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        compressed_paths = [f'{path}.gz']
+        with open(compressed_paths[0], 'wb') as f:
+            # mtime=0 делает содержимое архива воспроизводимым от сборки к сборке
+            with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=9, mtime=0) as gz:
+                gz.write(data)
+        if brotli is not None:
+            compressed_paths.append(f'{path}.br')
+            with open(compressed_paths[1], 'wb') as f:
+                f.write(brotli.compress(data))
+
+        # Время изменения сжатых копий должно совпадать с исходным файлом, иначе веб-сервер считает их устаревшими
+        stamp = time.time()
+        for file_path in [path] + compressed_paths:
+            os.utime(file_path, (stamp, stamp))
+        return name
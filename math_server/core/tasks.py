@@ -4,6 +4,14 @@ from django.utils.module_loading import import_string
 from django.core.exceptions import ObjectDoesNotExist
 from .models import Notification
 from .models import CalculationError
+from .models import PipelineInstance
+from .metrics import run_calculation
+from .pipelines import PipelineRunner
+from .pipelines import get_pipelines
+from .pipelines import prune_node_results
+from .recompute import recompute_stale_results
+from .nsi_import_lock import get_lease_owner
+from .nsi_import_queue import process_queued_imports
 from django.conf import settings
 import os
 
@@ -37,15 +45,13 @@ def async_task_handler(args):
     model_internal_id = args.get('internal_id')
     cls = import_string(cls_path)
     try:
+        cls.objects.filter(id=model_internal_id).update(is_processing=True, is_ready=False)
         instance = cls.objects.get(id=model_internal_id)
         try:
-            instance.is_processing = True
-            instance.is_ready = False
-            instance.save()
-            instance.calculate()
+            run_calculation(instance)
             instance.is_ready = True
             instance.is_processing = False
-            instance.save()
+            instance.save(update_fields=cls.result_fields + cls.status_fields)
             Notification.objects.create(
                 user=instance.user,
                 is_success=True,
@@ -56,12 +62,138 @@ def async_task_handler(args):
             logger.warning('Calculation error in async model "{}" with id="{}" '.format(cls_path, model_internal_id))
             instance.is_processing = False
             instance.is_ready = False
-            instance.save()
+            instance.save_status()
             Notification.objects.create(
                 user=instance.user,
                 is_success=False,
                 math_model_id=cls.__name__.lower(),
                 description='{}: ошибка. {}'.format(cls._meta.verbose_name, str(e))
             )
+        except Exception:
+            # Флаги сбрасываются, иначе клиент бесконечно опрашивает состояние вычисления
+            logger.exception('Unexpected error in async model "{}" with id="{}"'.format(cls_path, model_internal_id))
+            instance.is_processing = False
+            instance.is_ready = False
+            instance.save_status()
+            Notification.objects.create(
+                user=instance.user,
+                is_success=False,
+                math_model_id=cls.__name__.lower(),
+                description='{}: ошибка. Внутренняя ошибка сервера'.format(cls._meta.verbose_name)
+            )
+            raise
     except ObjectDoesNotExist:
         logger.warning('Async model "{}" with id="{}" does not exist'.format(cls_path, model_internal_id))
+
+
+@spool
+def nsi_data_import_task_handler(args):
+    """
+    Spooler function for NSI data import, processes queued imports
+    :param args: input parameters, not used
+    """
+    process_queued_imports(get_lease_owner('spooler'))
+
+
+def prepare_spooler_args(**kwargs):
+    """
+    Encodes arguments to binary string fo using in uWSGI spooler
+    :param kwargs:arguments to encoding
+    :return: dict with encoded arguments
+    """
+    args = {}
+    for name, value in kwargs.items():
+        args[name.encode('utf-8')] = str(value).encode('utf-8')
+    return args
+
+
+def start_nsi_data_import_task() -> None:
+    """
+    Starts processing of queued NSI data imports
+    """
+    if settings.DEBUG:
+        nsi_data_import_task_handler(queue='nsi_data_import')  # type: ignore
+    else:
+        nsi_data_import_task_handler(prepare_spooler_args(queue='nsi_data_import'))
+
+
+@spool
+def pipeline_task_handler(args):
+    """
+    Spooler function for model pipelines
+    :param args: input parameters, must contains instance_id parameter (PipelineInstance id)
+    """
+    instance_id = args.get('instance_id')
+    try:
+        instance = PipelineInstance.objects.get(id=instance_id)
+    except ObjectDoesNotExist:
+        logger.warning('Pipeline instance with id="{}" does not exist'.format(instance_id))
+        return
+
+    pipeline = get_pipelines().get(instance.pipeline_id)
+    if pipeline is None:
+        logger.warning('Pipeline "{}" is not defined in settings.MATH_PIPELINES_AVAILABLE'.format(
+            instance.pipeline_id))
+        instance.is_processing = False
+        instance.save_status()
+        return
+
+    runner = PipelineRunner(pipeline, settings.PIPELINE_WORKERS)
+    try:
+        instance.output_data = runner.run(instance.input_data)
+        instance.cached_nodes = runner.cached_nodes
+        instance.error = ''
+        instance.is_ready = True
+        description = '{}: операция завершена успешно'.format(pipeline.verbose_name)
+    except CalculationError as e:
+        logger.warning('Calculation error in pipeline "{}" with id="{}"'.format(pipeline.id, instance_id))
+        instance.error = str(e)
+        instance.is_ready = False
+        description = '{}: ошибка. {}'.format(pipeline.verbose_name, str(e))
+    except Exception:
+        logger.exception('Unexpected error in pipeline "{}" with id="{}"'.format(pipeline.id, instance_id))
+        instance.error = 'Внутренняя ошибка сервера'
+        instance.is_ready = False
+        description = '{}: ошибка. {}'.format(pipeline.verbose_name, instance.error)
+    finally:
+        # Флаг выполнения сбрасывается при любом исходе, иначе конвейер остается заблокированным
+        instance.is_processing = False
+        instance.save(update_fields=['output_data', 'cached_nodes', 'error', 'updated_timestamp'] +
+                      instance.status_fields)
+    Notification.objects.create(
+        user=instance.user,
+        is_success=instance.is_ready,
+        math_model_id=pipeline.id,
+        description=description
+    )
+    prune_node_results()
+
+
+def start_pipeline_task(instance_id: int) -> None:
+    """
+    Starts pipeline calculation in uWSGI spooler
+    """
+    if settings.DEBUG:
+        pipeline_task_handler(instance_id=instance_id)  # type: ignore
+    else:
+        pipeline_task_handler(prepare_spooler_args(instance_id=instance_id))
+
+
+@spool
+def recompute_stale_task_handler(args):
+    """
+    Spooler function for throttled recomputation of results calculated by previous algorithm versions
+    :param args: input parameters, not used
+    """
+    report = recompute_stale_results(settings.RECOMPUTE_BATCH_SIZE, settings.RECOMPUTE_BATCH_PAUSE)
+    logger.info('Stale results recomputation finished: {}'.format(report))
+
+
+def start_recompute_stale_task() -> None:
+    """
+    Starts recomputation of stale results in uWSGI spooler
+    """
+    if settings.DEBUG:
+        recompute_stale_task_handler(queue='recompute_stale')  # type: ignore
+    else:
+        recompute_stale_task_handler(prepare_spooler_args(queue='recompute_stale'))
@@ -1,3 +1,1235 @@
-from django.test import TestCase
+import gzip
+import html
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from datetime import date, timedelta
+from typing import List, Optional
+from unittest import mock
+import numpy as np
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models.query import QuerySet
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .benchmarks import compare_with_baseline
+from .downsampling import downsample_series, lttb_indices
+from .input_schema import DateField, DecimalField, InputSchemaError, TableField
+from .loadtest.runner import LoadTestStatistics
+from .metrics import is_async_calculation_required, record_duration, run_calculation
+from .models import AsyncCalculatorModel, CalculationError, Employee, Individual, SimpleCalculatorModel
+from .models import WellProductionModel
+from .models import CalculationProfile, Notification, PerformanceMetric, PipelineInstance, PipelineNodeResult
+from .models import NSIDataImportStatus, NSIImportLock, ProfilingRequest, VNSWellModel
+from .nsi_bulk_writer import bulk_upsert
+from .nsi_data_import import DeferredRecords
+from .nsi_data_import import create_parse_pool
+from .nsi_data_import import import_nsi_data_from_xml
+from .nsi_data_import import iter_models_from_xml
+from .nsi_data_import import iter_models_from_xml_sharded
+from .nsi_import_lock import NSIImportLease
+from .nsi_import_lock import NSIImportLeaseLost
+from .nsi_import_queue import process_queued_imports
+from .nsi_import_queue import run_nsi_data_import
+from .nsi_inbox import NSIInboxPipeline
+from .nsi_sharding import RECORD_START
+from .nsi_sharding import split_file_to_shards
+from .pipelines import Pipeline, PipelineRunner
+from .profiling import _active_requests_cache
+from .recompute import recompute_stale_results
+from . import response_cache
+from .response_cache import get_cached_content
+from .storage import PrecompressedCompressorFileStorage
+from .tasks import async_task_handler, pipeline_task_handler
+from .vns_engine import WellParams, calculate_profiles
 
-# Create your tests here.
+
+NSI_FILE_HEADER = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                   '<ПереченьЗаписей xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                   'xmlns="http://replication-messages.org">\n')
+
+NSI_FILE_FOOTER = '</ПереченьЗаписей>\n'
+
+
+def individual_record(nsi_id: str, name: str = 'Иван') -> str:
+    return ('<Запись xmlns:d2p1="http://replication-message-person.org" xsi:type="d2p1:ФизическоеЛицо">'
+            f'<d2p1:ИдентификаторВБазе>{nsi_id}</d2p1:ИдентификаторВБазе>'
+            '<d2p1:ПометкаУдаления>false</d2p1:ПометкаУдаления>'
+            f'<d2p1:Имя>{name}</d2p1:Имя><d2p1:Фамилия>Иванов</d2p1:Фамилия>'
+            '<d2p1:ДатаРождения>1980-01-01</d2p1:ДатаРождения><d2p1:Код>0001</d2p1:Код></Запись>\n')
+
+
+def employee_record(nsi_id: str, individual_id: str, full_name: str = 'Сотрудник') -> str:
+    return ('<Запись xmlns:d2p1="http://replication-message-employee.org" xsi:type="d2p1:Сотрудник">'
+            f'<d2p1:ИдентификаторВБазе>{nsi_id}</d2p1:ИдентификаторВБазе>'
+            '<d2p1:ПометкаУдаления>false</d2p1:ПометкаУдаления>'
+            f'<d2p1:ФизическоеЛицо><d2p1:ИдентификаторВБазе>{individual_id}</d2p1:ИдентификаторВБазе>'
+            '</d2p1:ФизическоеЛицо>'
+            f'<d2p1:ТабельныйНомер>{nsi_id}</d2p1:ТабельныйНомер><d2p1:Наименование>{full_name}</d2p1:Наименование>'
+            '<d2p1:ДатаПриемаНаРаботу>2010-01-01</d2p1:ДатаПриемаНаРаботу>'
+            '<d2p1:ДатаУвольнения>2020-01-01</d2p1:ДатаУвольнения>'
+            '<d2p1:ОсновноеМестоРаботы>true</d2p1:ОсновноеМестоРаботы></Запись>\n')
+
+
+class NSIImportTestCase(TestCase):
+    """
+    Импорт выгрузки НСИ из временного каталога
+    """
+
+    def setUp(self) -> None:
+        self.data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.data_dir))
+
+    def write_file(self, records: List[str], name: str = 'Message_000_008.xml') -> Path:
+        path = self.data_dir / name
+        path.write_text(NSI_FILE_HEADER + ''.join(records) + NSI_FILE_FOOTER, encoding='utf-8')
+        return path
+
+    def import_file(self, records: List[str], batch_size: int = 5000, workers: int = 1,
+                    parallel_min_file_size: Optional[int] = None):
+        path = self.write_file(records)
+        with override_settings(NSI_EXPORTED_DATA_FILE_PATH=path,
+                               NSI_ACK_FILE_PATH=self.data_dir / 'Message_008_000.xml',
+                               NSI_IMPORT_BATCH_SIZE=batch_size, NSI_IMPORT_WORKERS=workers,
+                               NSI_IMPORT_PARALLEL_MIN_FILE_SIZE=parallel_min_file_size or 1024 ** 3):
+            return import_nsi_data_from_xml()
+
+    def read_ack_ids(self) -> List[str]:
+        ack = (self.data_dir / 'Message_008_000.xml').read_text(encoding='utf-8')
+        return [part.split('<')[0] for part in ack.split('<q1:ИдентификаторВБазе>')[1:]]
+
+
+class NSIImportOrderTest(NSIImportTestCase):
+
+    def test_employees_before_individuals_in_later_batches(self):
+        records = [employee_record(f'e{i}', f'i{i}') for i in range(10)] + \
+                  [individual_record(f'i{i}') for i in range(10)]
+        report = self.import_file(records, batch_size=5)
+
+        self.assertEqual(report.rejected, [])
+        self.assertEqual(report.inserted_count, 20)
+        self.assertEqual(Employee.objects.count(), 10)
+        self.assertEqual(Individual.objects.count(), 10)
+        self.assertCountEqual(self.read_ack_ids(), [f'e{i}' for i in range(10)] + [f'i{i}' for i in range(10)])
+
+    def test_deferred_record_replaced_by_later_version(self):
+        records = [employee_record('e0', 'i0', 'Старое'), individual_record('i0'),
+                   employee_record('e0', 'i0', 'Новое')]
+        report = self.import_file(records, batch_size=1)
+
+        self.assertEqual(report.rejected, [])
+        self.assertEqual(Employee.objects.get(pk='e0').full_name, 'Новое')
+
+    def test_deferred_records_spilled_to_disk(self):
+        deferred = DeferredRecords(memory_limit=5)
+        employees = [Employee(nsi_id=f'e{i}', individual_id=f'i{i}', full_name='Старое') for i in range(20)]
+        for employee in employees:
+            deferred.add(employee)
+            self.assertLessEqual(sum(len(records) for records in deferred.records.values()), 5)
+        spill_path = deferred.spill_path
+        self.assertTrue(spill_path.is_file())
+
+        # Записи, сохраненные позднее в пакете, и повторно отложенные записи заменяют ранее отложенные
+        deferred.discard(Employee, employees[:3])
+        deferred.add(Employee(nsi_id='e5', individual_id='i5', full_name='Новое'))
+        batches = list(deferred.iter_batches(4))
+
+        self.assertEqual([len(batch[Employee]) for batch in batches], [4, 4, 4, 4, 1])
+        objects = [obj for batch in batches for obj in batch[Employee]]
+        self.assertCountEqual([obj.pk for obj in objects], [f'e{i}' for i in range(3, 20)])
+        self.assertEqual([obj.full_name for obj in objects if obj.pk == 'e5'], ['Новое'])
+        self.assertFalse(spill_path.exists())
+        self.assertFalse(deferred)
+
+    def test_spill_file_removed_after_import(self):
+        records = [employee_record(f'e{i}', f'i{i}') for i in range(12)] + \
+                  [individual_record(f'i{i}') for i in range(12)]
+        spill_paths = []
+        create_temp_file = tempfile.mkstemp
+
+        def mkstemp(**kwargs):
+            fd, path = create_temp_file(**kwargs)
+            if kwargs.get('prefix') == 'nsi_deferred_':
+                spill_paths.append(Path(path))
+            return fd, path
+
+        with mock.patch('core.nsi_data_import.tempfile.mkstemp', side_effect=mkstemp):
+            report = self.import_file(records, batch_size=4)
+
+        self.assertEqual((report.inserted_count, report.rejected), (24, []))
+        self.assertEqual(len(spill_paths), 1)
+        self.assertFalse(spill_paths[0].exists())
+
+
+class NSIFingerprintTest(NSIImportTestCase):
+
+    def test_unchanged_export_skipped(self):
+        records = [individual_record(f'i{i}') for i in range(5)] + [employee_record(f'e{i}', f'i{i}') for i in range(5)]
+        self.import_file(records, batch_size=4)
+
+        with CaptureQueriesContext(connection) as queries:
+            report = self.import_file(records, batch_size=4)
+        self.assertEqual((report.inserted_count, report.updated_count, report.unchanged_count), (0, 0, 10))
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE')) and
+                  (Individual._meta.db_table in query['sql'] or Employee._meta.db_table in query['sql'])]
+        self.assertEqual(writes, [])
+        # Неизмененные записи подтверждаются квитанцией
+        self.assertCountEqual(self.read_ack_ids(), [f'i{i}' for i in range(5)] + [f'e{i}' for i in range(5)])
+
+    def test_changed_record_written(self):
+        self.import_file([individual_record('i0'), individual_record('i1')])
+        with CaptureQueriesContext(connection) as queries:
+            report = self.import_file([individual_record('i0'), individual_record('i1', name='Петр')])
+        self.assertEqual((report.updated_count, report.unchanged_count), (1, 1))
+        self.assertEqual(Individual.objects.get(pk='i1').name, 'Петр')
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE')) and Individual._meta.db_table in query['sql']]
+        self.assertEqual(len(writes), 1)
+
+
+# Шаблон квитанции nsi_data_import/ack.xml, которым квитанция формировалась до потоковой записи
+BASELINE_ACK_TEMPLATE = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<ПереченьЗаписей xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns="http://replication-messages.org">\n'
+    '<Запись xmlns:q1="http://Receipt.org" xsi:type="q1:ПереченьКвитанций">{% for record in ack_records %}\n'
+    '<q1:Запись><q1:ИдентификаторВБазе>{{record.nsi_id}}</q1:ИдентификаторВБазе></q1:Запись>{% endfor %}\n'
+    '</Запись>\n'
+    '</ПереченьЗаписей>'
+)
+
+
+class NSIAckFileTest(NSIImportTestCase):
+
+    def test_ack_file_matches_baseline_template(self):
+        individual_ids = ['i0', 'i&amp;1', 'i2', 'i3', 'i4']
+        employee_ids = ['e0', 'e1', 'e&lt;2&gt;', 'e3', 'e4']
+        records = []
+        for individual_id, employee_id in zip(individual_ids, employee_ids):
+            records += [individual_record(individual_id), employee_record(employee_id, individual_id)]
+        # Вторая выгрузка: часть записей не изменилась, пакеты содержат записи обеих моделей вперемешку
+        self.import_file(records[:4])
+        self.import_file(records, batch_size=3)
+
+        ack_records = [Individual(nsi_id=html.unescape(nsi_id)) for nsi_id in individual_ids] + \
+                      [Employee(nsi_id=html.unescape(nsi_id)) for nsi_id in employee_ids]
+        expected = Template(BASELINE_ACK_TEMPLATE).render(Context({'ack_records': ack_records}))
+        self.assertEqual((self.data_dir / 'Message_008_000.xml').read_bytes(), expected.encode('utf-8'))
+        self.assertEqual(list(self.data_dir.glob('*.tmp')), [])
+
+    def test_failed_import_keeps_previous_ack(self):
+        self.import_file([individual_record('i0')])
+        ack = (self.data_dir / 'Message_008_000.xml').read_bytes()
+        with mock.patch('core.nsi_data_import.bulk_upsert', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                self.import_file([individual_record('i1'), employee_record('e1', 'i1')])
+
+        self.assertEqual((self.data_dir / 'Message_008_000.xml').read_bytes(), ack)
+        self.assertEqual(sorted(path.name for path in self.data_dir.iterdir()),
+                         ['Message_000_008.xml', 'Message_008_000.xml'])
+
+
+class NSIImportProgressTest(NSIImportTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = get_user_model().objects.create_user('user', 'user@example.org', 'password')
+        self.lease = NSIImportLease('test', ttl=60)
+        self.assertTrue(self.lease.acquire())
+        self.status = NSIDataImportStatus.objects.create(user=self.user, phase=NSIDataImportStatus.PHASE_PARSE)
+
+    def run_import(self, records: List[str]) -> List[str]:
+        """
+        :return: фазы импорта в порядке сохранения состояния
+        """
+        path = self.write_file(records)
+        saved_phases = []
+        save = NSIDataImportStatus.save
+
+        def save_status(status, *args, **kwargs):
+            saved_phases.append(status.phase)
+            return save(status, *args, **kwargs)
+
+        with override_settings(NSI_EXPORTED_DATA_FILE_PATH=path, NSI_ACK_FILE_PATH=self.data_dir / 'ack.xml',
+                               NSI_IMPORT_BATCH_SIZE=2, NSI_IMPORT_PROGRESS_SAVE_INTERVAL=0), \
+                mock.patch.object(NSIDataImportStatus, 'save', autospec=True, side_effect=save_status):
+            run_nsi_data_import(self.status, self.lease)
+        self.status.refresh_from_db()
+        return saved_phases
+
+    def test_phases_and_progress_saved(self):
+        records = [individual_record(f'i{i}') for i in range(3)] + [employee_record(f'e{i}', f'i{i}') for i in range(3)]
+        phases = self.run_import(records)
+
+        self.assertEqual(list(dict.fromkeys(phases)), ['parse', 'validate', 'write', 'ack', 'finished'])
+        self.assertEqual((self.status.phase, self.status.is_pending), ('finished', False))
+        self.assertEqual(self.status.records_processed, 6)
+        self.assertEqual(self.status.bytes_processed, self.status.bytes_total)
+        self.assertEqual(self.status.bytes_total, (self.data_dir / 'Message_000_008.xml').stat().st_size)
+        self.assertEqual(set(self.status.phase_durations), {'parse', 'validate', 'write', 'ack'})
+        self.assertIn('добавлено: 6', self.status.result)
+        self.assertTrue(Notification.objects.get(user=self.user).is_success)
+
+    def test_lease_renewed_during_import(self):
+        # Продление аренды выполняется, если с предыдущего продления прошло больше трети ttl
+        expired = timezone.now() - timedelta(seconds=1)
+        NSIImportLock.objects.update(expires_timestamp=expired)
+        self.lease.renewed = time.monotonic() - 30
+        with mock.patch.object(self.lease, 'heartbeat', wraps=self.lease.heartbeat) as heartbeat:
+            self.run_import([individual_record('i0')])
+
+        self.assertGreater(heartbeat.call_count, 1)
+        self.assertGreater(NSIImportLock.objects.get().expires_timestamp, timezone.now() + timedelta(seconds=50))
+
+    def test_failed_import_reported(self):
+        path = self.data_dir / 'Message_000_008.xml'
+        path.write_text('<broken', encoding='utf-8')
+        with override_settings(NSI_EXPORTED_DATA_FILE_PATH=path,
+                               NSI_ACK_FILE_PATH=self.data_dir / 'ack.xml'):
+            run_nsi_data_import(self.status, self.lease)
+        self.status.refresh_from_db()
+        self.assertEqual((self.status.phase, self.status.is_pending), ('failed', False))
+        self.assertFalse(Notification.objects.get(user=self.user).is_success)
+
+
+class NSIImportLeaseTest(NSIImportTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = get_user_model().objects.create_user('user', 'user@example.org', 'password')
+
+    def expire_lease(self) -> None:
+        NSIImportLock.objects.update(expires_timestamp=timezone.now() - timedelta(seconds=1))
+
+    def test_stale_lease_taken_over(self):
+        owner = NSIImportLease('a', ttl=60)
+        contender = NSIImportLease('b', ttl=60)
+        self.assertTrue(owner.acquire())
+        self.assertFalse(contender.acquire())
+
+        # Владелец перестал продлевать аренду
+        self.expire_lease()
+        self.assertTrue(contender.acquire())
+        self.assertEqual(NSIImportLock.objects.get().owner, 'b')
+
+        owner.renewed = time.monotonic() - 60
+        with self.assertRaises(NSIImportLeaseLost):
+            owner.heartbeat()
+        owner.release()
+        self.assertEqual(NSIImportLock.objects.get().owner, 'b')
+
+    def test_abandoned_imports_failed_on_takeover(self):
+        self.assertTrue(NSIImportLease('a', ttl=60).acquire())
+        running = NSIDataImportStatus.objects.create(user=self.user, phase=NSIDataImportStatus.PHASE_WRITE)
+        queued = NSIDataImportStatus.objects.create(user=self.user, phase=NSIDataImportStatus.PHASE_QUEUED)
+
+        self.expire_lease()
+        with self.assertLogs('core.nsi_import_lock', 'WARNING'):
+            self.assertTrue(NSIImportLease('b', ttl=60).acquire())
+        running.refresh_from_db()
+        queued.refresh_from_db()
+        self.assertEqual((running.phase, running.is_pending), ('failed', False))
+        self.assertIn('аварийно завершился', running.result)
+        self.assertEqual((queued.phase, queued.is_pending), ('queued', True))
+
+    def test_requests_during_import_coalesced(self):
+        self.client.force_login(self.user)
+        running = NSIImportLease('other', ttl=60)
+        self.assertTrue(running.acquire())
+        with mock.patch('core.views.start_nsi_data_import_task') as start_task:
+            responses = [self.client.put('/api/nsi_data_import') for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [202] * 3)
+        self.assertEqual(start_task.call_count, 3)
+        queued = NSIDataImportStatus.objects.get(is_pending=True)
+        self.assertEqual(queued.phase, NSIDataImportStatus.PHASE_QUEUED)
+
+        # Очередь обрабатывается после освобождения аренды
+        running.release()
+        path = self.write_file([individual_record('i0')])
+        with override_settings(NSI_EXPORTED_DATA_FILE_PATH=path, NSI_ACK_FILE_PATH=self.data_dir / 'ack.xml'):
+            process_queued_imports('worker')
+        queued.refresh_from_db()
+        self.assertEqual((queued.phase, queued.is_pending), ('finished', False))
+        self.assertEqual(NSIDataImportStatus.objects.count(), 1)
+        self.assertIsNone(NSIImportLock.objects.get().owner)
+
+
+class NSIBulkUpsertTest(NSIImportTestCase):
+
+    def build_employee(self, nsi_id: str, individual_id: str, full_name: str = 'Сотрудник') -> Employee:
+        return Employee(nsi_id=nsi_id, individual_id=individual_id, full_name=full_name,
+                        employment_date=date(2010, 1, 1), dismissal_date=date(2020, 1, 1))
+
+    def test_report_counts(self):
+        records = [individual_record('i0'), individual_record('i1'), employee_record('e0', 'i0')]
+        report = self.import_file(records)
+        self.assertEqual((report.inserted_count, report.updated_count, report.unchanged_count), (3, 0, 0))
+
+        records = [individual_record('i0'), individual_record('i1', name='Петр'), individual_record('i2'),
+                   employee_record('e0', 'i0')]
+        report = self.import_file(records)
+        self.assertEqual((report.inserted_count, report.updated_count, report.unchanged_count), (1, 1, 2))
+        self.assertEqual(Individual.objects.get(pk='i1').name, 'Петр')
+        self.assertCountEqual(self.read_ack_ids(), ['i0', 'i1', 'i2', 'e0'])
+
+    def test_upsert_updates_existing_rows(self):
+        Individual.objects.create(nsi_id='i0', birth_date=date(1980, 1, 1))
+        written, rejected = bulk_upsert(Employee, [self.build_employee('e0', 'i0', 'Первый')], 100)
+        self.assertEqual((len(written), rejected), (1, []))
+
+        written, rejected = bulk_upsert(Employee, [self.build_employee('e0', 'i0', 'Второй'),
+                                                   self.build_employee('e1', 'i0')], 100)
+        self.assertEqual((len(written), rejected), (2, []))
+        self.assertEqual(Employee.objects.get(pk='e0').full_name, 'Второй')
+        self.assertEqual(Employee.objects.count(), 2)
+
+    def test_duplicate_keys_keep_last_record(self):
+        Individual.objects.create(nsi_id='i0', birth_date=date(1980, 1, 1))
+        written, _ = bulk_upsert(Employee, [self.build_employee('e0', 'i0', 'Первый'),
+                                            self.build_employee('e0', 'i0', 'Второй')], 100)
+        self.assertEqual([obj.full_name for obj in written], ['Второй'])
+        self.assertEqual(Employee.objects.get(pk='e0').full_name, 'Второй')
+
+    def test_failed_batch_falls_back_to_row_writes(self):
+        Individual.objects.create(nsi_id='i0', birth_date=date(1980, 1, 1))
+        objects = [self.build_employee('e0', 'i0'), self.build_employee('e1', 'missing'),
+                   self.build_employee('e2', 'i0'), self.build_employee('e3', 'i0')]
+        with self.assertLogs('core.nsi_bulk_writer', 'ERROR'):
+            written, rejected = bulk_upsert(Employee, objects, 3)
+
+        self.assertEqual([obj.pk for obj in written], ['e0', 'e2', 'e3'])
+        self.assertEqual([record.nsi_id for record in rejected], ['e1'])
+        self.assertCountEqual(Employee.objects.values_list('pk', flat=True), ['e0', 'e2', 'e3'])
+
+    def test_invalid_values_rejected_before_write(self):
+        Individual.objects.create(nsi_id='i0', birth_date=date(1980, 1, 1))
+        invalid = self.build_employee('e1', 'i0')
+        invalid.employment_date = 'not a date'
+        with self.assertLogs('core.nsi_bulk_writer', 'ERROR'):
+            written, rejected = bulk_upsert(Employee, [self.build_employee('e0', 'i0'), invalid], 100)
+
+        self.assertEqual([obj.pk for obj in written], ['e0'])
+        self.assertEqual([record.nsi_id for record in rejected], ['e1'])
+
+
+class NSIShardedParseTest(NSIImportTestCase):
+
+    def build_records(self, count: int) -> List[str]:
+        records = []
+        for i in range(count):
+            records.append(individual_record(f'i{i}', name=f'Имя{i}'))
+            records.append(employee_record(f'e{i}', f'i{i}', full_name=f'Сотрудник {i}'))
+        return records
+
+    def collect(self, batches) -> List[tuple]:
+        """
+        Значения полей разобранных объектов в порядке пакетов
+        """
+        result = []
+        for batch in batches:
+            for model_class, objects in batch.items():
+                for obj in objects:
+                    result.append((model_class.__name__, tuple(
+                        getattr(obj, f.attname) for f in model_class._meta.concrete_fields)))
+        return result
+
+    def test_shards_cover_records(self):
+        path = self.write_file(self.build_records(20))
+        # Малый размер фрагмента проверяет поиск начала записи на границе прочитанных фрагментов
+        with mock.patch('core.nsi_sharding.SCAN_CHUNK_SIZE', 40):
+            sharded_file = split_file_to_shards(path, 500)
+
+        content = path.read_bytes()
+        self.assertGreater(len(sharded_file.shards), 5)
+        self.assertEqual(sharded_file.header + b''.join(content[shard.start:shard.end]
+                                                        for shard in sharded_file.shards) + sharded_file.footer,
+                         content)
+        for shard in sharded_file.shards:
+            self.assertTrue(content[shard.start:shard.end].startswith(RECORD_START))
+
+    def test_sharded_parse_matches_sequential(self):
+        path = self.write_file(self.build_records(50))
+        sequential = self.collect(iter_models_from_xml(path, 7))
+        with override_settings(NSI_IMPORT_SHARD_SIZE=700):
+            sharded = self.collect(iter_models_from_xml_sharded(path, 7, 2))
+
+        self.assertEqual(len(sequential), 100)
+        self.assertEqual(sharded, sequential)
+
+    def test_sharded_import(self):
+        with override_settings(NSI_IMPORT_SHARD_SIZE=700):
+            report = self.import_file(self.build_records(30), batch_size=7, workers=2, parallel_min_file_size=1)
+
+        self.assertEqual((report.inserted_count, report.rejected), (60, []))
+        self.assertEqual(Employee.objects.filter(individual__isnull=False).count(), 30)
+
+
+class NSIInboxTest(TransactionTestCase):
+    """
+    Стадии конвейера используют отдельные соединения с базой данных, поэтому тесты выполняются без транзакции
+    """
+
+    def setUp(self) -> None:
+        self.data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.data_dir))
+        self.settings_override = override_settings(
+            NSI_EXPORTED_DATA_DIR=self.data_dir, NSI_EXPORTED_DATA_FILE_PATH=self.data_dir / 'Message_000_008.xml',
+            NSI_ACK_FILE_PATH=self.data_dir / 'Message_008_000.xml', NSI_ARCHIVE_DIR=self.data_dir / 'archive',
+            NSI_FAILED_DIR=self.data_dir / 'failed', NSI_INBOX_SETTLE_TIME=0, NSI_IMPORT_BATCH_SIZE=7,
+            NSI_IMPORT_WORKERS=2, NSI_IMPORT_PARALLEL_MIN_FILE_SIZE=1, NSI_IMPORT_SHARD_SIZE=700)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def write_file(self, name: str, count: int) -> Path:
+        records = [employee_record(f'{name}-e{i}', f'{name}-i{i}') for i in range(count)] + \
+                  [individual_record(f'{name}-i{i}') for i in range(count)]
+        path = self.data_dir / f'Message_000_008_{name}.xml'
+        path.write_text(NSI_FILE_HEADER + ''.join(records) + NSI_FILE_FOOTER, encoding='utf-8')
+        return path
+
+    def test_pipeline_with_parallel_parse(self):
+        paths = [self.write_file('a', 20), self.write_file('b', 20)]
+        with mock.patch('core.nsi_inbox.create_parse_pool', wraps=create_parse_pool) as create_pool, \
+                mock.patch('core.nsi_data_import.create_parse_pool') as create_file_pool:
+            files = NSIInboxPipeline(self.data_dir / 'archive', self.data_dir / 'failed', 2).run(paths)
+
+        # Один пул на все файлы создается до запуска потоков стадий
+        self.assertEqual(create_pool.call_count, 1)
+        create_file_pool.assert_not_called()
+
+        self.assertEqual([inbox_file.error for inbox_file in files], [None, None])
+        self.assertEqual([inbox_file.report.rejected for inbox_file in files], [[], []])
+        self.assertEqual(Employee.objects.count(), 40)
+        self.assertEqual(len(list((self.data_dir / 'archive').iterdir())), 2)
+        self.assertTrue((self.data_dir / 'Message_008_000_a.xml').is_file())
+
+    def test_watcher_continues_after_processing_error(self):
+        self.write_file('a', 3)
+        run = mock.patch.object(NSIInboxPipeline, 'run', autospec=True,
+                                side_effect=[OperationalError('database is unavailable'), []])
+        # Второе ожидание следующего опроса завершает команду
+        sleep = mock.patch('core.management.commands.watch_nsi_inbox.time.sleep',
+                           side_effect=[None, KeyboardInterrupt])
+        with run as run_mock, sleep, self.assertLogs('core.management.commands.watch_nsi_inbox', 'ERROR'):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('watch_nsi_inbox', interval=0, stdout=mock.MagicMock(), stderr=mock.MagicMock())
+        self.assertEqual(run_mock.call_count, 2)
+
+    def test_watcher_once_reports_error(self):
+        self.write_file('a', 3)
+        with mock.patch.object(NSIInboxPipeline, 'run', side_effect=OperationalError('database is unavailable')), \
+                self.assertLogs('core.management.commands.watch_nsi_inbox', 'ERROR'):
+            with self.assertRaises(CommandError):
+                call_command('watch_nsi_inbox', once=True, stdout=mock.MagicMock())
+
+
+class NSIReferenceValidationTest(NSIImportTestCase):
+
+    def test_individual_in_next_batch(self):
+        report = self.import_file([employee_record('e0', 'i0'), individual_record('i0')], batch_size=1)
+
+        self.assertEqual(report.rejected, [])
+        self.assertEqual(Employee.objects.get(pk='e0').individual_id, 'i0')
+
+    def test_individual_in_database(self):
+        Individual.objects.create(nsi_id='i0', birth_date=date(1980, 1, 1))
+        report = self.import_file([employee_record('e0', 'i0')], batch_size=1)
+
+        self.assertEqual((report.inserted_count, report.rejected), (1, []))
+
+    def test_missing_individual_rejected(self):
+        records = [employee_record('e0', 'i0'), employee_record('e1', 'missing'), individual_record('i0')]
+        with self.assertLogs('core.nsi_data_import', 'WARNING'):
+            report = self.import_file(records, batch_size=1)
+
+        self.assertEqual([(record.model_name, record.nsi_id) for record in report.rejected], [('Employee', 'e1')])
+        self.assertIn('"missing" отсутствует', report.rejected[0].reason)
+        self.assertEqual(list(Employee.objects.values_list('pk', flat=True)), ['e0'])
+        self.assertCountEqual(self.read_ack_ids(), ['e0', 'i0'])
+        self.assertEqual(report.get_rejected_report(10)['by_model'], {'Employee': 1})
+
+
+class InputSchemaTest(SimpleTestCase):
+
+    def build_table_field(self) -> TableField:
+        return TableField('Таблица', increasing_columns=(0,), columns=[DateField('Дата'), DecimalField('Значение')])
+
+    def test_naive_dates_made_aware(self):
+        parse = DateField('Дата').compile()
+        value = parse('2020-01-01')
+        self.assertTrue(timezone.is_aware(value))
+        self.assertEqual(timezone.localtime(value).date(), date(2020, 1, 1))
+        self.assertEqual(parse('2020-01-01T00:00:00Z').utcoffset().total_seconds(), 0)
+
+    def test_mixed_naive_and_aware_dates_compared(self):
+        parse = self.build_table_field().compile()
+        rows = parse([['2020-01-01', 1], ['2020-02-01T00:00:00Z', 2]])
+        self.assertEqual(len(rows), 2)
+
+        with self.assertRaisesMessage(InputSchemaError, 'должны возрастать'):
+            parse([['2020-02-01', 1], ['2020-01-01T00:00:00Z', 2]])
+
+    def test_model_validation_reports_error(self):
+        model = WellProductionModel(input_data={
+            'niz_table': [['2020-02-01', 0, 0], ['2020-01-01T00:00:00Z', 0.1, 0.1]],
+            'kin': 0.3, 'debit': 10, 'total': 1000})
+        with self.assertRaises(CalculationError):
+            model.validate_input()
+
+
+class MathModelAPIInputTest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.org', 'password')
+        self.client.force_login(self.user)
+        # Экземпляр модели пользователя создается при первом запросе
+        self.client.get('/api/math_model/wellproductionmodel')
+
+    def put(self, input_data: dict):
+        return self.client.put('/api/math_model/wellproductionmodel', input_data, content_type='application/json')
+
+    def test_mixed_dates_accepted(self):
+        response = self.put({'niz_table': [['2020-01-01', 0, 0], ['2020-02-01T00:00:00Z', 0.1, 0.1]],
+                             'kin': 0.3, 'debit': 10, 'total': 1000})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['production_table']), 2)
+
+    def test_invalid_input_returns_bad_request(self):
+        response = self.put({'niz_table': [['2020-02-01', 0, 0], ['2020-01-01T00:00:00Z', 0.1, 0.1]],
+                             'kin': 0.3, 'debit': 10, 'total': 1000})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('должны возрастать', response.json()['bad_request_reason'])
+
+    def test_zero_debit_rejected(self):
+        response = self.put(dict(WELL_PRODUCTION_INPUT, debit=0))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Дебит жидкости', response.json()['bad_request_reason'])
+
+
+CALCULATOR_PATH = 'core.models.SimpleCalculatorModel'
+
+# Ветви b и c зависят от a, узел d объединяет обе ветви
+BRANCHES_PIPELINE = {
+    'verbose_name': 'Ветви',
+    'nodes': {
+        'a': {'model': CALCULATOR_PATH, 'input_data': {'op': 'add', 'val1': 1, 'val2': 2}},
+        'b': {'model': CALCULATOR_PATH, 'verbose_name': 'Ветвь b', 'input_data': {'op': 'mul', 'val2': 10},
+              'links': {'val1': 'a.result'}},
+        'c': {'model': CALCULATOR_PATH, 'verbose_name': 'Ветвь c', 'input_data': {'op': 'add', 'val2': 1},
+              'links': {'val1': 'a.result'}},
+        'd': {'model': CALCULATOR_PATH, 'input_data': {'op': 'sub'},
+              'links': {'val1': 'b.result', 'val2': 'c.result'}},
+    },
+}
+
+
+def crash_node(model_path: str, input_data: dict):
+    # Аварийно завершается только процесс пула
+    if multiprocessing.parent_process() is not None:
+        os._exit(1)
+
+
+def hang_node(model_path: str, input_data: dict):
+    time.sleep(60)
+
+
+class PipelineRunnerTest(TestCase):
+
+    def setUp(self) -> None:
+        self.pipeline = Pipeline.from_definition('branches', BRANCHES_PIPELINE)
+
+    def run_pipeline(self, params: Optional[dict] = None, workers: int = 1) -> PipelineRunner:
+        runner = PipelineRunner(self.pipeline, workers)
+        runner.run(params)
+        return runner
+
+    def test_nodes_calculated_after_dependencies(self):
+        for workers in (1, 2):
+            PipelineNodeResult.objects.all().delete()
+            runner = self.run_pipeline(workers=workers)
+            self.assertEqual(runner.outputs['d'], {'result': 26.0})
+            order = runner.calculated_nodes
+            self.assertEqual(sorted(order), ['a', 'b', 'c', 'd'])
+            self.assertLess(order.index('a'), min(order.index('b'), order.index('c')))
+            self.assertEqual(order[-1], 'd')
+
+    def test_cached_nodes_not_recalculated(self):
+        self.run_pipeline()
+        runner = self.run_pipeline({'d': {'op': 'add'}}, workers=2)
+        self.assertEqual(sorted(runner.cached_nodes), ['a', 'b', 'c'])
+        self.assertEqual(runner.calculated_nodes, ['d'])
+        self.assertEqual(runner.outputs['d'], {'result': 34.0})
+        self.assertEqual(PipelineNodeResult.objects.get(output_data={'result': 30.0}).hits_count, 1)
+
+        # Изменение параметров начального узла приводит к вычислению всех зависящих от него узлов
+        runner = self.run_pipeline({'a': {'val2': 3}, 'd': {'op': 'add'}})
+        self.assertEqual(runner.cached_nodes, [])
+        self.assertEqual(runner.outputs['d'], {'result': 45.0})
+
+    def test_node_error_propagated(self):
+        for workers in (1, 2):
+            with self.assertRaisesMessage(CalculationError, 'Ветвь c: Не указан опертор №2'):
+                self.run_pipeline({'c': {'val2': None}}, workers=workers)
+
+    def test_dead_worker_interrupts_pipeline(self):
+        # Узел a берется из кэша, ветви b и c вычисляются в пуле процессов
+        self.run_pipeline()
+        with mock.patch('core.pipelines.calculate_node', crash_node), \
+                mock.patch('core.pipelines.POOL_POLL_INTERVAL', 0.1):
+            with self.assertRaisesMessage(CalculationError, 'аварийно завершился'):
+                self.run_pipeline({'b': {'val2': 20}, 'c': {'val2': 2}}, workers=2)
+
+    @override_settings(PIPELINE_NODE_TIMEOUT=0.5)
+    def test_node_timeout_interrupts_pipeline(self):
+        self.run_pipeline()
+        with mock.patch('core.pipelines.calculate_node', hang_node), \
+                mock.patch('core.pipelines.POOL_POLL_INTERVAL', 0.1):
+            with self.assertRaisesMessage(CalculationError, 'превышено время вычисления'):
+                self.run_pipeline({'b': {'val2': 20}, 'c': {'val2': 2}}, workers=2)
+
+
+class PipelineTaskTest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user('user', 'user@example.org', 'password')
+        self.instance = PipelineInstance.objects.create(user=self.user, pipeline_id='reserves_value',
+                                                        is_processing=True)
+
+    def test_processing_flag_reset_on_unexpected_error(self):
+        with mock.patch.object(PipelineRunner, 'run', side_effect=MemoryError), \
+                self.assertLogs('core.tasks', 'ERROR'):
+            pipeline_task_handler(instance_id=self.instance.id)
+
+        self.instance.refresh_from_db()
+        self.assertFalse(self.instance.is_processing)
+        self.assertFalse(self.instance.is_ready)
+        self.assertTrue(self.instance.error)
+        self.assertFalse(Notification.objects.get(user=self.user).is_success)
+
+
+class AsyncTaskTest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user('user', 'user@example.org', 'password')
+        self.instance = WellProductionModel.objects.create(user=self.user, input_data=WELL_PRODUCTION_INPUT,
+                                                           is_processing=True)
+
+    def run_task(self) -> None:
+        async_task_handler(cls_path='core.models.WellProductionModel', internal_id=self.instance.pk)
+        self.instance.refresh_from_db()
+
+    def test_calculation_finished(self):
+        self.run_task()
+        self.assertEqual((self.instance.is_ready, self.instance.is_processing), (True, False))
+        self.assertIn('production_table', self.instance.output_data)
+        self.assertTrue(Notification.objects.get(user=self.user).is_success)
+
+    def test_processing_flag_reset_on_unexpected_error(self):
+        with mock.patch('core.tasks.run_calculation', side_effect=ZeroDivisionError), \
+                self.assertLogs('core.tasks', 'ERROR'):
+            with self.assertRaises(ZeroDivisionError):
+                self.run_task()
+
+        self.instance.refresh_from_db()
+        self.assertEqual((self.instance.is_ready, self.instance.is_processing), (False, False))
+        self.assertFalse(Notification.objects.get(user=self.user).is_success)
+
+
+WELL_PRODUCTION_INPUT = {'niz_table': [['2020-01-01', 0, 0], ['2020-02-01', 0.1, 0.1]], 'kin': 0.3, 'debit': 10,
+                         'total': 1000}
+
+
+@mock.patch.object(WellProductionModel, 'algorithm_version', 2)
+class RecomputeStaleResultsTest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user('user', 'user@example.org', 'password')
+        self.instance = WellProductionModel.objects.create(user=self.user, input_data=WELL_PRODUCTION_INPUT,
+                                                           output_data={'stale': True}, is_ready=True)
+
+    def recompute(self, user_request=None):
+        """
+        :param user_request: действия пользователя, выполняемые во время пересчета
+        """
+        def calculate(instance):
+            if user_request is not None:
+                user_request()
+            return run_calculation(instance)
+
+        with mock.patch('core.recompute.run_calculation', side_effect=calculate):
+            report = recompute_stale_results(10, 0, classes=[WellProductionModel])
+        self.instance.refresh_from_db()
+        return report
+
+    def put_async(self, input_data: dict) -> None:
+        WellProductionModel.objects.filter(pk=self.instance.pk).update(input_data=input_data, is_processing=True,
+                                                                       is_ready=False)
+
+    def test_stale_result_recomputed(self):
+        report = self.recompute()
+        self.assertEqual(report.recomputed, {'wellproductionmodel': 1})
+        self.assertEqual(self.instance.output_algorithm_version, 2)
+        self.assertIn('production_table', self.instance.output_data)
+        self.assertEqual((self.instance.is_ready, self.instance.is_processing), (True, False))
+
+    def test_async_user_request_not_overwritten(self):
+        user_input = dict(WELL_PRODUCTION_INPUT, debit=20)
+        report = self.recompute(lambda: self.put_async(user_input))
+
+        self.assertEqual((report.recomputed, report.skipped), ({}, 1))
+        # Вычисление пользователя остается в очереди, результат пересчета старых входных данных не записан
+        self.assertEqual((self.instance.is_ready, self.instance.is_processing), (False, True))
+        self.assertEqual(self.instance.input_data, user_input)
+        self.assertEqual(self.instance.output_data, {'stale': True})
+        self.assertEqual(self.instance.output_algorithm_version, 1)
+
+    def test_async_user_request_with_same_input_not_overwritten(self):
+        report = self.recompute(lambda: self.put_async(WELL_PRODUCTION_INPUT))
+        self.assertEqual(report.skipped, 1)
+        self.assertEqual((self.instance.is_ready, self.instance.is_processing), (False, True))
+
+    def test_failed_recompute_keeps_user_request(self):
+        invalid_input = dict(WELL_PRODUCTION_INPUT, kin=None)
+        WellProductionModel.objects.filter(pk=self.instance.pk).update(input_data=invalid_input)
+        report = self.recompute(lambda: self.put_async(WELL_PRODUCTION_INPUT))
+
+        self.assertEqual((report.failed, report.skipped), ({}, 1))
+        self.assertEqual((self.instance.is_ready, self.instance.is_processing), (False, True))
+        self.assertFalse(Notification.objects.exists())
+
+    def test_failed_recompute_marks_result_not_ready(self):
+        WellProductionModel.objects.filter(pk=self.instance.pk).update(
+            input_data=dict(WELL_PRODUCTION_INPUT, kin=None))
+        report = self.recompute()
+
+        self.assertEqual(report.failed, {'wellproductionmodel': 1})
+        self.assertEqual((self.instance.is_ready, self.instance.is_processing), (False, False))
+        self.assertFalse(Notification.objects.get(user=self.user).is_success)
+
+
+class VNSEngineTest(SimpleTestCase):
+
+    def profile(self, well: WellParams) -> list:
+        return calculate_profiles([well]).debit[0].tolist()
+
+    def test_step_and_ramp_gtm_effects(self):
+        # Без падения дебита эффект ГТМ остается постоянным после выхода на полную величину
+        step = WellParams(date(2021, 1, 1), 10.0, 0.0, 0.0, 6, [(date(2021, 3, 15), 4.0, 0.0)])
+        ramp = step._replace(gtm=[(date(2021, 3, 15), 4.0, 4.0)])
+        self.assertEqual(self.profile(step), [10.0, 10.0, 14.0, 14.0, 14.0, 14.0])
+        self.assertEqual(self.profile(ramp), [10.0, 10.0, 11.0, 12.0, 13.0, 14.0])
+
+    def test_gtm_effect_declines_with_well(self):
+        well = WellParams(date(2021, 1, 1), 10.0, 0.12, 0.0, 4, [(date(2021, 2, 1), 4.0, 0.0)])
+        base_debit = calculate_profiles([well]).base_debit[0]
+        debit = self.profile(well)
+        self.assertAlmostEqual(base_debit[0], 10.0 * np.exp(-0.12 * 0.5 / 12))
+        self.assertAlmostEqual(debit[1] - base_debit[1], 4.0)
+        self.assertAlmostEqual(debit[3] - base_debit[3], 4.0 * np.exp(-0.12 * 2 / 12))
+
+    def test_partial_first_month(self):
+        well = WellParams(date(2021, 1, 11), 10.0, 0.0, 0.0, 2)
+        batch = calculate_profiles([well])
+        self.assertEqual(batch.days[0].tolist(), [21.0, 28.0])
+        self.assertEqual(batch.production[0].tolist(), [210.0, 280.0])
+
+        output_data = VNSWellModel.get_output_data([well], batch)[0]
+        self.assertEqual([row[0] for row in output_data['production_table']], [date(2021, 1, 11), date(2021, 2, 1)])
+        self.assertEqual(output_data['total'], 490.0)
+
+    def test_mixed_horizons_in_batch(self):
+        wells = [WellParams(date(2021, 1, 1), 10.0, 0.2, 0.5, 3, [(date(2021, 2, 1), 2.0, 1.0)]),
+                 WellParams(date(2021, 6, 20), 20.0, 0.1, 0.0, 8),
+                 WellParams(date(2020, 12, 1), 5.0, 0.3, 1.0, 5, [(date(2021, 3, 1), 1.0, 0.0)])]
+        batch = calculate_profiles(wells)
+        self.assertEqual(batch.debit.shape, (3, 8))
+        for index, well in enumerate(wells):
+            single = calculate_profiles([well])
+            np.testing.assert_allclose(batch.debit[index, :well.horizon], single.debit[0])
+            np.testing.assert_allclose(batch.production[index, :well.horizon], single.production[0])
+            # Месяцы за пределами горизонта скважины заполнены нулями
+            self.assertFalse(batch.production[index, well.horizon:].any())
+
+        outputs = VNSWellModel.get_output_data(wells, batch)
+        self.assertEqual([len(output_data['production_table']) for output_data in outputs], [3, 8, 5])
+
+    def test_empty_batch(self):
+        batch = calculate_profiles([])
+        self.assertEqual(batch.production.shape, (0, 0))
+        self.assertEqual(VNSWellModel.calculate_batch([]), [])
+
+
+class RecordDurationTest(TestCase):
+
+    def test_durations_aggregated(self):
+        record_duration('calculate', 'model', 2.0, units=4)
+        record_duration('calculate', 'model', 6.0, units=2, queries_count=3)
+        metric = PerformanceMetric.objects.get(name='calculate', key='model')
+        self.assertEqual((metric.calls_count, metric.total_duration, metric.max_duration, metric.total_units,
+                          metric.total_queries), (2, 8.0, 6.0, 6, 3))
+        self.assertAlmostEqual(metric.unit_duration_ewma, 0.5 * 0.7 + 3.0 * 0.3)
+
+    def test_concurrent_insert_does_not_abort_transaction(self):
+        PerformanceMetric.objects.create(name='request', key='GET /', calls_count=1, total_duration=1.0)
+        update = QuerySet.update
+        calls = []
+
+        def concurrent_update(queryset, **kwargs):
+            # Первое обновление выполняется до того, как параллельный процесс вставил строку
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=concurrent_update), \
+                CaptureQueriesContext(connection) as queries, transaction.atomic():
+            record_duration('request', 'GET /', 2.0)
+            record_duration('request.db', 'GET /', 0.5)
+
+        self.assertTrue(any(query['sql'].startswith('ROLLBACK TO SAVEPOINT') for query in queries.captured_queries))
+        self.assertEqual(PerformanceMetric.objects.get(name='request', key='GET /').calls_count, 2)
+        self.assertEqual(PerformanceMetric.objects.get(name='request.db', key='GET /').calls_count, 1)
+
+
+class AsyncCalculationRoutingTest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.org', 'password')
+        self.client.force_login(self.user)
+        self.client.get('/api/math_model/wellproductionmodel')
+
+    def seed_metric(self, unit_duration: float) -> None:
+        PerformanceMetric.objects.create(name='calculate', key='wellproductionmodel', calls_count=10,
+                                         unit_duration_ewma=unit_duration)
+
+    def test_routing_by_model_type(self):
+        self.assertFalse(is_async_calculation_required(SimpleCalculatorModel(input_data={})))
+        self.assertTrue(is_async_calculation_required(AsyncCalculatorModel(input_data={})))
+        # Без статистики вычисление выполняется синхронно
+        self.assertFalse(is_async_calculation_required(WellProductionModel(input_data=WELL_PRODUCTION_INPUT)))
+
+    def test_routing_by_predicted_time(self):
+        model = WellProductionModel(input_data=WELL_PRODUCTION_INPUT)
+        # Прогноз - длительность на строку таблицы НИЗ, умноженная на две строки, бюджет - 2 сек
+        self.seed_metric(0.9)
+        self.assertFalse(is_async_calculation_required(model))
+        PerformanceMetric.objects.update(unit_duration_ewma=1.1)
+        self.assertTrue(is_async_calculation_required(model))
+
+    def test_routing_by_input_size(self):
+        with mock.patch.object(WellProductionModel, 'max_sync_input_size', 1):
+            self.assertTrue(is_async_calculation_required(WellProductionModel(input_data=WELL_PRODUCTION_INPUT)))
+
+    def test_slow_sync_model_queued(self):
+        self.seed_metric(10.0)
+        response = self.client.put('/api/math_model/wellproductionmodel', WELL_PRODUCTION_INPUT,
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        # В режиме отладки задание спулера выполняется сразу
+        instance = WellProductionModel.objects.get(user=self.user)
+        self.assertEqual((instance.is_ready, instance.is_processing), (True, False))
+        self.assertTrue(Notification.objects.get(user=self.user).is_success)
+
+
+class MathModelExportAPITest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.org', 'password')
+        self.client.force_login(self.user)
+        WellProductionModel.objects.create(user=self.user, is_ready=True, output_data={'production_table': [
+            ['2020-01-01T00:00:00+08:00', 1250.5, 1e-07], ['2020-02-01', 1200, None]]})
+
+    def export(self, export_format: str):
+        return self.client.get(f'/api/math_model/wellproductionmodel/export/{export_format}')
+
+    def test_csv_export(self):
+        response = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="wellproductionmodel.csv"')
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'),
+                         'Дата,"Добыча в месяц, м3","Дебит в сутки, м3"\r\n'
+                         '01.01.2020,1250.5,0.0000001\r\n'
+                         '01.02.2020,1200,\r\n')
+
+    def test_ndjson_export(self):
+        response = self.export('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'),
+                         '{"Дата": "01.01.2020", "Добыча в месяц, м3": "1250.5", "Дебит в сутки, м3": "0.0000001"}\n'
+                         '{"Дата": "01.02.2020", "Добыча в месяц, м3": "1200", "Дебит в сутки, м3": ""}\n')
+
+    def test_unknown_format_rejected(self):
+        response = self.export('xlsx')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('xlsx', response.json()['bad_request_reason'])
+
+
+class MathModelStatusAPITest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.org', 'password')
+        self.client.force_login(self.user)
+        WellProductionModel.objects.create(user=self.user, is_ready=True, output_data={'production_table': [
+            ['2020-01-01', 1, 2]]})
+
+    def test_status_does_not_load_output_data(self):
+        table = WellProductionModel._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/math_model/wellproductionmodel/status')
+
+        self.assertEqual(response.json(), {'is_ready': True, 'is_processing': False, 'is_stale': False})
+        model_queries = [query['sql'] for query in queries if table in query['sql']]
+        self.assertEqual(len(model_queries), 1)
+        self.assertNotIn('output_data', model_queries[0])
+        self.assertNotIn('input_data', model_queries[0])
+
+
+class MathModelChartAPITest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.org', 'password')
+        self.client.force_login(self.user)
+        production_table = [[f'2020-01-{day:02}', day, day * 2] for day in range(1, 31)]
+        WellProductionModel.objects.create(user=self.user, is_ready=True,
+                                           output_data={'production_table': production_table})
+
+    def test_short_series_unchanged(self):
+        response = self.client.get('/api/math_model/wellproductionmodel/chart', {'points': 100}).json()
+        self.assertEqual(response['total_points'], 30)
+        self.assertEqual(response['indices'], list(range(30)))
+        self.assertEqual(response['datasets'][0]['data'], [day * 2 for day in range(1, 31)])
+
+    def test_long_series_downsampled(self):
+        response = self.client.get('/api/math_model/wellproductionmodel/chart', {'points': 10}).json()
+        self.assertEqual(response['total_points'], 30)
+        self.assertEqual(len(response['labels']), 10)
+        self.assertEqual((response['labels'][0], response['labels'][-1]), ('2020-01-01', '2020-01-30'))
+
+
+class DownsamplingTest(SimpleTestCase):
+
+    def test_threshold_points_with_first_and_last(self):
+        values = np.sin(np.linspace(0, 20, 1000)).tolist()
+        for threshold in (3, 10, 97, 999):
+            indices = lttb_indices(values, threshold)
+            self.assertEqual(len(indices), threshold)
+            self.assertEqual((indices[0], indices[-1]), (0, 999))
+            self.assertEqual(indices, sorted(set(indices)))
+
+    def test_short_series_unchanged(self):
+        values = [3, 1, 4, 1, 5]
+        self.assertEqual(lttb_indices(values, 5), [0, 1, 2, 3, 4])
+        self.assertEqual(lttb_indices(values, 100), [0, 1, 2, 3, 4])
+        self.assertEqual(downsample_series([values, values], 100), [0, 1, 2, 3, 4])
+
+    def test_empty_values_skipped(self):
+        self.assertEqual(lttb_indices([1, None, '', 2], 10), [0, 3])
+
+    def test_peak_selected(self):
+        values = [0] * 50 + [100] + [0] * 49
+        self.assertIn(50, lttb_indices(values, 5))
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=0.5)
+class RequestTimingMiddlewareTest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.org', 'password')
+        self.client.force_login(self.user)
+        with mock.patch('core.middleware.random.random', return_value=0.9):
+            self.client.get('/api/math_model/wellproductionmodel')
+
+    def put(self, random_value: float):
+        with mock.patch('core.middleware.random.random', return_value=random_value):
+            return self.client.put('/api/math_model/wellproductionmodel', WELL_PRODUCTION_INPUT,
+                                   content_type='application/json')
+
+    def test_sampled_request_timed(self):
+        response = self.put(0.1)
+        self.assertEqual(response.status_code, 200)
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['calculate', 'save', 'serialize', 'db', 'total'])
+
+        request_metrics = PerformanceMetric.objects.filter(name__startswith='request')
+        self.assertEqual(set(request_metrics.values_list('name', flat=True)),
+                         {'request', 'request.db', 'request.calculate', 'request.save', 'request.serialize'})
+        self.assertEqual(set(request_metrics.values_list('key', flat=True)),
+                         {'PUT api/math_model/<str:model_id> [wellproductionmodel]'})
+        self.assertGreater(request_metrics.get(name='request.save').total_queries, 0)
+
+    def test_unsampled_request_not_timed(self):
+        response = self.put(0.9)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        self.assertFalse(PerformanceMetric.objects.filter(name__startswith='request').exists())
+
+
+class CalculationProfilingTest(TestCase):
+
+    def setUp(self) -> None:
+        self.profiles_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.profiles_dir))
+        self.settings_override = override_settings(MATH_MODEL_PROFILES_DIR=self.profiles_dir)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        # Список активных запросов кэшируется в процессе между тестами
+        _active_requests_cache['expires'] = 0.0
+        self.addCleanup(_active_requests_cache.update, expires=0.0)
+
+        self.user = get_user_model().objects.create_user('user', 'user@example.org', 'password')
+        self.instance = WellProductionModel(user=self.user, input_data=WELL_PRODUCTION_INPUT)
+
+    def test_request_claimed_once(self):
+        profiling_request = ProfilingRequest.objects.create(math_model_id='wellproductionmodel', remaining_count=1)
+        for _ in range(2):
+            run_calculation(self.instance)
+
+        profiling_request.refresh_from_db()
+        self.assertEqual(profiling_request.remaining_count, 0)
+        profile = CalculationProfile.objects.get()
+        self.assertEqual((profile.profiling_request, profile.user, profile.math_model_id),
+                         (profiling_request, self.user, 'wellproductionmodel'))
+        self.assertEqual(sorted(path.suffix for path in self.profiles_dir.iterdir()), ['.pstats', '.txt'])
+        self.assertEqual(Path(profile.pstats_path).parent, self.profiles_dir)
+        self.assertTrue(Path(profile.collapsed_path).name.endswith('.collapsed.txt'))
+
+    def test_sampling_profiler_writes_collapsed_stacks_only(self):
+        ProfilingRequest.objects.create(user=self.user, profiler=ProfilingRequest.PROFILER_SAMPLING)
+        run_calculation(self.instance)
+
+        profile = CalculationProfile.objects.get()
+        self.assertIsNone(profile.pstats_path)
+        self.assertEqual([path.name for path in self.profiles_dir.iterdir()], [Path(profile.collapsed_path).name])
+
+    def test_other_model_not_profiled(self):
+        ProfilingRequest.objects.create(math_model_id='vnswellmodel')
+        run_calculation(self.instance)
+        self.assertFalse(CalculationProfile.objects.exists())
+        self.assertEqual(ProfilingRequest.objects.get().remaining_count, 1)
+
+
+class BenchmarkBaselineTest(SimpleTestCase):
+
+    @staticmethod
+    def results(**medians: float) -> dict:
+        return {'results': {name: {'median': median} for name, median in medians.items()}}
+
+    def test_regression_over_threshold_reported(self):
+        baseline = self.results(calculate=0.100, parse=0.200, export=0.050)
+        regressions = compare_with_baseline(self.results(calculate=0.119, parse=0.250, export=0.040), baseline, 0.2)
+        self.assertEqual(regressions, ['parse: 200.00 ms -> 250.00 ms (+25%, порог 20%)'])
+
+    def test_per_case_threshold_override(self):
+        baseline = dict(self.results(calculate=0.100, parse=0.200), thresholds={'parse': 0.5, 'calculate': 0.05})
+        regressions = compare_with_baseline(self.results(calculate=0.110, parse=0.250), baseline, 0.2)
+        self.assertEqual(regressions, ['calculate: 100.00 ms -> 110.00 ms (+10%, порог 5%)'])
+
+    def test_cases_missing_from_baseline_ignored(self):
+        regressions = compare_with_baseline(self.results(calculate=1.0, new_case=1.0),
+                                            self.results(calculate=1.0, new_case=0), 0.2)
+        self.assertEqual(regressions, [])
+
+
+class LoadTestStatisticsTest(SimpleTestCase):
+
+    def test_report_aggregated_by_step(self):
+        statistics = LoadTestStatistics()
+        for value in range(1, 101):
+            statistics.add('status', value / 1000, is_error=value % 25 == 0)
+        statistics.add('calculate', 0.5, is_error=False)
+        statistics.add('calculate', 0.3, is_error=True)
+        statistics.finished = statistics.started + 10
+
+        report = statistics.get_report()
+        self.assertEqual(report['elapsed'], 10)
+        self.assertEqual(list(report['endpoints']), ['calculate', 'status'])
+        self.assertEqual(report['endpoints']['status'], {
+            'requests': 100, 'errors': 4, 'error_rate': 0.04, 'throughput': 10.0,
+            'p50': 0.05, 'p90': 0.09, 'p95': 0.095, 'p99': 0.099, 'max': 0.1,
+        })
+        calculate = report['endpoints']['calculate']
+        self.assertEqual((calculate['requests'], calculate['error_rate'], calculate['p50'], calculate['max']),
+                         (2, 0.5, 0.3, 0.5))
+
+
+@override_settings(DEBUG=False, RESPONSE_CACHE_ALIAS='test_responses', CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'test_responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test_responses'},
+})
+class ResponseCacheTest(SimpleTestCase):
+
+    def setUp(self) -> None:
+        self.renders = 0
+        caches['test_responses'].clear()
+        patcher = mock.patch.object(response_cache, '_cache_version', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def render(self) -> bytes:
+        self.renders += 1
+        return f'content {self.renders}'.encode('utf-8')
+
+    def restart(self) -> None:
+        # Версия кэша вычисляется один раз в процессе
+        response_cache._cache_version = None
+
+    def test_content_cached(self):
+        self.assertEqual(get_cached_content('key', self.render), b'content 1')
+        self.assertEqual(get_cached_content('key', self.render), b'content 1')
+        self.restart()
+        self.assertEqual(get_cached_content('key', self.render), b'content 1')
+        self.assertEqual(self.renders, 1)
+
+    def test_changed_setting_invalidates_cache(self):
+        with override_settings(RESPONSE_CACHE_VERSION_SETTINGS=['STATIC_URL'], STATIC_URL='/static/'):
+            self.assertEqual(get_cached_content('key', self.render), b'content 1')
+        self.restart()
+        with override_settings(RESPONSE_CACHE_VERSION_SETTINGS=['STATIC_URL'], STATIC_URL='/static/v2/'):
+            self.assertEqual(get_cached_content('key', self.render), b'content 2')
+            self.assertEqual(get_cached_content('key', self.render), b'content 2')
+        self.assertEqual(self.renders, 2)
+
+    def test_debug_bypasses_cache(self):
+        with override_settings(DEBUG=True):
+            self.assertEqual(get_cached_content('key', self.render), b'content 1')
+            self.assertEqual(get_cached_content('key', self.render), b'content 2')
+        self.assertEqual(get_cached_content('key', self.render), b'content 3')
+
+
+class PrecompressedStorageTest(SimpleTestCase):
+
+    def setUp(self) -> None:
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.root))
+        self.storage = PrecompressedCompressorFileStorage(location=str(self.root), base_url='/static/')
+
+    def test_compressed_copies_saved(self):
+        data = b'function f() { return 1; }\n' * 100
+        name = self.storage.save('CACHE/js/output.js', ContentFile(data))
+        path = self.root / name
+
+        compressed = path.with_name(path.name + '.gz')
+        self.assertEqual(gzip.decompress(compressed.read_bytes()), data)
+        self.assertEqual(compressed.stat().st_mtime, path.stat().st_mtime)
+        brotli_compressed = path.with_name(path.name + '.br')
+        if brotli_compressed.exists():
+            self.assertEqual(brotli_compressed.stat().st_mtime, path.stat().st_mtime)
+
+    def test_reproducible_archive(self):
+        name = self.storage.save('CACHE/css/output.css', ContentFile(b'body { color: red; }'))
+        archive = (self.root / f'{name}.gz').read_bytes()
+        time.sleep(0.01)
+        self.assertEqual(self.storage.save(name, ContentFile(b'body { color: red; }')), name)
+        self.assertEqual((self.root / f'{name}.gz').read_bytes(), archive)
+
+    def test_other_files_not_compressed(self):
+        name = self.storage.save('CACHE/img/icon.png', ContentFile(b'png'))
+        self.assertFalse((self.root / f'{name}.gz').exists())
@@ -0,0 +1,78 @@
+# coding: utf-8
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+_local = threading.local()
+
+
+class RequestTiming(object):
+    """
+    Длительности фаз обработки одного запроса и количество выполненных в них SQL-запросов
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = OrderedDict()
+        self.phase_queries: Dict[str, int] = OrderedDict()
+        self.queries_count = 0
+        self.db_duration = 0.0
+
+    def add_phase(self, name: str, duration: float, queries_count: int) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+        self.phase_queries[name] = self.phase_queries.get(name, 0) + queries_count
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """
+        Обертка для connection.execute_wrapper(), учитывает количество и длительность SQL-запросов
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_duration += time.perf_counter() - started
+            self.queries_count += 1
+
+    def get_server_timing_header(self, total_duration: float) -> str:
+        """
+        Формирует значение заголовка Server-Timing, длительности указываются в миллисекундах
+        """
+        metrics = [f'{name};dur={duration * 1000:.1f}' for name, duration in self.phases.items()]
+        metrics.append(f'db;dur={self.db_duration * 1000:.1f};desc="{self.queries_count} queries"')
+        metrics.append(f'total;dur={total_duration * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def start_request_timing() -> RequestTiming:
+    _local.timing = RequestTiming()
+    return _local.timing
+
+
+def stop_request_timing() -> None:
+    _local.timing = None
+
+
+def get_request_timing() -> Optional[RequestTiming]:
+    return getattr(_local, 'timing', None)
+
+
+@contextmanager
+def measure_phase(name: str):
+    """
+    Учитывает длительность фазы обработки запроса. Вне замеряемого (несэмплированного) запроса ничего не делает
+    :param name: наименование фазы, например calculate, save, serialize
+    """
+    timing = get_request_timing()
+    if timing is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    queries_before = timing.queries_count
+    try:
+        yield
+    finally:
+        timing.add_phase(name, time.perf_counter() - started, timing.queries_count - queries_before)
@@ -1,9 +1,15 @@
 # coding: utf-8
 from django.urls import path, re_path
 from .views import MathModelAPIView, NSIAPIView, NSIDataImportAPIView
+from .views import MathModelChartAPIView
+from .views import MathModelExportAPIView
+from .views import MathModelStatusAPIView
 from .views import PermissionsAPIView
+from .views import PipelineAPIView
+from .views import PipelineStatusAPIView
 from .views import NotificationAPIView
 from .views import LoginRequiredTemplateView
+from .views import CachedTemplateView
 from django.contrib.auth import views as auth_views
 from django.conf import settings
 
@@ -11,6 +17,13 @@ from django.conf import settings
 urlpatterns = [
     path('api/math_model', MathModelAPIView.as_view()),
     path('api/math_model/<str:model_id>', MathModelAPIView.as_view()),
+    path('api/math_model/<str:model_id>/status', MathModelStatusAPIView.as_view()),
+    path('api/math_model/<str:model_id>/chart', MathModelChartAPIView.as_view()),
+    path('api/math_model/<str:model_id>/export/<str:export_format>', MathModelExportAPIView.as_view()),
+
+    path('api/pipeline', PipelineAPIView.as_view()),
+    path('api/pipeline/<str:pipeline_id>', PipelineAPIView.as_view()),
+    path('api/pipeline/<str:pipeline_id>/status', PipelineStatusAPIView.as_view()),
 
     path('api/notification', NotificationAPIView.as_view()),
     path('api/notification/new', NotificationAPIView.as_view(is_only_new=True)),
@@ -23,31 +36,31 @@ urlpatterns = [
 
 
     path('templates/index.html', LoginRequiredTemplateView.as_view(template_name='core/index.html')),
-    path('templates/models_list.html', LoginRequiredTemplateView.as_view(template_name='core/models_list.html')),
+    path('templates/models_list.html', CachedTemplateView.as_view(template_name='core/models_list.html')),
     path('templates/wellproductionmodel.html',
-         LoginRequiredTemplateView.as_view(template_name='core/wellproductionmodel.html')),
+         CachedTemplateView.as_view(template_name='core/wellproductionmodel.html')),
     path('templates/simplecalculatormodel.html',
-         LoginRequiredTemplateView.as_view(template_name='core/simplecalculatormodel.html')),
+         CachedTemplateView.as_view(template_name='core/simplecalculatormodel.html')),
 
     path('templates/asynccalculatormodel.html',
-         LoginRequiredTemplateView.as_view(template_name='core/asynccalculatormodel.html')),
+         CachedTemplateView.as_view(template_name='core/asynccalculatormodel.html')),
 
     path('templates/vnswellmodel.html',
-         LoginRequiredTemplateView.as_view(template_name='core/vnswellmodel.html')),
+         CachedTemplateView.as_view(template_name='core/vnswellmodel.html')),
 
     path('templates/nsi.html',
-         LoginRequiredTemplateView.as_view(template_name='core/nsi.html')),
+         CachedTemplateView.as_view(template_name='core/nsi.html')),
 
     path('templates/widgets/table_editor/niz_table_editor.html',
-         LoginRequiredTemplateView.as_view(template_name='widgets/table_editor/niz_table_editor.html')),
+         CachedTemplateView.as_view(template_name='widgets/table_editor/niz_table_editor.html')),
     path('templates/widgets/table_editor/referent_table_editor.html',
-         LoginRequiredTemplateView.as_view(template_name='widgets/table_editor/referent_table_editor.html')),
+         CachedTemplateView.as_view(template_name='widgets/table_editor/referent_table_editor.html')),
     path('templates/widgets/chart_viewer.html',
-         LoginRequiredTemplateView.as_view(template_name='widgets/chart_viewer.html')),
+         CachedTemplateView.as_view(template_name='widgets/chart_viewer.html')),
     path('templates/widgets/notification_viewer.html',
-         LoginRequiredTemplateView.as_view(template_name='widgets/notification_viewer.html')),
+         CachedTemplateView.as_view(template_name='widgets/notification_viewer.html')),
     path('templates/widgets/employee_viewer.html',
-         LoginRequiredTemplateView.as_view(template_name='widgets/employee_viewer.html')),
+         CachedTemplateView.as_view(template_name='widgets/employee_viewer.html')),
 
     path(settings.LOGIN_URL, auth_views.LoginView.as_view(template_name='auth/login.html'), name='login'),
     path(settings.LOGOUT_URL, auth_views.LogoutView.as_view(), name='logout'),
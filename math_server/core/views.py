@@ -1,6 +1,6 @@
 import logging
 import json
-from typing import Dict
+from typing import Dict, Optional
 from django.http import HttpResponseForbidden, JsonResponse
 from django.http import HttpResponseNotFound
 from django.http import HttpResponse
@@ -8,16 +8,31 @@ from django.conf import settings
 from django.utils.module_loading import import_string
 from django.views import View
 from django.views.generic import TemplateView
+from django.template.loader import render_to_string
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from .models import CalculationError, Employee, Individual
-from .models import AsyncMathModel
 from .models import Notification
 from .models import NSIDataImportStatus
+from .models import NSIImportLock
+from .models import PipelineInstance
 from .tasks import async_task_handler
+from .tasks import prepare_spooler_args
+from .tasks import start_nsi_data_import_task
+from .tasks import start_pipeline_task
+from .nsi_import_lock import LOCK_ID
+from .nsi_import_lock import ensure_import_lock
+from .metrics import is_async_calculation_required
+from .metrics import run_calculation
+from .pipelines import Pipeline
+from .pipelines import get_pipelines
+from .timing import measure_phase
+from .response_cache import get_cached_content
 from django.core.serializers.json import DjangoJSONEncoder
-from .nsi_data_import import import_nsi_data_from_xml
-from .nsi_data_import import ImportNSIDataError
+from .downsampling import downsample_series
+from .export import ExportFormatError
+from .export import streaming_export_response
 
 logger = logging.getLogger(__name__)
 
@@ -45,10 +60,9 @@ def dict_from_model_instance(model_instance) -> Dict:
     res = dict_from_model_class(type(model_instance))
     res['input_data'] = model_instance.input_data
     res['output_data'] = model_instance.output_data
-    if hasattr(model_instance, 'is_ready'):
-        res['is_ready'] = model_instance.is_ready
-    if hasattr(model_instance, 'is_processing'):
-        res['is_processing'] = model_instance.is_processing
+    res['is_ready'] = model_instance.is_ready
+    res['is_processing'] = model_instance.is_processing
+    res['is_stale'] = model_instance.is_output_stale()
     return res
 
 
@@ -78,6 +92,17 @@ class LoginRequiredTemplateView(LoginRequiredMixin, TemplateView):
     pass
 
 
+class CachedTemplateView(LoginRequiredTemplateView):
+    """
+    Template view for SPA templates, which don't depend on user. Rendered template is cached
+    """
+
+    def get(self, request, *args, **kwargs):
+        content = get_cached_content(f'template:{self.template_name}', lambda: render_to_string(
+            self.template_name, request=request).encode('utf-8'))
+        return HttpResponse(content)
+
+
 class UnicodeJsonResponse(JsonResponse):
     """
     JSON-response with non ASCII data
@@ -88,18 +113,6 @@ class UnicodeJsonResponse(JsonResponse):
                                                   safe=False, json_dumps_params={'ensure_ascii': False}, **kwargs)
 
 
-def prepare_spooler_args(**kwargs):
-    """
-    Encodes arguments to binary string fo using in uWSGI spooler
-    :param kwargs:arguments to encoding
-    :return: dict with encoded arguments
-    """
-    args = {}
-    for name, value in kwargs.items():
-        args[name.encode('utf-8')] = str(value).encode('utf-8')
-    return args
-
-
 class PermissionsAPIView(LoginRequiredMixin, View):
     """
     REST JSON API for current user permissions
@@ -118,7 +131,9 @@ class MathModelAPIView(LoginRequiredMixin, View):
         requested_model_id = kwargs.get('model_id')
 
         if not requested_model_id:
-            return UnicodeJsonResponse(grouped_models_dict)
+            return HttpResponse(get_cached_content('json:grouped_models', lambda: json.dumps(
+                grouped_models_dict, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')),
+                content_type='application/json')
         else:
             cls = models_classes_dict.get(requested_model_id)
 
@@ -129,7 +144,8 @@ class MathModelAPIView(LoginRequiredMixin, View):
                 return HttpResponseForbidden("Отсутствуют права доступа для просмотра данной модели!")
 
             model_instance, created_flag = cls.objects.get_or_create(user=request.user)
-            return UnicodeJsonResponse(dict_from_model_instance(model_instance))
+            with measure_phase('serialize'):
+                return UnicodeJsonResponse(dict_from_model_instance(model_instance))
 
     def put(self, request, **kwargs):
         requested_model_external_id = kwargs.get('model_id')
@@ -143,11 +159,22 @@ class MathModelAPIView(LoginRequiredMixin, View):
 
         request_data = json.loads(request.body.decode("utf-8"))
 
-        model_instance = get_object_or_404(cls, user=request.user)
+        # Результаты перезаписываются вычислением и загружаются только при обращении к ним
+        model_instance = get_object_or_404(cls.objects.defer('output_data'), user=request.user)
         model_instance.input_data = request_data
 
-        if isinstance(model_instance, AsyncMathModel):
-            model_instance.save()
+        # Некорректные входные данные отклоняются до постановки вычисления в очередь
+        try:
+            model_instance.validate_input()
+        except CalculationError as e:
+            logger.warning('Invalid input data for model "{}". Reason "{}"'.format(requested_model_external_id, e))
+            return UnicodeJsonResponse({'bad_request_reason': str(e)}, status=400)
+
+        if is_async_calculation_required(model_instance):
+            model_instance.is_processing = True
+            model_instance.is_ready = False
+            with measure_phase('save'):
+                model_instance.save(update_fields=['input_data'] + cls.status_fields)
 
             if settings.DEBUG:
                 async_task_handler(cls_path=models_classes_path_dict.get(                   # type: ignore
@@ -155,12 +182,16 @@ class MathModelAPIView(LoginRequiredMixin, View):
             else:
                 async_task_handler(prepare_spooler_args(cls_path=models_classes_path_dict.get(
                     requested_model_external_id), internal_id=model_instance.pk))
-            return HttpResponse()
+            return UnicodeJsonResponse({'is_processing': True}, status=202)
         else:
             try:
-                model_instance.calculate()
-                model_instance.save()
-                return UnicodeJsonResponse(model_instance.output_data)
+                run_calculation(model_instance)
+                model_instance.is_ready = True
+                model_instance.is_processing = False
+                with measure_phase('save'):
+                    model_instance.save(update_fields=['input_data'] + cls.result_fields + cls.status_fields)
+                with measure_phase('serialize'):
+                    return UnicodeJsonResponse(model_instance.output_data)
             except CalculationError as e:
                 error_text = str(e)
                 logger.warning('Calculation error for model "{}". Reason "{}"'.format(
@@ -168,6 +199,87 @@ class MathModelAPIView(LoginRequiredMixin, View):
                 return UnicodeJsonResponse({'bad_request_reason': error_text}, status=400)
 
 
+class MathModelStatusAPIView(LoginRequiredMixin, View):
+    """
+    REST JSON API for MathModel calculation status, used for polling of async calculations
+    """
+
+    def get(self, request, **kwargs):
+        requested_model_id = kwargs.get('model_id')
+        cls = models_classes_dict.get(requested_model_id)
+        if not cls:
+            return HttpResponseNotFound()
+
+        if not request.user.has_perm(f'core.view_{requested_model_id}'):
+            return HttpResponseForbidden("Отсутствуют права доступа для просмотра данной модели!")
+
+        status = cls.get_status(request.user)
+        if status is None:
+            return HttpResponseNotFound()
+        return UnicodeJsonResponse(status)
+
+
+def get_chart_points(request) -> int:
+    """
+    Возвращает количество точек графика, запрошенное клиентом (параметр points), в пределах CHART_MAX_POINTS
+    """
+    try:
+        points = int(request.GET.get('points', settings.CHART_DEFAULT_POINTS))
+    except ValueError:
+        points = settings.CHART_DEFAULT_POINTS
+    return min(max(points, 3), settings.CHART_MAX_POINTS)
+
+
+class MathModelChartAPIView(LoginRequiredMixin, View):
+    """
+    REST JSON API for MathModel result chart, downsampled to the number of points requested by client.
+    Full resolution results are available via MathModelAPIView and MathModelExportAPIView
+    """
+
+    def get(self, request, **kwargs):
+        requested_model_id = kwargs.get('model_id')
+        cls = models_classes_dict.get(requested_model_id)
+        if not cls:
+            return HttpResponseNotFound()
+
+        if not request.user.has_perm(f'core.view_{requested_model_id}'):
+            return HttpResponseForbidden("Отсутствуют права доступа для просмотра данной модели!")
+
+        model_instance = get_object_or_404(cls, user=request.user)
+        labels, series = model_instance.get_chart_series()
+        series = [(name, values[:len(labels)]) for name, values in series]
+        indices = downsample_series([values for _, values in series], get_chart_points(request))
+        return UnicodeJsonResponse({
+            'total_points': len(labels),
+            'indices': indices,
+            'labels': [labels[i] for i in indices],
+            'datasets': [{'label': name, 'data': [values[i] if i < len(values) else None for i in indices]}
+                         for name, values in series],
+        })
+
+
+class MathModelExportAPIView(LoginRequiredMixin, View):
+    """
+    REST API for streaming export of MathModel results
+    """
+
+    def get(self, request, **kwargs):
+        requested_model_id = kwargs.get('model_id')
+        cls = models_classes_dict.get(requested_model_id)
+        if not cls:
+            return HttpResponseNotFound()
+
+        if not request.user.has_perm(f'core.view_{requested_model_id}'):
+            return HttpResponseForbidden("Отсутствуют права доступа для просмотра данной модели!")
+
+        model_instance = get_object_or_404(cls, user=request.user)
+        try:
+            return streaming_export_response(model_instance.get_export_columns(), model_instance.get_export_rows(),
+                                             kwargs.get('export_format'), requested_model_id)
+        except ExportFormatError as e:
+            return UnicodeJsonResponse({'bad_request_reason': str(e)}, status=400)
+
+
 class NotificationAPIView(LoginRequiredMixin, View):
     """
     REST JSON API for Notification
@@ -207,43 +319,56 @@ class NotificationAPIView(LoginRequiredMixin, View):
         return HttpResponse()
 
 
+def dict_from_import_status(status: NSIDataImportStatus) -> Dict:
+    return {'created_timestamp': status.created_timestamp,
+            'user': status.user.get_full_name(),
+            'is_pending': status.is_pending,
+            'phase': status.phase,
+            'phase_display': status.get_phase_display(),
+            'records_processed': status.records_processed,
+            'progress': status.get_progress(),
+            'rate': status.rate,
+            'eta': status.eta,
+            'phase_durations': status.phase_durations,
+            'result': status.result,
+            'rejected_report': status.rejected_report,
+            'finished_timestamp': status.finished_timestamp}
+
+
+def get_current_import_status() -> Optional[NSIDataImportStatus]:
+    """
+    Returns running import, else queued import, else the last finished one
+    """
+    statuses = NSIDataImportStatus.objects.select_related('user')
+    return (statuses.filter(is_pending=True).exclude(phase=NSIDataImportStatus.PHASE_QUEUED).first() or
+            statuses.filter(is_pending=True).first() or
+            statuses.order_by('-created_timestamp').first())
+
+
 class NSIDataImportAPIView(LoginRequiredMixin, View):
     """
-    REST API for NSI data import
+    REST API for NSI data import. Import is performed by uWSGI spooler, its progress is available via GET request.
+    Requests made while import is running are coalesced into a single queued import
     """
 
     def put(self, request, **kwargs):
-        status = NSIDataImportStatus.objects.filter(is_pending=True).first()
-        if not status:
-            current_status = NSIDataImportStatus.objects.create(user=request.user)
-            try:
-                import_nsi_data_from_xml()
-                Notification.objects.create(
-                    user=request.user,
-                    is_success=True,
-                    description='Импорт данных НСИ: операция завершена успешно'
-                )
-            except ImportNSIDataError:
-                Notification.objects.create(
-                    user=request.user,
-                    is_success=False,
-                    description='Импорт данных НСИ: операция не выполнена!'
-                )
-
-            current_status.is_pending = False
-            current_status.save()
-            return HttpResponse(status=200)
-        else:
-            return UnicodeJsonResponse({'created_timestamp': status.created_timestamp,
-                                        'user': status.user.get_full_name()}, status=202)
+        ensure_import_lock()
+        with transaction.atomic():
+            # Блокировка строки сериализует постановку в очередь конкурентными запросами
+            NSIImportLock.objects.select_for_update().get(pk=LOCK_ID)
+            if not NSIDataImportStatus.objects.filter(is_pending=True,
+                                                      phase=NSIDataImportStatus.PHASE_QUEUED).exists():
+                NSIDataImportStatus.objects.create(user=request.user)
+        # Задача запускается и при объединении запросов, на случай если ранее запущенная задача была потеряна
+        start_nsi_data_import_task()
+        status = get_current_import_status()
+        return UnicodeJsonResponse(dict_from_import_status(status), status=202 if status.is_pending else 200)
 
     def get(self, request, **kwargs):
-        status = NSIDataImportStatus.objects.filter(is_pending=True).first()
+        status = get_current_import_status()
         if not status:
             return HttpResponse()
-        else:
-            return UnicodeJsonResponse({'created_timestamp': status.created_timestamp,
-                                        'user': status.user.get_full_name()}, status=202)
+        return UnicodeJsonResponse(dict_from_import_status(status), status=202 if status.is_pending else 200)
 
 
 def dict_from_individual_instance(individual: Individual) -> Dict:
@@ -283,3 +408,95 @@ class NSIAPIView(LoginRequiredMixin, View):
         employees_qs = Employee.objects.filter(is_deleted=False).order_by('employee_number')[:limit]
         result = [dict_from_employee_instance(e) for e in employees_qs]
         return UnicodeJsonResponse(result)
+
+
+def dict_from_pipeline_instance(pipeline: Pipeline, instance: PipelineInstance) -> Dict:
+    res = pipeline.to_dict()
+    res['input_data'] = instance.input_data
+    res['output_data'] = instance.output_data
+    res['cached_nodes'] = instance.cached_nodes
+    res['error'] = instance.error
+    res['is_ready'] = instance.is_ready
+    res['is_processing'] = instance.is_processing
+    return res
+
+
+def has_pipeline_perm(user, pipeline: Pipeline, action: str) -> bool:
+    """
+    Проверяет права пользователя на все модели конвейера
+    :param action: view или change
+    """
+    return all(user.has_perm(f'core.{action}_{model_id}') for model_id in pipeline.get_model_ids())
+
+
+class PipelineAPIView(LoginRequiredMixin, View):
+    """
+    REST JSON API for model pipelines. Pipeline is calculated by uWSGI spooler
+    """
+
+    def get(self, request, **kwargs):
+        pipelines = get_pipelines()
+        requested_pipeline_id = kwargs.get('pipeline_id')
+        if not requested_pipeline_id:
+            return UnicodeJsonResponse([pipeline.to_dict() for pipeline in pipelines.values()
+                                        if has_pipeline_perm(request.user, pipeline, 'view')])
+
+        pipeline = pipelines.get(requested_pipeline_id)
+        if not pipeline:
+            return HttpResponseNotFound()
+
+        if not has_pipeline_perm(request.user, pipeline, 'view'):
+            return HttpResponseForbidden("Отсутствуют права доступа для просмотра данного конвейера!")
+
+        instance, created_flag = PipelineInstance.objects.get_or_create(user=request.user,
+                                                                        pipeline_id=pipeline.id)
+        return UnicodeJsonResponse(dict_from_pipeline_instance(pipeline, instance))
+
+    def put(self, request, **kwargs):
+        pipeline = get_pipelines().get(kwargs.get('pipeline_id'))
+        if not pipeline:
+            return HttpResponseNotFound()
+
+        if not has_pipeline_perm(request.user, pipeline, 'change'):
+            return HttpResponseForbidden("Отсутствуют права доступа для изменения данного конвейера!")
+
+        request_data = json.loads(request.body.decode("utf-8"))
+        if not isinstance(request_data, dict) or not request_data.keys() <= pipeline.nodes.keys():
+            return UnicodeJsonResponse({'bad_request_reason': 'Входные данные не соответствуют узлам конвейера'},
+                                       status=400)
+
+        # Входные данные узлов, не зависящих от других узлов, проверяются до постановки в очередь
+        for node in pipeline.get_root_nodes():
+            try:
+                node.model_class.parse_input(node.get_input_data(request_data.get(node.name), {}))
+            except CalculationError as e:
+                return UnicodeJsonResponse({'bad_request_reason': f'{node.verbose_name}: {e}'}, status=400)
+
+        instance, created_flag = PipelineInstance.objects.get_or_create(user=request.user,
+                                                                        pipeline_id=pipeline.id)
+        instance.input_data = request_data
+        instance.is_processing = True
+        instance.is_ready = False
+        instance.save(update_fields=['input_data', 'updated_timestamp'] + instance.status_fields)
+        start_pipeline_task(instance.pk)
+        return UnicodeJsonResponse({'is_processing': True}, status=202)
+
+
+class PipelineStatusAPIView(LoginRequiredMixin, View):
+    """
+    REST JSON API for pipeline calculation status
+    """
+
+    def get(self, request, **kwargs):
+        pipeline = get_pipelines().get(kwargs.get('pipeline_id'))
+        if not pipeline:
+            return HttpResponseNotFound()
+
+        if not has_pipeline_perm(request.user, pipeline, 'view'):
+            return HttpResponseForbidden("Отсутствуют права доступа для просмотра данного конвейера!")
+
+        status = PipelineInstance.objects.filter(user=request.user, pipeline_id=pipeline.id).values(
+            *PipelineInstance.status_fields).first()
+        if status is None:
+            return HttpResponseNotFound()
+        return UnicodeJsonResponse(status)
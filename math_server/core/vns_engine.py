@@ -0,0 +1,120 @@
+# coding: utf-8
+from datetime import date
+from typing import List, NamedTuple, Sequence, Tuple
+import numpy as np
+
+
+class WellParams(NamedTuple):
+    """
+    Параметры профиля новой скважины
+    start_date: дата ввода скважины в эксплуатацию
+    start_debit: стартовый дебит жидкости, м3/сут
+    decline_rate: начальный темп падения дебита, д.ед./год
+    decline_exponent: показатель степени кривой Арпса, 0 - экспоненциальное падение, 1 - гармоническое
+    horizon: горизонт прогноза, мес
+    gtm: мероприятия ГТМ: (дата, прирост дебита, м3/сут, длительность выхода на эффект, мес)
+    """
+    start_date: date
+    start_debit: float
+    decline_rate: float
+    decline_exponent: float
+    horizon: int
+    gtm: Sequence[Tuple[date, float, float]] = ()
+
+
+class ProfileBatch(NamedTuple):
+    """
+    Профили скважин пакета. Массивы имеют размерность (скважины, месяцы горизонта), месяцы за пределами
+    горизонта скважины заполнены нулями
+    months: первые числа месяцев прогноза (datetime64[M])
+    days: количество дней работы в месяце, в первом месяце - с даты ввода скважины
+    base_debit: дебит без учета ГТМ, м3/сут
+    debit: дебит с учетом ГТМ, м3/сут
+    production: добыча за месяц, м3
+    """
+    months: np.ndarray
+    days: np.ndarray
+    base_debit: np.ndarray
+    debit: np.ndarray
+    production: np.ndarray
+
+
+def arps_decline(debit: np.ndarray, decline_rate: np.ndarray, exponent: np.ndarray,
+                 years: np.ndarray) -> np.ndarray:
+    """
+    Дебит по кривой падения Арпса через years лет: q0 / (1 + b * D * t) ^ (1 / b), при b = 0 - q0 * exp(-D * t).
+    Аргументы приводятся друг к другу по правилам broadcasting numpy
+    """
+    hyperbolic = exponent > 0
+    safe_exponent = np.where(hyperbolic, exponent, 1.0)
+    factor = np.where(hyperbolic,
+                      (1.0 + safe_exponent * decline_rate * years) ** (-1.0 / safe_exponent),
+                      np.exp(-decline_rate * years))
+    return debit * factor
+
+
+def calculate_profiles(wells: Sequence[WellParams]) -> ProfileBatch:
+    """
+    Рассчитывает помесячные профили добычи нескольких скважин за один вызов. Дебит в месяце определяется
+    по кривой падения на середину месяца. Эффект каждого ГТМ - прирост дебита, который достигает полной
+    величины равномерно за длительность выхода на эффект (0 - ступенчато с месяца проведения), после чего
+    снижается по кривой падения скважины
+    """
+    wells_count = len(wells)
+    horizon = max((well.horizon for well in wells), default=0)
+    if not horizon:
+        # Пустой пакет: массивы без месяцев
+        empty = np.zeros((wells_count, 0))
+        return ProfileBatch(empty.astype('datetime64[M]'), empty, empty, empty, empty)
+    gtm_count = max((len(well.gtm) for well in wells), default=0)
+
+    start_days = np.array([well.start_date for well in wells], dtype='datetime64[D]')
+    start_months = start_days.astype('datetime64[M]')
+    month_index = np.arange(horizon)
+    months = start_months[:, None] + month_index[None, :]
+    days = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(float)
+    # Первый месяц учитывается с даты ввода скважины
+    days[:, 0] -= (start_days - start_months.astype('datetime64[D]')).astype(float)
+    active = month_index[None, :] < np.array([well.horizon for well in wells])[:, None]
+    days = np.where(active, days, 0.0)
+
+    start_debit = np.array([well.start_debit for well in wells], dtype=float)[:, None]
+    decline_rate = np.array([well.decline_rate for well in wells], dtype=float)[:, None]
+    exponent = np.array([well.decline_exponent for well in wells], dtype=float)[:, None]
+    years = (month_index[None, :] + 0.5) / 12.0
+    base_debit = arps_decline(start_debit, decline_rate, exponent, years)
+
+    debit = base_debit
+    if gtm_count:
+        # Мероприятия скважин дополняются до одинакового количества мероприятиями с нулевым приростом
+        gtm_months = np.zeros((wells_count, gtm_count))
+        gtm_increments = np.zeros((wells_count, gtm_count))
+        gtm_ramps = np.zeros((wells_count, gtm_count))
+        for i, well in enumerate(wells):
+            for j, (gtm_date, increment, ramp) in enumerate(well.gtm):
+                gtm_months[i, j] = (np.datetime64(gtm_date, 'M') - start_months[i]).astype(int)
+                gtm_increments[i, j] = increment
+                gtm_ramps[i, j] = ramp
+
+        # Размерность (скважины, мероприятия, месяцы)
+        elapsed = month_index[None, None, :] - gtm_months[:, :, None]
+        ramps = gtm_ramps[:, :, None]
+        ramp_factor = np.where(ramps > 0, np.clip((elapsed + 1) / np.where(ramps > 0, ramps, 1.0), 0.0, 1.0), 1.0)
+        effect = arps_decline(gtm_increments[:, :, None] * ramp_factor, decline_rate[:, :, None],
+                              exponent[:, :, None], np.maximum(elapsed - ramps, 0.0) / 12.0)
+        debit = base_debit + np.where(elapsed >= 0, effect, 0.0).sum(axis=1)
+
+    debit = np.maximum(debit, 0.0)
+    return ProfileBatch(months, days, np.where(active, base_debit, 0.0), np.where(active, debit, 0.0),
+                        debit * days)
+
+
+def get_production_table(batch: ProfileBatch, well_index: int, horizon: int,
+                         start_date: date) -> List[list]:
+    """
+    Возвращает таблицу добычи скважины в формате production_table: дата, добыча за месяц, дебит в сутки
+    """
+    dates = batch.months[well_index, :horizon].astype('datetime64[D]').tolist()
+    dates[0] = start_date
+    return [[month_date, month_production, month_debit] for month_date, month_production, month_debit in zip(
+        dates, batch.production[well_index, :horizon].tolist(), batch.debit[well_index, :horizon].tolist())]
@@ -1,9 +1,42 @@
+from django.conf import settings
 from django_auth_ldap.backend import LDAPBackend
+from .ldap_pool import LDAPConnectionPool, PooledLDAPModule
+
+
+_connection_pool = None
+
+
+def get_connection_pool(ldap_module) -> LDAPConnectionPool:
+    """
+    Возвращает пул соединений процесса. Экземпляр бэкенда создается Django при каждой аутентификации,
+    поэтому пул хранится на уровне модуля
+    """
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = LDAPConnectionPool(ldap_module, settings.AUTH_LDAP_POOL_SIZE,
+                                              settings.AUTH_LDAP_POOL_IDLE_TIMEOUT,
+                                              settings.AUTH_LDAP_BIND_DN)
+    return _connection_pool
 
 
 class CustomLDAPBackend(LDAPBackend):
     """ A custom LDAP authentication backend """
 
+    @property
+    def ldap(self):
+        if self._ldap is None:
+            ldap_module = super().ldap
+            self._ldap = PooledLDAPModule(ldap_module, get_connection_pool(ldap_module))
+        return self._ldap
+
     def authenticate(self, request, username=None, password=None, **kwargs):
-        user = LDAPBackend().authenticate(self, username, password)
-        return user
+        with self.ldap.pool.session():
+            return super().authenticate(request, username, password, **kwargs)
+
+    def get_group_permissions(self, user, obj=None):
+        with self.ldap.pool.session():
+            return super().get_group_permissions(user, obj)
+
+    def populate_user(self, username):
+        with self.ldap.pool.session():
+            return super().populate_user(username)
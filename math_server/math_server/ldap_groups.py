@@ -0,0 +1,37 @@
+# coding: utf-8
+import hashlib
+from django.core.cache import cache
+from django_auth_ldap.config import GroupOfNamesType
+
+
+class CachedGroupOfNamesType(GroupOfNamesType):
+    """
+    Группы groupOfNames, список групп пользователя кэшируется на AUTH_LDAP_CACHE_TIMEOUT секунд. Флаги пользователя
+    (AUTH_LDAP_USER_FLAGS_BY_GROUP), зеркалирование групп и права групп определяются по результату одного поиска
+    вместо отдельного запроса к серверу для каждой группы при каждом входе
+    """
+
+    def get_cache_key(self, ldap_user) -> str:
+        user_dn = hashlib.sha1(ldap_user.dn.lower().encode('utf-8')).hexdigest()
+        return f'auth_ldap.user_groups.{user_dn}'
+
+    def user_groups(self, ldap_user, group_search):
+        timeout = ldap_user.settings.CACHE_TIMEOUT
+        if timeout <= 0 or ldap_user.dn is None:
+            return super().user_groups(ldap_user, group_search)
+
+        cache_key = self.get_cache_key(ldap_user)
+        groups = cache.get(cache_key)
+        if groups is None:
+            groups = super().user_groups(ldap_user, group_search)
+            cache.set(cache_key, groups, timeout)
+        return groups
+
+    def is_member(self, ldap_user, group_dn):
+        group_search = ldap_user.settings.GROUP_SEARCH
+        base_dn = getattr(group_search, 'base_dn', None)
+        if (ldap_user.settings.CACHE_TIMEOUT <= 0 or ldap_user.dn is None or not base_dn
+                or not group_dn.lower().endswith(f',{base_dn.lower()}')):
+            # Группы вне области поиска проверяются запросом к серверу
+            return super().is_member(ldap_user, group_dn)
+        return group_dn.lower() in {dn.lower() for dn, _ in self.user_groups(ldap_user, group_search)}
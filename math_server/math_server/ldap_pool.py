@@ -0,0 +1,243 @@
+# coding: utf-8
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+class PooledConnection(object):
+    """
+    Соединение с сервером LDAP, хранящееся в пуле, и его состояние: учетная запись последней успешной привязки
+    и признак установленного TLS
+    """
+
+    def __init__(self, uri: str, connection: Any) -> None:
+        self.uri = uri
+        self.connection = connection
+        self.bound_as: Optional[Tuple[str, str]] = None
+        self.tls_started = False
+        self.released_at = time.monotonic()
+
+
+def get_bind_identity(who: str, cred: Any) -> Tuple[str, str]:
+    """
+    Возвращает идентификатор учетных данных привязки. Пароль в пуле не хранится, сравнивается его хэш
+    """
+    if isinstance(cred, str):
+        cred = cred.encode('utf-8')
+    return who or '', hashlib.sha256(cred or b'').hexdigest()
+
+
+class LDAPConnectionPool(object):
+    """
+    Пул соединений с сервером LDAP в пределах процесса. Свободные соединения переиспользуются вместо установки
+    нового соединения при каждом входе пользователя. Соединения, выданные потоку, возвращаются в пул по окончании
+    сеанса (см. session), число свободных соединений ограничено size, соединения, простаивавшие дольше
+    idle_timeout секунд, закрываются. Повторная привязка не выполняется только для служебной учетной записи
+    service_bind_dn, привязка с учетными данными пользователя выполняется всегда, чтобы сервер проверял пароль,
+    блокировку и состояние учетной записи при каждом входе
+    """
+
+    def __init__(self, ldap_module: Any, size: int, idle_timeout: float,
+                 service_bind_dn: Optional[str] = None) -> None:
+        self.ldap = ldap_module
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.service_bind_dn = service_bind_dn
+        self._lock = threading.Lock()
+        self._idle: Dict[str, Deque[PooledConnection]] = defaultdict(deque)
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def connect(self, uri: str, **kwargs) -> Any:
+        # При обрыве соединения (например, по таймауту простоя на сервере) операция повторяется после
+        # переподключения с восстановлением параметров, TLS и последней привязки
+        return self.ldap.ldapobject.ReconnectLDAPObject(uri, retry_max=1, retry_delay=0, **kwargs)
+
+    def checkout(self, uri: str, **kwargs) -> PooledConnection:
+        stale: List[PooledConnection] = []
+        pooled = None
+        with self._lock:
+            if self._pid != os.getpid():
+                # Соединения, унаследованные от родительского процесса, не используются
+                self._idle.clear()
+                self._pid = os.getpid()
+            idle = self._idle[uri]
+            now = time.monotonic()
+            while idle:
+                candidate = idle.pop()
+                if now - candidate.released_at > self.idle_timeout:
+                    stale.append(candidate)
+                else:
+                    pooled = candidate
+                    break
+        for connection in stale:
+            self.close(connection)
+        return pooled or PooledConnection(uri, self.connect(uri, **kwargs))
+
+    def checkin(self, pooled: PooledConnection) -> None:
+        pooled.released_at = time.monotonic()
+        with self._lock:
+            idle = self._idle[pooled.uri]
+            if self._pid == os.getpid() and len(idle) < self.size:
+                idle.append(pooled)
+                return
+        self.close(pooled)
+
+    def close(self, pooled: PooledConnection) -> None:
+        try:
+            pooled.connection.unbind_s()
+        except self.ldap.LDAPError:
+            pass
+
+    def register(self, lease: 'LDAPConnectionLease') -> None:
+        leases = getattr(self._local, 'leases', None)
+        if leases is None:
+            leases = self._local.leases = []
+        leases.append(lease)
+
+    def is_reusable_bind(self, who: str) -> bool:
+        return self.service_bind_dn is not None and (who or '') == self.service_bind_dn
+
+    def session(self) -> 'LDAPPoolSession':
+        return LDAPPoolSession(self)
+
+    def release_thread_leases(self) -> None:
+        leases = getattr(self._local, 'leases', None) or []
+        self._local.leases = []
+        for lease in leases:
+            lease.release()
+
+
+class LDAPPoolSession(object):
+    """
+    Контекстный менеджер, по выходу из которого соединения, полученные текущим потоком, возвращаются в пул.
+    Вложенные сеансы освобождают соединения только по выходу из внешнего сеанса
+    """
+
+    def __init__(self, pool: LDAPConnectionPool) -> None:
+        self.pool = pool
+
+    def __enter__(self) -> 'LDAPPoolSession':
+        local = self.pool._local
+        local.depth = getattr(local, 'depth', 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        local = self.pool._local
+        local.depth -= 1
+        if not local.depth:
+            self.pool.release_thread_leases()
+
+
+class LDAPConnectionLease(object):
+    """
+    Объект соединения, возвращаемый django-auth-ldap вместо LDAPObject. Соединение из пула берется при первой
+    операции и возвращается в пул по окончании сеанса; при повторном использовании после возврата берется другое
+    соединение, к которому применяются параметры, TLS и последняя привязка. Повторная привязка служебной учетной
+    записи с теми же учетными данными и повторный STARTTLS на соединении из пула не выполняются
+    """
+
+    def __init__(self, pool: LDAPConnectionPool, uri: str, **kwargs) -> None:
+        self.pool = pool
+        self.uri = uri
+        self.connect_kwargs = kwargs
+        self.pooled: Optional[PooledConnection] = None
+        self.options: Dict[int, Any] = {}
+        self.start_tls = False
+        self.last_bind: Optional[Tuple[str, Any]] = None
+
+    def acquire(self) -> PooledConnection:
+        if self.pooled is not None:
+            return self.pooled
+        pooled = self.pool.checkout(self.uri, **self.connect_kwargs)
+        self.pool.register(self)
+        self.pooled = pooled
+        try:
+            for option, value in self.options.items():
+                pooled.connection.set_option(option, value)
+            if self.start_tls and not pooled.tls_started:
+                pooled.connection.start_tls_s()
+                pooled.tls_started = True
+            if self.last_bind is not None:
+                self.bind(pooled, *self.last_bind)
+        except BaseException:
+            self.pooled = None
+            self.pool.close(pooled)
+            raise
+        return pooled
+
+    def release(self) -> None:
+        pooled, self.pooled = self.pooled, None
+        if pooled is not None:
+            self.pool.checkin(pooled)
+
+    def bind(self, pooled: PooledConnection, who: str, cred: Any) -> Any:
+        identity = get_bind_identity(who, cred)
+        if pooled.bound_as == identity and self.pool.is_reusable_bind(who):
+            return None
+        pooled.bound_as = None
+        result = pooled.connection.simple_bind_s(who, cred)
+        pooled.bound_as = identity
+        return result
+
+    def simple_bind_s(self, who: str = '', cred: Any = '', *args, **kwargs) -> Any:
+        pooled = self.acquire()
+        self.last_bind = None
+        if args or kwargs:
+            # Привязка с элементами управления не кэшируется
+            pooled.bound_as = None
+            return pooled.connection.simple_bind_s(who, cred, *args, **kwargs)
+        result = self.bind(pooled, who, cred)
+        self.last_bind = (who, cred)
+        return result
+
+    def set_option(self, option: int, value: Any) -> None:
+        self.options[option] = value
+        if self.pooled is not None:
+            self.pooled.connection.set_option(option, value)
+
+    def start_tls_s(self) -> None:
+        self.start_tls = True
+        pooled = self.acquire()
+        if not pooled.tls_started:
+            pooled.connection.start_tls_s()
+            pooled.tls_started = True
+
+    def unbind_s(self, *args, **kwargs) -> None:
+        # Соединение остается открытым и возвращается в пул
+        self.release()
+
+    unbind = unbind_s
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        attribute = getattr(self.acquire().connection, name)
+        if not callable(attribute):
+            return attribute
+
+        def method(*args, **kwargs):
+            # Соединение получается заново при каждом вызове, так как могло быть возвращено в пул
+            return getattr(self.acquire().connection, name)(*args, **kwargs)
+
+        return method
+
+
+class PooledLDAPModule(object):
+    """
+    Модуль python-ldap, у которого initialize возвращает соединение из пула. Остальные атрибуты (исключения,
+    константы, вспомогательные модули) берутся из исходного модуля
+    """
+
+    def __init__(self, ldap_module: Any, pool: LDAPConnectionPool) -> None:
+        self._module = ldap_module
+        self.pool = pool
+
+    def initialize(self, uri: str, **kwargs) -> LDAPConnectionLease:
+        return LDAPConnectionLease(self.pool, uri, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._module, name)
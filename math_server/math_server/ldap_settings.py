@@ -1,5 +1,6 @@
 import ldap
-from django_auth_ldap.config import LDAPSearch, GroupOfNamesType
+from django_auth_ldap.config import LDAPSearch
+from .ldap_groups import CachedGroupOfNamesType
 
 AUTH_LDAP_SERVER_URI = "ldap://localhost:1389"
 
@@ -18,7 +19,7 @@ AUTH_LDAP_GROUP_SEARCH = LDAPSearch(
     ldap.SCOPE_SUBTREE,
     "(objectClass=groupOfNames)",
 )
-AUTH_LDAP_GROUP_TYPE = GroupOfNamesType(name_attr="cn")
+AUTH_LDAP_GROUP_TYPE = CachedGroupOfNamesType(name_attr="cn")
 
 # Simple group restrictions
 # AUTH_LDAP_REQUIRE_GROUP = "cn=enabled,ou=ispd_groups,dc=example,dc=org"
@@ -44,11 +45,18 @@ AUTH_LDAP_ALWAYS_UPDATE_USER = True
 AUTH_LDAP_FIND_GROUP_PERMS = True
 
 AUTH_LDAP_MIRROR_GROUPS = True
-AUTH_LDAP_CACHE_GROUPS = False
 
 AUTH_LDAP_MIRROR_GROUPS_EXCEPT = ['enabled', 'disabled', 'is_active', 'is_staff', 'is_superuser']
 
-AUTH_LDAP_CACHE_TIMEOUT = 3600
+# DN пользователя и список его групп кэшируются в кэше по умолчанию, изменение членства в группах LDAP
+# вступает в силу не позднее чем через указанное время, сек
+AUTH_LDAP_CACHE_TIMEOUT = 300
+
+# Максимальное количество свободных соединений с сервером LDAP в пуле процесса
+AUTH_LDAP_POOL_SIZE = 10
+
+# Свободные соединения, не использовавшиеся указанное время, закрываются, сек
+AUTH_LDAP_POOL_IDLE_TIMEOUT = 300
 
 AUTHENTICATION_BACKENDS = (
     "math_server.auth_backend.CustomLDAPBackend",
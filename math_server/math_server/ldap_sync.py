@@ -0,0 +1,280 @@
+# coding: utf-8
+import logging
+import re
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
+from django.contrib.auth.models import Group
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from ldap.controls import SimplePagedResultsControl
+from .auth_backend import CustomLDAPBackend
+
+
+logger = logging.getLogger(__name__)
+
+LDAPEntry = Tuple[str, Dict[str, List[bytes]]]
+
+
+class LDAPSyncReport(object):
+    """
+    Результат синхронизации пользователей и групп с каталогом LDAP
+    """
+
+    def __init__(self) -> None:
+        self.users_created: List[str] = []
+        self.users_updated: Dict[str, List[str]] = {}
+        self.users_unchanged = 0
+        self.users_missing: List[str] = []
+        self.users_deactivated: List[str] = []
+        self.groups_created: List[str] = []
+        self.memberships_added = 0
+        self.memberships_removed = 0
+
+    def __str__(self) -> str:
+        return (f'пользователи: создано {len(self.users_created)}, изменено {len(self.users_updated)}, '
+                f'без изменений {self.users_unchanged}, отсутствуют в LDAP {len(self.users_missing)}, '
+                f'заблокировано {len(self.users_deactivated)}; группы: создано {len(self.groups_created)}; '
+                f'членство в группах: добавлено {self.memberships_added}, удалено {self.memberships_removed}')
+
+
+def decode_value(value: Any) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def iter_paged_search(connection, base_dn: str, scope: int, filterstr: str, attrlist: List[str],
+                      page_size: int) -> Iterator[LDAPEntry]:
+    """
+    Выполняет поиск постранично (RFC 2696), чтобы не превышать ограничение сервера на размер результата
+    и не загружать весь результат в память соединения
+    """
+    control = SimplePagedResultsControl(True, size=page_size, cookie='')
+    while True:
+        msgid = connection.search_ext(base_dn, scope, filterstr, attrlist, serverctrls=[control])
+        _, results, _, response_controls = connection.result3(msgid)
+        for dn, attrs in results:
+            # Ссылки на другие серверы (referrals) возвращаются без DN
+            if dn:
+                yield dn, attrs
+        cookies = [c.cookie for c in response_controls
+                   if c.controlType == SimplePagedResultsControl.controlType]
+        if not cookies or not cookies[0]:
+            return
+        control.cookie = cookies[0]
+
+
+def get_username_attr(filterstr: str) -> str:
+    """
+    Возвращает атрибут имени пользователя из фильтра AUTH_LDAP_USER_SEARCH, например uid для (uid=%(user)s)
+    """
+    match = re.search(r'\(([\w-]+)=%\(user\)s\)', filterstr)
+    if not match:
+        raise ImproperlyConfigured('AUTH_LDAP_USER_SEARCH filter must contain "(<attribute>=%(user)s)"')
+    return match.group(1)
+
+
+def get_flag_group_dns(group_dns: Any) -> Set[str]:
+    if isinstance(group_dns, str):
+        return {group_dns.lower()}
+    if isinstance(group_dns, (list, tuple)) and all(isinstance(dn, str) for dn in group_dns):
+        return {dn.lower() for dn in group_dns}
+    raise ImproperlyConfigured('AUTH_LDAP_USER_FLAGS_BY_GROUP values must be group DNs or lists of group DNs')
+
+
+class LDAPDirectorySync(object):
+    """
+    Загружает пользователей и группы из каталога LDAP постраничным поиском и приводит к ним пользователей и группы
+    Django пакетными операциями по тем же правилам, что и CustomLDAPBackend при входе пользователя:
+    AUTH_LDAP_USER_ATTR_MAP, AUTH_LDAP_USER_FLAGS_BY_GROUP и зеркалирование групп с учетом
+    AUTH_LDAP_MIRROR_GROUPS_EXCEPT
+    """
+
+    def __init__(self, page_size: int = 500, batch_size: int = 1000,
+                 backend: Optional[CustomLDAPBackend] = None) -> None:
+        self.backend = backend or CustomLDAPBackend()
+        self.settings = self.backend.settings
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.user_model = get_user_model()
+
+    def connect(self):
+        connection = self.backend.ldap.initialize(self.settings.SERVER_URI, bytes_mode=False)
+        for option, value in self.settings.CONNECTION_OPTIONS.items():
+            connection.set_option(option, value)
+        if self.settings.START_TLS:
+            connection.start_tls_s()
+        connection.simple_bind_s(self.settings.BIND_DN, self.settings.BIND_PASSWORD)
+        return connection
+
+    def load_users(self, connection) -> Dict[str, Dict[str, Any]]:
+        """
+        :return: значения полей пользователей Django по DN пользователя в нижнем регистре
+        """
+        user_search = self.settings.USER_SEARCH
+        if user_search is None:
+            raise ImproperlyConfigured('AUTH_LDAP_USER_SEARCH must be an LDAPSearch instance')
+        username_attr = get_username_attr(user_search.filterstr)
+        filterstr = user_search.filterstr.replace('%(user)s', '*')
+        attrlist = [username_attr] + list(self.settings.USER_ATTR_MAP.values())
+
+        users = {}
+        for dn, attrs in iter_paged_search(connection, user_search.base_dn, user_search.scope, filterstr,
+                                           attrlist, self.page_size):
+            attrs = {name.lower(): values for name, values in attrs.items()}
+            if not attrs.get(username_attr.lower()):
+                continue
+            username = self.backend.ldap_to_django_username(decode_value(attrs[username_attr.lower()][0])).lower()
+            fields = {self.user_model.USERNAME_FIELD: username}
+            for field, attr in self.settings.USER_ATTR_MAP.items():
+                values = attrs.get(attr.lower())
+                if values:
+                    fields[field] = decode_value(values[0])
+            users[dn.lower()] = fields
+        return users
+
+    def load_groups(self, connection) -> Dict[str, Tuple[Optional[str], Set[str]]]:
+        """
+        :return: имя группы Django и DN участников (в нижнем регистре) по DN группы в нижнем регистре
+        """
+        group_search = self.settings.GROUP_SEARCH
+        group_type = self.settings.GROUP_TYPE
+        member_attr = getattr(group_type, 'member_attr', None)
+        if group_search is None or member_attr is None:
+            raise ImproperlyConfigured('Directory sync requires AUTH_LDAP_GROUP_SEARCH and a member DN group type')
+
+        groups = {}
+        for dn, attrs in iter_paged_search(connection, group_search.base_dn, group_search.scope,
+                                           group_search.filterstr, [group_type.name_attr, member_attr],
+                                           self.page_size):
+            attrs = {name.lower(): values for name, values in attrs.items()}
+            names = attrs.get(group_type.name_attr.lower())
+            members = {decode_value(member).lower() for member in attrs.get(member_attr.lower(), [])}
+            groups[dn.lower()] = (decode_value(names[0]) if names else None, members)
+        return groups
+
+    def is_mirrored_group(self, name: str) -> bool:
+        mirror_groups_except = self.settings.MIRROR_GROUPS_EXCEPT
+        mirror_groups = self.settings.MIRROR_GROUPS
+        if mirror_groups_except is not None:
+            return name not in mirror_groups_except
+        if isinstance(mirror_groups, (list, tuple, set, frozenset)):
+            return name in mirror_groups
+        return bool(mirror_groups)
+
+    def apply_flags(self, users: Dict[str, Dict[str, Any]],
+                    groups: Dict[str, Tuple[Optional[str], Set[str]]]) -> None:
+        for field, group_dns in self.settings.USER_FLAGS_BY_GROUP.items():
+            members: Set[str] = set()
+            for group_dn in get_flag_group_dns(group_dns):
+                members.update(groups.get(group_dn, (None, set()))[1])
+            for user_dn, fields in users.items():
+                fields[field] = user_dn in members
+
+    def sync_users(self, users: Dict[str, Dict[str, Any]], report: LDAPSyncReport,
+                   deactivate_missing: bool) -> Dict[str, int]:
+        """
+        Создает и изменяет пользователей пакетными запросами
+        :return: идентификаторы пользователей по DN пользователя
+        """
+        username_field = self.user_model.USERNAME_FIELD
+        fields = sorted({field for user_fields in users.values() for field in user_fields} - {username_field})
+        existing = {getattr(user, username_field).lower(): user
+                    for user in self.user_model.objects.only(username_field, 'password', 'is_active', *fields)}
+
+        to_create = []
+        to_update = []
+        for user_fields in users.values():
+            username = user_fields[username_field]
+            user = existing.get(username)
+            if user is None:
+                user = self.user_model(**user_fields)
+                user.password = make_password(None)
+                to_create.append(user)
+                report.users_created.append(username)
+                continue
+            changed = [field for field in fields
+                       if field in user_fields and getattr(user, field) != user_fields[field]]
+            if changed:
+                for field in changed:
+                    setattr(user, field, user_fields[field])
+                to_update.append(user)
+                report.users_updated[username] = changed
+            else:
+                report.users_unchanged += 1
+
+        ldap_usernames = {user_fields[username_field] for user_fields in users.values()}
+        to_deactivate = []
+        for username, user in existing.items():
+            # Пользователи с паролем в базе данных созданы локально и в LDAP не ищутся
+            if username in ldap_usernames or not user.password.startswith(UNUSABLE_PASSWORD_PREFIX):
+                continue
+            report.users_missing.append(username)
+            if deactivate_missing and user.is_active:
+                user.is_active = False
+                to_deactivate.append(user)
+                report.users_deactivated.append(username)
+
+        self.user_model.objects.bulk_create(to_create, batch_size=self.batch_size)
+        if to_update and fields:
+            self.user_model.objects.bulk_update(to_update, fields, batch_size=self.batch_size)
+        if to_deactivate:
+            self.user_model.objects.bulk_update(to_deactivate, ['is_active'], batch_size=self.batch_size)
+
+        user_ids = {username.lower(): pk for username, pk in
+                    self.user_model.objects.values_list(username_field, 'pk').iterator()}
+        return {user_dn: user_ids[user_fields[username_field]] for user_dn, user_fields in users.items()
+                if user_fields[username_field] in user_ids}
+
+    def sync_memberships(self, user_ids: Dict[str, int], groups: Dict[str, Tuple[Optional[str], Set[str]]],
+                         report: LDAPSyncReport) -> None:
+        """
+        Приводит членство пользователей LDAP в зеркалируемых группах к каталогу, записывая только разницу
+        """
+        mirrored_names = {name for name, _ in groups.values() if name and self.is_mirrored_group(name)}
+        existing_names = set(Group.objects.filter(name__in=mirrored_names).values_list('name', flat=True))
+        new_groups = [Group(name=name) for name in sorted(mirrored_names - existing_names)]
+        Group.objects.bulk_create(new_groups, batch_size=self.batch_size)
+        report.groups_created.extend(group.name for group in new_groups)
+
+        group_ids = dict(Group.objects.filter(name__in=mirrored_names).values_list('name', 'pk'))
+        target: Set[Tuple[int, int]] = set()
+        for name, members in groups.values():
+            if name in group_ids:
+                target.update((user_ids[member], group_ids[name]) for member in members if member in user_ids)
+
+        membership_model = self.user_model.groups.through
+        synced_user_ids = set(user_ids.values())
+        current: Dict[Tuple[int, int], int] = {}
+        for pk, user_id, group_id, group_name in membership_model.objects.values_list(
+                'pk', 'user_id', 'group_id', 'group__name').iterator():
+            if user_id in synced_user_ids and self.is_mirrored_group(group_name):
+                current[(user_id, group_id)] = pk
+
+        to_remove = [pk for pair, pk in current.items() if pair not in target]
+        for batch_start in range(0, len(to_remove), self.batch_size):
+            membership_model.objects.filter(pk__in=to_remove[batch_start:batch_start + self.batch_size]).delete()
+        to_add = [membership_model(user_id=user_id, group_id=group_id)
+                  for user_id, group_id in sorted(target - set(current))]
+        membership_model.objects.bulk_create(to_add, batch_size=self.batch_size)
+        report.memberships_removed = len(to_remove)
+        report.memberships_added = len(to_add)
+
+    def run(self, dry_run: bool = False, deactivate_missing: bool = False) -> LDAPSyncReport:
+        """
+        :param dry_run: только сформировать отчет об изменениях без записи в базу данных
+        :param deactivate_missing: заблокировать пользователей, созданных из LDAP и отсутствующих в каталоге
+        """
+        with self.backend.ldap.pool.session():
+            connection = self.connect()
+            users = self.load_users(connection)
+            groups = self.load_groups(connection)
+        logger.info(f'Loaded {len(users)} users and {len(groups)} groups from LDAP')
+        self.apply_flags(users, groups)
+
+        report = LDAPSyncReport()
+        with transaction.atomic():
+            user_ids = self.sync_users(users, report, deactivate_missing)
+            self.sync_memberships(user_ids, groups, report)
+            if dry_run:
+                transaction.set_rollback(True)
+        return report
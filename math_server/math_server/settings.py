@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from .ldap_settings import *
 
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.RequestTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -121,6 +123,21 @@ STATICFILES_DIRS = [
     BASE_DIR / 'node_modules',
 ]
 
+# Сборка js и css выполняется заранее командой build_assets (django-compressor offline), шаблоны используют
+# минифицированные файлы с хэшем содержимого в имени из манифеста сборок
+COMPRESS_OFFLINE = True
+
+COMPRESS_FILTERS = {
+    'css': ['compressor.filters.css_default.CssAbsoluteFilter', 'compressor.filters.cssmin.rCSSMinFilter'],
+    'js': ['compressor.filters.jsmin.rJSMinFilter'],
+}
+
+# Хэш в ссылках на шрифты и изображения из css вычисляется по содержимому, а не по времени изменения файлов
+COMPRESS_CSS_HASHING_METHOD = 'content'
+
+# Помимо сборок сохраняются их сжатые копии .gz и .br для отдачи веб-сервером без сжатия на лету
+COMPRESS_STORAGE = 'core.storage.PrecompressedCompressorFileStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -148,14 +165,94 @@ MATH_MODELS_AVAILABLE = {
     ],
     'Дополнительные модели': [
         'core.models.WellProductionModel',
+        'core.models.VNSWellModel',
     ]
 }
 
+# Конвейеры моделей: результаты узлов передаются во входные данные других узлов (links: поле -> узел.ключ результата)
+MATH_PIPELINES_AVAILABLE = {
+    'reserves_value': {
+        'verbose_name': 'Прогноз добычи и стоимость извлекаемых запасов',
+        'nodes': {
+            'production': {'model': 'core.models.WellProductionModel'},
+            'value': {
+                'model': 'core.models.SimpleCalculatorModel',
+                'verbose_name': 'Стоимость извлекаемых запасов',
+                'input_data': {'op': 'mul'},
+                'links': {'val1': 'production.niz'},
+            },
+        },
+    },
+}
+# Количество процессов для параллельного вычисления независимых ветвей конвейера
+PIPELINE_WORKERS = os.cpu_count() or 1
+# Максимальная длительность вычисления узла конвейера в пуле процессов, сек
+PIPELINE_NODE_TIMEOUT = 60 * 60
+# Время хранения результатов узлов конвейеров с момента последнего обращения, сек
+PIPELINE_RESULT_TTL = 7 * 24 * 60 * 60
+
+# Фоновый пересчет результатов, вычисленных предыдущими версиями алгоритмов моделей: размер пакета
+# и пауза между пакетами, сек
+RECOMPUTE_BATCH_SIZE = 20
+RECOMPUTE_BATCH_PAUSE = 1.0
+
+# Кэш ответов, не зависящих от пользователя: шаблоны SPA и список моделей. Для тестов и нескольких процессов
+# может использоваться, например, django.core.cache.backends.filebased.FileBasedCache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': None,
+    },
+}
+RESPONSE_CACHE_ALIAS = 'responses'
+# Настройки, при изменении которых закэшированные ответы становятся недействительными
+RESPONSE_CACHE_VERSION_SETTINGS = ['MATH_MODELS_AVAILABLE', 'STATIC_URL', 'STATICFILES_STORAGE', 'LANGUAGE_CODE',
+                                   'DEBUG']
+
 LOGIN_URL = 'login/'
 LOGOUT_URL = 'logout/'
 LOGOUT_REDIRECT_URL = '/'
 CUSTOM_DATETIME_FORMAT = '%d.%m.%Y'
 
+# Количество точек графика результатов модели по умолчанию и максимальное количество точек, запрашиваемое клиентом
+CHART_DEFAULT_POINTS = 500
+CHART_MAX_POINTS = 5000
+
+# Доля запросов, для которых замеряются длительности фаз обработки (заголовок Server-Timing)
+REQUEST_TIMING_SAMPLE_RATE = 0.05
+
+# Каталог для сохранения профилей вычислений моделей и интервал сэмплирования стека, сек
+MATH_MODEL_PROFILES_DIR = BASE_DIR / 'profiles'
+MATH_MODEL_PROFILING_SAMPLE_INTERVAL = 0.005
+
 NSI_EXPORTED_DATA_DIR = BASE_DIR / 'exported_data'
 NSI_EXPORTED_DATA_FILE_PATH = NSI_EXPORTED_DATA_DIR / 'Message_000_008.xml'
 NSI_ACK_FILE_PATH = NSI_EXPORTED_DATA_DIR / 'Message_008_000.xml'
+# Количество записей выгрузки НСИ, обрабатываемых за один шаг импорта
+NSI_IMPORT_BATCH_SIZE = 5000
+# Количество записей в одном запросе INSERT ... ON CONFLICT при сохранении данных НСИ
+NSI_IMPORT_WRITE_BATCH_SIZE = 1000
+# Параллельный разбор выгрузки НСИ: количество процессов, минимальный размер файла и размер шарда, байт
+NSI_IMPORT_WORKERS = os.cpu_count() or 1
+NSI_IMPORT_PARALLEL_MIN_FILE_SIZE = 64 * 1024 * 1024
+NSI_IMPORT_SHARD_SIZE = 16 * 1024 * 1024
+# Минимальный интервал сохранения хода выполнения импорта данных НСИ, сек
+NSI_IMPORT_PROGRESS_SAVE_INTERVAL = 1.0
+# Срок аренды импорта данных НСИ, сек. Импорт продлевает аренду по ходу выполнения, аренда аварийно
+# завершившегося импорта может быть захвачена по истечении срока
+NSI_IMPORT_LEASE_TTL = 60
+# Количество отклоненных записей, сохраняемых с причинами в итогах импорта данных НСИ
+NSI_IMPORT_REJECTED_REPORT_LIMIT = 100
+# Обработка каталога входящих выгрузок НСИ командой watch_nsi_inbox: шаблон имени файлов выгрузки,
+# каталоги обработанных и ошибочных файлов, интервал опроса и время, в течение которого файл не должен
+# изменяться перед обработкой, сек, размер очередей между стадиями конвейера, пакетов
+NSI_INBOX_FILE_PATTERN = 'Message_000_008*.xml'
+NSI_ARCHIVE_DIR = NSI_EXPORTED_DATA_DIR / 'archive'
+NSI_FAILED_DIR = NSI_EXPORTED_DATA_DIR / 'failed'
+NSI_INBOX_POLL_INTERVAL = 10
+NSI_INBOX_SETTLE_TIME = 5
+NSI_INBOX_QUEUE_SIZE = 4
@@ -0,0 +1,382 @@
+import re
+from io import StringIO
+from typing import Any, Dict, List, Optional
+from unittest import mock
+import ldap
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django_auth_ldap.config import LDAPSearch
+from ldap.controls import SimplePagedResultsControl
+from .ldap_groups import CachedGroupOfNamesType
+from .ldap_pool import LDAPConnectionLease, LDAPConnectionPool
+from .ldap_sync import LDAPDirectorySync
+
+
+SERVICE_DN = 'cn=admin,dc=example,dc=org'
+USERS_DN = 'ou=ispd_users,dc=example,dc=org'
+GROUPS_DN = 'ou=ispd_groups,dc=example,dc=org'
+
+
+class FakeDirectory(object):
+    """
+    Каталог LDAP в памяти: записи, пароли и счетчики операций всех соединений
+    """
+
+    def __init__(self) -> None:
+        self.entries: Dict[str, Dict[str, List[bytes]]] = {}
+        self.passwords: Dict[str, str] = {SERVICE_DN: 'adminpassword'}
+        self.connections: List['FakeLDAPObject'] = []
+
+    def add_user(self, uid: str, password: str) -> str:
+        dn = f'uid={uid},{USERS_DN}'
+        self.entries[dn] = {'uid': [uid.encode()], 'givenName': [uid.capitalize().encode()], 'sn': [b'Test'],
+                            'mail': [f'{uid}@example.org'.encode()]}
+        self.passwords[dn] = password
+        return dn
+
+    def set_group(self, name: str, member_dns: List[str]) -> None:
+        self.entries[f'cn={name},{GROUPS_DN}'] = {'objectClass': [b'groupOfNames'], 'cn': [name.encode()],
+                                                  'member': [dn.encode() for dn in member_dns]}
+
+    def count(self, operation: str) -> int:
+        return sum(len([call for call in c.calls if call[0] == operation]) for c in self.connections)
+
+
+class FakeLDAPObject(object):
+    """
+    Соединение с каталогом FakeDirectory, записывающее выполненные операции
+    """
+
+    def __init__(self, directory: FakeDirectory, uri: str) -> None:
+        self.directory = directory
+        self.uri = uri
+        self.calls: List[tuple] = []
+        self.options: Dict[int, Any] = {}
+        self.bound_dn: Optional[str] = None
+        self.pages: List[tuple] = []
+        directory.connections.append(self)
+
+    def set_option(self, option: int, value: Any) -> None:
+        self.calls.append(('set_option', option, value))
+        self.options[option] = value
+
+    def start_tls_s(self) -> None:
+        self.calls.append(('start_tls_s',))
+
+    def simple_bind_s(self, who: str = '', cred: str = '') -> None:
+        self.calls.append(('simple_bind_s', who))
+        if self.directory.passwords.get(who) != cred:
+            self.bound_dn = None
+            raise ldap.INVALID_CREDENTIALS()
+        self.bound_dn = who
+
+    def find(self, base: str, scope: int, filterstr: str) -> List[tuple]:
+        results = []
+        for dn, attrs in self.directory.entries.items():
+            if not dn.endswith(base) or (scope == ldap.SCOPE_BASE and dn != base):
+                continue
+            conditions = re.findall(r'\(([A-Za-z]+)=([^()]*)\)', filterstr)
+            if all(value == '*' or value.encode() in attrs.get(attr, []) for attr, value in conditions):
+                results.append((dn, dict(attrs)))
+        return results
+
+    def search_s(self, base: str, scope: int, filterstr: str = '(objectClass=*)',
+                 attrlist: Optional[List[str]] = None) -> List[tuple]:
+        self.calls.append(('search_s', base))
+        return self.find(base, scope, filterstr)
+
+    def search_ext(self, base: str, scope: int, filterstr: str = '(objectClass=*)',
+                   attrlist: Optional[List[str]] = None, serverctrls: Optional[list] = None) -> int:
+        """
+        Постраничный поиск: cookie страницы - смещение следующей записи результата
+        """
+        self.calls.append(('search_ext', base))
+        control = next(c for c in serverctrls or [] if c.controlType == SimplePagedResultsControl.controlType)
+        results = self.find(base, scope, filterstr)
+        offset = int(control.cookie or 0)
+        next_offset = offset + control.size
+        cookie = str(next_offset).encode() if next_offset < len(results) else b''
+        self.pages.append((results[offset:next_offset], [SimplePagedResultsControl(True, control.size, cookie)]))
+        return len(self.pages)
+
+    def result3(self, msgid: int) -> tuple:
+        results, controls = self.pages[msgid - 1]
+        return ldap.RES_SEARCH_RESULT, results, msgid, controls
+
+    def compare_s(self, dn: str, attr: str, value: bytes) -> bool:
+        self.calls.append(('compare_s', dn))
+        return value in self.directory.entries.get(dn, {}).get(attr, [])
+
+    def unbind_s(self) -> None:
+        self.calls.append(('unbind_s',))
+
+
+class LDAPConnectionPoolTest(TestCase):
+
+    def setUp(self) -> None:
+        self.directory = FakeDirectory()
+        self.user_dn = self.directory.add_user('alice', 'secret')
+        self.pool = LDAPConnectionPool(ldap, size=2, idle_timeout=60, service_bind_dn=SERVICE_DN)
+        connect = mock.patch.object(self.pool, 'connect',
+                                    side_effect=lambda uri, **kwargs: FakeLDAPObject(self.directory, uri))
+        connect.start()
+        self.addCleanup(connect.stop)
+
+    def lease(self) -> LDAPConnectionLease:
+        return LDAPConnectionLease(self.pool, 'ldap://test')
+
+    def test_connection_reused_between_sessions(self):
+        for _ in range(3):
+            with self.pool.session():
+                lease = self.lease()
+                lease.simple_bind_s(SERVICE_DN, 'adminpassword')
+                lease.search_s(USERS_DN, ldap.SCOPE_SUBTREE, '(uid=alice)')
+        self.assertEqual(len(self.directory.connections), 1)
+        # Служебная учетная запись привязывается к соединению из пула однократно
+        self.assertEqual(self.directory.count('simple_bind_s'), 1)
+
+    def test_user_bind_always_checked(self):
+        for _ in range(2):
+            with self.pool.session():
+                self.lease().simple_bind_s(self.user_dn, 'secret')
+        self.assertEqual(len(self.directory.connections), 1)
+        self.assertEqual(self.directory.count('simple_bind_s'), 2)
+
+        # Смена пароля на сервере вступает в силу, хотя соединение осталось привязанным со старым паролем
+        self.directory.passwords[self.user_dn] = 'changed'
+        with self.pool.session():
+            with self.assertRaises(ldap.INVALID_CREDENTIALS):
+                self.lease().simple_bind_s(self.user_dn, 'secret')
+
+    def test_service_bind_repeated_after_user_bind(self):
+        with self.pool.session():
+            lease = self.lease()
+            lease.simple_bind_s(SERVICE_DN, 'adminpassword')
+            lease.simple_bind_s(self.user_dn, 'secret')
+            lease.simple_bind_s(SERVICE_DN, 'adminpassword')
+        connection_calls = [call for call in self.directory.connections[0].calls if call[0] == 'simple_bind_s']
+        self.assertEqual(connection_calls, [('simple_bind_s', SERVICE_DN), ('simple_bind_s', self.user_dn),
+                                            ('simple_bind_s', SERVICE_DN)])
+
+    def test_idle_connections_evicted(self):
+        with mock.patch('math_server.ldap_pool.time.monotonic', return_value=1000.0):
+            with self.pool.session():
+                self.lease().simple_bind_s(SERVICE_DN, 'adminpassword')
+        with mock.patch('math_server.ldap_pool.time.monotonic', return_value=1061.0):
+            with self.pool.session():
+                self.lease().simple_bind_s(SERVICE_DN, 'adminpassword')
+
+        first, second = self.directory.connections
+        self.assertIn(('unbind_s',), first.calls)
+        self.assertNotIn(('unbind_s',), second.calls)
+
+    def test_idle_connections_limited_by_size(self):
+        with self.pool.session():
+            leases = [self.lease() for _ in range(3)]
+            for lease in leases:
+                lease.simple_bind_s(SERVICE_DN, 'adminpassword')
+        self.assertEqual(len(self.directory.connections), 3)
+        self.assertEqual(sum(('unbind_s',) in c.calls for c in self.directory.connections), 1)
+
+    def test_state_reapplied_on_checkout(self):
+        with self.pool.session():
+            lease = self.lease()
+            lease.set_option(ldap.OPT_REFERRALS, 0)
+            lease.start_tls_s()
+            lease.simple_bind_s(SERVICE_DN, 'adminpassword')
+
+        # Свободное соединение занято другим сеансом, поэтому lease получает новое соединение
+        with self.pool.session():
+            other = self.lease()
+            other.simple_bind_s(SERVICE_DN, 'adminpassword')
+            lease.search_s(USERS_DN, ldap.SCOPE_SUBTREE, '(uid=alice)')
+
+        first, second = self.directory.connections
+        self.assertEqual(second.options, {ldap.OPT_REFERRALS: 0})
+        self.assertEqual([call[0] for call in second.calls],
+                         ['set_option', 'start_tls_s', 'simple_bind_s', 'search_s'])
+        self.assertEqual(second.bound_dn, SERVICE_DN)
+
+    def test_tls_not_restarted_on_pooled_connection(self):
+        for _ in range(2):
+            with self.pool.session():
+                lease = self.lease()
+                lease.start_tls_s()
+                lease.simple_bind_s(SERVICE_DN, 'adminpassword')
+        self.assertEqual(self.directory.count('start_tls_s'), 1)
+
+
+LDAP_BACKEND_SETTINGS = dict(
+    AUTHENTICATION_BACKENDS=['math_server.auth_backend.CustomLDAPBackend'],
+    AUTH_LDAP_SERVER_URI='ldap://test',
+    AUTH_LDAP_BIND_DN=SERVICE_DN,
+    AUTH_LDAP_BIND_PASSWORD='adminpassword',
+    AUTH_LDAP_USER_SEARCH=LDAPSearch(USERS_DN, ldap.SCOPE_SUBTREE, '(uid=%(user)s)'),
+    AUTH_LDAP_GROUP_SEARCH=LDAPSearch(GROUPS_DN, ldap.SCOPE_SUBTREE, '(objectClass=groupOfNames)'),
+    AUTH_LDAP_GROUP_TYPE=CachedGroupOfNamesType(name_attr='cn'),
+    AUTH_LDAP_USER_FLAGS_BY_GROUP={'is_active': f'cn=is_active,{GROUPS_DN}',
+                                   'is_staff': f'cn=is_staff,{GROUPS_DN}'},
+    AUTH_LDAP_MIRROR_GROUPS=None,
+    AUTH_LDAP_MIRROR_GROUPS_EXCEPT=['is_active', 'is_staff'],
+    AUTH_LDAP_FIND_GROUP_PERMS=True,
+    AUTH_LDAP_CACHE_TIMEOUT=300,
+)
+
+
+class LDAPBackendTestCase(TestCase):
+    """
+    Соединения пула бэкенда устанавливаются с каталогом FakeDirectory
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.directory = FakeDirectory()
+        pool = LDAPConnectionPool(ldap, size=10, idle_timeout=60, service_bind_dn=SERVICE_DN)
+        for patcher in (mock.patch('math_server.auth_backend._connection_pool', pool),
+                        mock.patch.object(pool, 'connect',
+                                          side_effect=lambda uri, **kwargs: FakeLDAPObject(self.directory, uri))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+@override_settings(**LDAP_BACKEND_SETTINGS)
+class CustomLDAPBackendTest(LDAPBackendTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.user_dn = self.directory.add_user('alice', 'secret')
+        self.directory.set_group('is_active', [self.user_dn])
+        self.directory.set_group('operators', [self.user_dn])
+        self.directory.set_group('engineers', [])
+
+    def count_group_searches(self) -> int:
+        return sum(1 for c in self.directory.connections for call in c.calls
+                   if call[0] == 'search_s' and call[1] == GROUPS_DN)
+
+    def test_groups_cached_between_logins(self):
+        user = authenticate(username='alice', password='secret')
+        self.assertTrue(user.is_active)
+        self.assertFalse(user.is_staff)
+        self.assertEqual(self.count_group_searches(), 1)
+
+        authenticate(username='alice', password='secret')
+        self.assertEqual(self.count_group_searches(), 1)
+        # Флаги пользователя определяются по списку групп, а не отдельными запросами compare
+        self.assertEqual(self.directory.count('compare_s'), 0)
+        self.assertEqual(len(self.directory.connections), 1)
+
+    def test_wrong_password_rejected_on_pooled_connection(self):
+        self.assertIsNotNone(authenticate(username='alice', password='secret'))
+        self.directory.passwords[self.user_dn] = 'changed'
+        self.assertIsNone(authenticate(username='alice', password='secret'))
+        self.assertIsNotNone(authenticate(username='alice', password='changed'))
+
+    def test_mirroring_writes_only_membership_changes(self):
+        user = authenticate(username='alice', password='secret')
+        self.assertEqual(set(user.groups.values_list('name', flat=True)), {'operators'})
+
+        with CaptureQueriesContext(connection) as queries:
+            authenticate(username='alice', password='secret')
+        membership_writes = [q['sql'] for q in queries.captured_queries
+                             if 'auth_user_groups' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(membership_writes, [])
+
+        self.directory.set_group('engineers', [self.user_dn])
+        cache.clear()
+        user = authenticate(username='alice', password='secret')
+        self.assertEqual(set(user.groups.values_list('name', flat=True)), {'operators', 'engineers'})
+        self.assertEqual(Group.objects.filter(name__in=['is_active', 'is_staff']).count(), 0)
+        self.assertEqual(get_user_model().objects.filter(username='alice').count(), 1)
+
+
+@override_settings(AUTH_LDAP_USER_ATTR_MAP={'first_name': 'givenName', 'last_name': 'sn', 'email': 'mail'},
+                   **LDAP_BACKEND_SETTINGS)
+class LDAPDirectorySyncTest(LDAPBackendTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.user_dns = {uid: self.directory.add_user(uid, 'secret') for uid in ('alice', 'bob', 'carol')}
+        self.directory.set_group('is_active', list(self.user_dns.values()))
+        self.directory.set_group('operators', [self.user_dns['alice'], self.user_dns['bob']])
+        self.directory.set_group('engineers', [self.user_dns['carol']])
+
+        user_model = get_user_model()
+        # Созданные из LDAP пользователи не имеют пароля в базе данных: bob совпадает с каталогом,
+        # у carol изменилась почта, dave удален из каталога; admin создан локально
+        user_model.objects.create_user('bob', 'bob@example.org', first_name='Bob', last_name='Test')
+        user_model.objects.create_user('carol', 'old@example.org', first_name='Carol', last_name='Test')
+        user_model.objects.create_user('dave')
+        user_model.objects.create_superuser('admin', 'admin@example.org', 'password')
+
+    def sync(self, dry_run: bool = False, deactivate_missing: bool = False):
+        return LDAPDirectorySync(page_size=2).run(dry_run, deactivate_missing)
+
+    def group_names(self, username: str) -> set:
+        return set(Group.objects.filter(user__username=username).values_list('name', flat=True))
+
+    def test_paged_search(self):
+        self.sync()
+        searches = [call[1] for c in self.directory.connections for call in c.calls if call[0] == 'search_ext']
+        # Три пользователя и три группы загружаются страницами по две записи
+        self.assertEqual(searches, [USERS_DN, USERS_DN, GROUPS_DN, GROUPS_DN])
+        self.assertEqual(get_user_model().objects.filter(username='alice').count(), 1)
+
+    def test_report(self):
+        report = self.sync(deactivate_missing=True)
+
+        self.assertEqual(report.users_created, ['alice'])
+        self.assertEqual(report.users_updated, {'carol': ['email']})
+        self.assertEqual(report.users_unchanged, 1)
+        self.assertEqual(report.users_missing, ['dave'])
+        self.assertEqual(report.users_deactivated, ['dave'])
+        self.assertEqual(sorted(report.groups_created), ['engineers', 'operators'])
+        self.assertEqual((report.memberships_added, report.memberships_removed), (3, 0))
+
+        user_model = get_user_model()
+        alice = user_model.objects.get(username='alice')
+        self.assertEqual((alice.first_name, alice.email, alice.is_active), ('Alice', 'alice@example.org', True))
+        self.assertFalse(alice.has_usable_password())
+        self.assertEqual(user_model.objects.get(username='carol').email, 'carol@example.org')
+        self.assertFalse(user_model.objects.get(username='dave').is_active)
+        self.assertTrue(user_model.objects.get(username='admin').is_active)
+        self.assertEqual(self.group_names('alice'), {'operators'})
+        self.assertEqual(self.group_names('carol'), {'engineers'})
+
+    def test_dry_run_rolled_back(self):
+        output = StringIO()
+        call_command('sync_ldap_directory', '--dry-run', '--deactivate-missing', '--page-size=2', stdout=output)
+
+        self.assertIn('без записи в базу данных', output.getvalue())
+        self.assertIn('создано 1, изменено 1, без изменений 1', output.getvalue())
+        user_model = get_user_model()
+        self.assertFalse(user_model.objects.filter(username='alice').exists())
+        self.assertEqual(user_model.objects.get(username='carol').email, 'old@example.org')
+        self.assertTrue(user_model.objects.get(username='dave').is_active)
+        self.assertFalse(Group.objects.exists())
+
+    def test_only_changed_memberships_written(self):
+        self.sync()
+        with CaptureQueriesContext(connection) as queries:
+            report = self.sync()
+        writes = [q['sql'] for q in queries.captured_queries
+                  if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, [])
+        self.assertEqual((report.users_unchanged, report.memberships_added, report.memberships_removed), (3, 0, 0))
+
+        # Локальная группа пользователя не зеркалируется и сохраняется
+        local_group = Group.objects.create(name='is_staff')
+        get_user_model().objects.get(username='bob').groups.add(local_group)
+        self.directory.set_group('operators', [self.user_dns['alice'], self.user_dns['carol']])
+        with CaptureQueriesContext(connection) as queries:
+            report = self.sync()
+        membership_writes = [q['sql'].split()[0] for q in queries.captured_queries
+                             if 'auth_user_groups' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(membership_writes, ['DELETE', 'INSERT'])
+        self.assertEqual((report.memberships_added, report.memberships_removed), (1, 1))
+        self.assertEqual(self.group_names('bob'), {'is_staff'})
+        self.assertEqual(self.group_names('carol'), {'engineers', 'operators'})